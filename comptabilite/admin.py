@@ -1,87 +1,314 @@
-from django.contrib import admin
-from django.core.exceptions import ValidationError
+import decimal
+import tempfile
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied, ValidationError
 from django.db import transaction
-from .models import Compte, ExerciceComptable, SoldeExerciceCompte, EcritureComptable, Transaction, Abonnement, Fournisseur
+from django.db.models import Case, DecimalField, F, FilteredRelation, Q, Value, When
+from django.db.models.functions import Coalesce
+from django.forms.models import BaseInlineFormSet
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.urls import path, reverse
+from django.utils.dateparse import parse_date
+from django.utils.html import format_html
+from .models import Compte, ExerciceComptable, SoldeExerciceCompte, SoldeLot, EcritureComptable, Transaction, Abonnement, EcheanceAbonnement, Fournisseur, Tache
 
 from import_export.admin import ImportExportModelAdmin
+from .grand_livre import ecrire_xlsx, flux_csv, lignes_grand_livre
+from .pagination import EstimatedCountPaginator
 from .resources import CompteResource
+from .soldes import session_saisie
+from .taches import planifier_cloture, relancer
+
+# SQLite ne conserve pas l'échelle des décimaux calculés (Coalesce, Case)
+CENTIMES = decimal.Decimal('0.01')
 
 # Enregistrement des modèles
 class SoldeExerciceCompteAdmin(admin.ModelAdmin):
-    list_display = ('compte', 'exercice', 'solde_initial', 'solde_actuel')
+    list_display = ('compte', 'exercice', 'solde_initial', 'total_debit', 'total_credit', 'solde_actuel')
 
 admin.site.register(SoldeExerciceCompte,SoldeExerciceCompteAdmin)
 
+class SoldeLotAdmin(admin.ModelAdmin):
+    list_display = ('lot', 'compte', 'total_debit', 'total_credit', 'solde')
+    list_select_related = ('lot', 'compte')
+    list_filter = ('compte',)
+
+admin.site.register(SoldeLot, SoldeLotAdmin)
+
+class SoldeActuelFilter(admin.SimpleListFilter):
+    title = 'Solde actuel'
+    parameter_name = 'solde'
+
+    def lookups(self, request, model_admin):
+        return (
+            ('debiteur', 'Débiteur'),
+            ('crediteur', 'Créditeur'),
+            ('nul', 'Soldé'),
+        )
+
+    def queryset(self, request, queryset):
+        # Filtre sur l'annotation posée par CompteAdmin.get_queryset (même requête)
+        if self.value() == 'debiteur':
+            return queryset.filter(solde_actuel_exercice__gt=0)
+        if self.value() == 'crediteur':
+            return queryset.filter(solde_actuel_exercice__lt=0)
+        if self.value() == 'nul':
+            return queryset.filter(solde_actuel_exercice=0)
+        return queryset
+
 @admin.register(Compte)
 class CompteAdmin(ImportExportModelAdmin):
     resource_class = CompteResource
     list_display = ('compte', 'libelle', 'solde_initial_display', 'solde_actuel_display')
+    list_filter = ('type_compte', SoldeActuelFilter)
+
+    def get_queryset(self, request):
+        # L'exercice actuel est lu une seule fois par requête HTTP, et les
+        # soldes sont joints (sans création) depuis SoldeExerciceCompte
+        if not hasattr(request, '_exercice_actuel'):
+            request._exercice_actuel = ExerciceComptable.get_exercice_actuel()
+        montant = DecimalField(max_digits=12, decimal_places=2)
+        return super().get_queryset(request).annotate(
+            solde_exercice_actuel=FilteredRelation(
+                'soldes_exercice',
+                condition=Q(soldes_exercice__exercice=request._exercice_actuel)
+            )
+        ).annotate(
+            solde_initial_exercice=Coalesce(
+                'solde_exercice_actuel__solde_initial', Value(0), output_field=montant
+            ),
+            solde_actuel_exercice=Coalesce(
+                'solde_exercice_actuel__solde_actuel', Value(0), output_field=montant
+            ),
+        )
 
     def solde_initial_display(self, obj):
-        exercice = ExerciceComptable.get_exercice_actuel()
-        return obj.get_solde_initial(exercice)
+        return obj.solde_initial_exercice.quantize(CENTIMES)
     solde_initial_display.short_description = 'Solde Initial'
+    solde_initial_display.admin_order_field = 'solde_initial_exercice'
 
     def solde_actuel_display(self, obj):
-        exercice = ExerciceComptable.get_exercice_actuel()
-        return obj.get_solde_actuel(exercice)
+        return obj.solde_actuel_exercice.quantize(CENTIMES)
     solde_actuel_display.short_description = 'Solde Actuel'
+    solde_actuel_display.admin_order_field = 'solde_actuel_exercice'
 
 class EcritureComptableAdmin(admin.ModelAdmin):
     list_display = ('compte', 'debit', 'credit', 'date_operation')
+    list_select_related = ('compte', 'transaction')
+    # Tri sur la clé primaire : pas de jointure, et pagination par curseur possible
+    ordering = ('-id',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    # Paramètre de pagination par curseur : ID de la dernière écriture affichée
+    parametre_curseur = 'apres'
+
+    def get_queryset(self, request):
+        montant = DecimalField(max_digits=12, decimal_places=2)
+        queryset = super().get_queryset(request).annotate(
+            montant_debit=Case(When(type_ecriture='DB', then=F('montant')), default=Value(0), output_field=montant),
+            montant_credit=Case(When(type_ecriture='CR', then=F('montant')), default=Value(0), output_field=montant),
+        )
+        curseur = getattr(request, '_curseur_ecritures', None)
+        if curseur:
+            queryset = queryset.filter(id__lt=curseur)
+        return queryset
+
+    def changelist_view(self, request, extra_context=None):
+        # Le curseur n'est pas un filtre du modèle : il est retiré avant la ChangeList
+        request._curseur_ecritures = None
+        if self.parametre_curseur in request.GET:
+            parametres = request.GET.copy()
+            try:
+                request._curseur_ecritures = int(parametres.pop(self.parametre_curseur)[0])
+            except ValueError:
+                pass
+            request.GET = parametres
+
+        response = super().changelist_view(request, extra_context)
+        cl = getattr(response, 'context_data', None) and response.context_data.get('cl')
+        if not cl or 'o' in request.GET or 'p' in request.GET:
+            # Tri personnalisé ou numéro de page explicite : pagination classique
+            return response
+
+        resultats = list(cl.result_list)
+        parametres = request.GET.copy()
+        response.context_data['pagination_curseur'] = True
+        response.context_data['premiere_page'] = (
+            parametres.urlencode() if request._curseur_ecritures else None
+        )
+        if len(resultats) == cl.list_per_page:
+            parametres[self.parametre_curseur] = resultats[-1].pk
+            response.context_data['page_suivante'] = parametres.urlencode()
+        return response
+
+    def get_urls(self):
+        return [
+            path(
+                'grand-livre/',
+                self.admin_site.admin_view(self.grand_livre_view),
+                name='comptabilite_ecriturecomptable_grand_livre'
+            ),
+        ] + super().get_urls()
+
+    def grand_livre_view(self, request):
+        """Export en flux du grand livre : ?exercice=&compte=&du=&au=&format=csv|xlsx"""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+
+        if request.GET.get('exercice'):
+            exercice = ExerciceComptable.objects.filter(pk=request.GET['exercice']).first()
+        else:
+            exercice = ExerciceComptable.get_exercice_actuel()
+        if not exercice:
+            raise Http404("Exercice comptable introuvable")
+
+        comptes = None
+        if request.GET.getlist('compte'):
+            comptes = list(Compte.objects.filter(compte__in=request.GET.getlist('compte')))
+        try:
+            date_debut = parse_date(request.GET.get('du', ''))
+            date_fin = parse_date(request.GET.get('au', ''))
+        except ValueError:
+            date_debut = date_fin = None
+
+        lignes = lignes_grand_livre(exercice, comptes, date_debut, date_fin)
+        nom = f"grand_livre_{exercice.date_debut:%Y%m%d}_{exercice.date_fin:%Y%m%d}"
+        if request.GET.get('format') == 'xlsx':
+            # Le format XLSX est une archive : écrite dans un fichier temporaire puis envoyée par morceaux
+            fichier = tempfile.TemporaryFile()
+            ecrire_xlsx(lignes, fichier)
+            fichier.seek(0)
+            return FileResponse(fichier, as_attachment=True, filename=f"{nom}.xlsx")
+
+        response = StreamingHttpResponse(flux_csv(lignes), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{nom}.csv"'
+        return response
 
     def debit(self, obj):
-        return obj.montant if obj.type_ecriture == 'DB' else 0.0
+        return obj.montant_debit.quantize(CENTIMES)
+    debit.admin_order_field = 'montant_debit'
 
     def credit(self, obj):
-        return obj.montant if obj.type_ecriture == 'CR' else 0.0
+        return obj.montant_credit.quantize(CENTIMES)
+    credit.admin_order_field = 'montant_credit'
 
     def date_operation(self, obj):
         return obj.transaction.date_operation
+    date_operation.admin_order_field = 'transaction__date_operation'
 
 admin.site.register(EcritureComptable, EcritureComptableAdmin)
 
+class EcritureComptableInlineFormSet(BaseInlineFormSet):
+    def clean(self):
+        super().clean()
+        if any(self.errors):
+            return
+        # Équilibre contrôlé sur les lignes saisies : une saisie déséquilibrée
+        # est refusée sans aucune écriture en base ni recalcul de solde
+        Transaction.verifier_lignes(
+            (form.cleaned_data['type_ecriture'], form.cleaned_data['montant'])
+            for form in self.forms
+            if form.cleaned_data and not self._should_delete_form(form)
+        )
+
 # Inline pour les écritures comptables
 class EcritureComptableInline(admin.TabularInline):
     model = EcritureComptable
+    formset = EcritureComptableInlineFormSet
     extra = 2  # Nombre de formulaires vierges à afficher
 
 # Configuration de l'admin pour Transaction
 class TransactionAdmin(admin.ModelAdmin):
     inlines = [EcritureComptableInline]
 
-    def save_model(self, request, obj, form, change):
-        # Appeler la validation avant de sauvegarder l'objet principal
-        obj.clean()  # Pour vérifier l’équilibre si des changements sont apportés
-        super().save_model(request, obj, form, change)
-
     def save_related(self, request, form, formsets, change):
-        # Enregistrer les écritures dans une transaction atomique
-        with transaction.atomic():
+        # Enregistrer les écritures dans une transaction atomique, avec un seul
+        # recalcul des soldes pour l'ensemble des lignes ; l'équilibre est déjà
+        # contrôlé sur les lignes saisies (EcritureComptableInlineFormSet)
+        with transaction.atomic(), session_saisie():
             super().save_related(request, form, formsets, change)
 
-            # Valider l'équilibre des écritures associées
-            total_debit = sum(e.montant for e in form.instance.ecritures.all() if e.type_ecriture == 'DB')
-            total_credit = sum(e.montant for e in form.instance.ecritures.all() if e.type_ecriture == 'CR')
-
-            if total_debit != total_credit:
-                raise ValidationError("Les écritures comptables doivent être équilibrées (Total débit = Total crédit).")
-
 # Enregistrement de TransactionAdmin pour Transaction
 admin.site.register(Transaction, TransactionAdmin)
 
 # Configuration de l'admin pour ExerciceComptable
 class ExerciceComptableAdmin(admin.ModelAdmin):
-    list_display = ('date_debut', 'date_fin', 'est_ouvert', 'est_actuel')
-    actions = ['close_exercice']
+    list_display = ('date_debut', 'date_fin', 'est_ouvert', 'en_cloture', 'est_actuel')
+    actions = ['close_exercice', 'rouvrir', 'recloturer']
 
     def close_exercice(self, request, queryset):
-        for exercice in queryset.all():
-            exercice.close_exercice()
-        self.message_user(request, "Les exercices sélectionnés ont été clôturés.")
+        # La clôture s'exécute en tâche de fond (commande travailleur), hors de la requête
+        for exercice in queryset:
+            try:
+                tache = planifier_cloture(exercice)
+            except ValidationError as exc:
+                self.message_user(request, exc.message, messages.WARNING)
+                continue
+            lien = reverse('admin:comptabilite_tache_change', args=[tache.pk])
+            suivant = exercice.exercices_suivants().first()
+            report = (
+                f"écarts de report propagés à l'exercice existant {suivant.date_debut:%Y}" if suivant
+                else "création de l'exercice suivant"
+            )
+            self.message_user(request, format_html(
+                'Clôture de {} planifiée ({}) : <a href="{}">suivre son avancement</a>.', exercice, report, lien
+            ))
     close_exercice.short_description = "Clôturer les exercices sélectionnés"
 
+    def rouvrir(self, request, queryset):
+        for exercice in queryset:
+            try:
+                exercice.rouvrir()
+            except ValidationError as exc:
+                self.message_user(request, exc.message, messages.WARNING)
+                continue
+            self.message_user(request, f"{exercice} rouvert : passer les ajustements puis le reclôturer.")
+    rouvrir.short_description = "Rouvrir les exercices sélectionnés (ajustements)"
+
+    def recloturer(self, request, queryset):
+        # Ajustements traités du plus ancien au plus récent : chaque report part de soldes à jour
+        for exercice in queryset.order_by('date_debut'):
+            try:
+                ecarts = exercice.recloturer()
+            except ValidationError as exc:
+                self.message_user(request, exc.message, messages.WARNING)
+                continue
+            self.message_user(request, f"{exercice} reclôturé : {len(ecarts)} compte(s) reporté(s) sur les exercices suivants.")
+    recloturer.short_description = "Reclôturer les exercices rouverts"
+
 # Enregistrement de ExerciceComptableAdmin pour ExerciceComptable
 admin.site.register(ExerciceComptable, ExerciceComptableAdmin)
 admin.site.register(Abonnement) # abonnement des lots
-admin.site.register(Fournisseur)
\ No newline at end of file
+
+class EcheanceAbonnementAdmin(admin.ModelAdmin):
+    list_display = ('abonnement', 'prochaine_echeance', 'derniere_periode')
+    list_select_related = ('abonnement__lot',)
+
+admin.site.register(EcheanceAbonnement, EcheanceAbonnementAdmin)
+admin.site.register(Fournisseur)
+
+class TacheAdmin(admin.ModelAdmin):
+    list_display = ('id', 'libelle', 'statut', 'avancement', 'phase', 'tentatives', 'date_creation', 'date_activite')
+    list_filter = ('statut', 'type')
+    readonly_fields = (
+        'type', 'libelle', 'statut', 'avancement', 'phase', 'erreur', 'tentatives', 'travailleur',
+        'date_creation', 'date_debut', 'date_fin', 'date_activite', 'parametres', 'etat'
+    )
+    exclude = ('etape', 'etapes')
+    actions = ['relancer']
+
+    def has_add_permission(self, request):
+        return False
+
+    def avancement(self, obj):
+        return format_html(
+            '<progress value="{}" max="100"></progress> {}/{} phases', obj.progression, obj.etape, obj.etapes
+        )
+
+    def relancer(self, request, queryset):
+        relancees = sum(relancer(tache) for tache in queryset)
+        self.message_user(request, f"{relancees} tâche(s) en échec remise(s) en attente.")
+    relancer.short_description = "Relancer les tâches en échec (reprise à la phase en erreur)"
+
+admin.site.register(Tache, TacheAdmin)
\ No newline at end of file
@@ -0,0 +1,206 @@
+# comptabilite/api.py
+"""
+API REST en lecture seule (synchronisation des intégrations).
+
+Les listes sont paginées par curseur sur l'ID (pas de COUNT, pages stables
+pendant les insertions) ; `?apres=<id>` reprend une synchronisation
+incrémentale après le dernier ID reçu. `?fields=a,b` restreint les champs
+renvoyés. Chaque réponse porte un ETag calculé sur son contenu : une
+requête avec If-None-Match identique reçoit un 304 sans corps.
+
+`ModificationsView` sert le journal des modifications (`?since=<curseur>`)
+pour une synchronisation au fil de l'eau, voir comptabilite/modifications.py.
+
+Seule écriture possible : la saisie en masse de transactions équilibrées
+(`SaisieTransactionsView`, voir comptabilite/saisie.py).
+"""
+import hashlib
+import json
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.utils.http import parse_etags
+from rest_framework import permissions, status, viewsets
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .modifications import modifications_depuis
+from .saisie import saisir_transactions
+from .models import Abonnement, Compte, EcritureComptable, Modification, SoldeExerciceCompte, Transaction
+from .serializers import (
+    AbonnementSerializer, CompteSerializer, EcritureComptableSerializer, ModificationSerializer,
+    SoldeExerciceCompteSerializer, TransactionSerializer, champs_demandes
+)
+
+
+# Nombre maximal de transactions par requête de saisie
+TAILLE_MAX_SAISIE = 10000
+
+# Modifications renvoyées par défaut / au plus par requête du flux
+TAILLE_MODIFICATIONS = 1000
+TAILLE_MAX_MODIFICATIONS = 10000
+
+
+class CurseurPagination(CursorPagination):
+    ordering = 'id'
+    page_size = 100
+    page_size_query_param = 'taille'
+    max_page_size = 1000
+
+
+class LectureSeuleViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Base des points d'accès : pagination par curseur, filtres simples
+    déclarés dans `filtres` (paramètre -> lookup), reprise par `apres` et
+    requêtes conditionnelles (ETag / If-None-Match).
+    """
+    pagination_class = CurseurPagination
+    permission_classes = [permissions.IsAdminUser]
+    filtres = {}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action != 'list':
+            return queryset
+
+        parametres = self.request.query_params
+        for parametre, lookup in self.filtres.items():
+            if parametre in parametres:
+                # Booléens à la JSON (true / false) acceptés en plus de la forme Django
+                valeur = {'true': True, 'false': False}.get(parametres[parametre], parametres[parametre])
+                try:
+                    queryset = queryset.filter(**{lookup: valeur})
+                except (DjangoValidationError, ValueError):
+                    raise ValidationError({parametre: "Valeur invalide."})
+        if parametres.get('apres', '').isdigit():
+            queryset = queryset.filter(id__gt=parametres['apres'])
+        return queryset
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method != 'GET' or response.status_code != status.HTTP_200_OK:
+            return response
+
+        contenu = json.dumps(response.data, sort_keys=True, default=str).encode()
+        etag = f'W/"{hashlib.sha1(contenu).hexdigest()}"'
+        # Comparaison faible, étiquette par étiquette (RFC 9110 13.1.2)
+        connues = {etiquette.removeprefix('W/') for etiquette in parse_etags(request.headers.get('If-None-Match', ''))}
+        if '*' in connues or etag.removeprefix('W/') in connues:
+            response = super().finalize_response(
+                request, Response(status=status.HTTP_304_NOT_MODIFIED), *args, **kwargs
+            )
+        response['ETag'] = etag
+        return response
+
+
+class CompteViewSet(LectureSeuleViewSet):
+    queryset = Compte.objects.all()
+    serializer_class = CompteSerializer
+    filtres = {'type_compte': 'type_compte', 'compte': 'compte'}
+
+
+class TransactionViewSet(LectureSeuleViewSet):
+    queryset = Transaction.objects.prefetch_related('ecritures')
+    serializer_class = TransactionSerializer
+    filtres = {
+        'exercice': 'exercice_id',
+        'du': 'date_operation__gte',
+        'au': 'date_operation__lte',
+    }
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        champs = champs_demandes(self.request)
+        if champs and 'ecritures' not in champs:
+            # Détail des écritures non demandé : pas de seconde requête
+            queryset = queryset.prefetch_related(None)
+        return queryset
+
+
+class EcritureComptableViewSet(LectureSeuleViewSet):
+    queryset = EcritureComptable.objects.select_related('compte', 'transaction')
+    serializer_class = EcritureComptableSerializer
+    filtres = {
+        'exercice': 'exercice_id',
+        'compte': 'compte__compte',
+        'lot': 'lot_id',
+        'transaction': 'transaction_id',
+    }
+
+
+class SoldeExerciceCompteViewSet(LectureSeuleViewSet):
+    queryset = SoldeExerciceCompte.objects.select_related('compte')
+    serializer_class = SoldeExerciceCompteSerializer
+    filtres = {'exercice': 'exercice_id', 'compte': 'compte__compte'}
+
+
+class AbonnementViewSet(LectureSeuleViewSet):
+    queryset = Abonnement.objects.select_related('lot', 'echeance')
+    serializer_class = AbonnementSerializer
+    filtres = {'lot': 'lot_id', 'actif': 'actif', 'frequence': 'frequence'}
+
+
+class SaisieTransactionsView(APIView):
+    """
+    POST d'un lot de transactions : {"transactions": [...], "tout_ou_rien": false}
+    (ou directement la liste). Réponse : IDs créés et erreurs par index.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        donnees = request.data
+        if isinstance(donnees, list):
+            transactions, tout_ou_rien = donnees, False
+        elif isinstance(donnees, dict):
+            transactions, tout_ou_rien = donnees.get('transactions'), bool(donnees.get('tout_ou_rien'))
+        else:
+            transactions, tout_ou_rien = None, False
+        if not isinstance(transactions, list) or not transactions:
+            return Response({'detail': "Liste de transactions attendue."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(transactions) > TAILLE_MAX_SAISIE:
+            return Response(
+                {'detail': f"{TAILLE_MAX_SAISIE} transactions au plus par requête."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            crees, erreurs = saisir_transactions(transactions, tout_ou_rien=tout_ou_rien)
+        except DjangoValidationError as exc:
+            # Exercice clôturé ou mis en clôture pendant la saisie
+            return Response({'detail': exc.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            {'crees': [transac.pk for transac in crees], 'erreurs': erreurs},
+            status=status.HTTP_201_CREATED if crees else status.HTTP_400_BAD_REQUEST
+        )
+
+
+class ModificationsView(APIView):
+    """
+    GET des modifications postérieures au curseur : ?since=<id>&modele=ecriture,solde&taille=1000.
+    Réponse : modifications dans l'ordre, curseur à renvoyer au prochain appel
+    et `suite` (d'autres modifications attendent déjà).
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        parametres = request.query_params
+        curseur, taille = parametres.get('since', '0'), parametres.get('taille', str(TAILLE_MODIFICATIONS))
+        if not curseur.isdigit():
+            raise ValidationError({'since': "Curseur invalide."})
+        if not taille.isdigit() or not int(taille):
+            raise ValidationError({'taille': "Valeur invalide."})
+        modeles = [m for m in parametres.get('modele', '').split(',') if m]
+        if set(modeles) - {cle for cle, _ in Modification.MODELE_CHOICES}:
+            raise ValidationError({'modele': "Valeur invalide."})
+
+        taille = min(int(taille), TAILLE_MAX_MODIFICATIONS)
+        # Une ligne de plus pour savoir s'il reste des modifications
+        modifications = list(modifications_depuis(int(curseur), modeles, taille + 1))
+        suite = len(modifications) > taille
+        modifications = modifications[:taille]
+        return Response({
+            'modifications': ModificationSerializer(modifications, many=True).data,
+            'curseur': modifications[-1].pk if modifications else int(curseur),
+            'suite': suite,
+        })
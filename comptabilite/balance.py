@@ -0,0 +1,65 @@
+# comptabilite/balance.py
+"""
+Balance générale d'un exercice.
+
+La balance est lue dans la table de synthèse SoldeExerciceCompte, tenue à
+jour à chaque écriture par le moteur de soldes (solde initial, totaux
+débit / crédit, solde actuel) : une seule requête, quel que soit le
+nombre d'écritures. `verifier_balance` la contrôle contre les écritures.
+La balance calculée est conservée dans le cache des rapports (voir
+comptabilite/cache_rapports.py).
+"""
+from .cache_rapports import en_cache
+from .models import SoldeExerciceCompte
+from .soldes import ZERO, verifier_soldes
+
+
+@en_cache('balance_generale')
+def balance_generale(exercice):
+    """
+    Lignes de la balance, par numéro de compte : solde initial, totaux débit
+    et crédit de l'exercice et solde final. Les comptes sans solde initial
+    ni mouvement sur l'exercice n'y figurent pas.
+    """
+    soldes = (
+        SoldeExerciceCompte.objects.filter(exercice=exercice)
+        .select_related('compte')
+        .order_by('compte__compte')
+    )
+    return [
+        {
+            'compte': solde.compte,
+            'solde_initial': solde.solde_initial,
+            'total_debit': solde.total_debit,
+            'total_credit': solde.total_credit,
+            'solde_final': solde.solde_actuel,
+        }
+        for solde in soldes
+    ]
+
+
+def totaux_balance(lignes):
+    """Totaux de colonnes de la balance ; une balance juste a total débit = total crédit"""
+    totaux = {'solde_initial': ZERO, 'total_debit': ZERO, 'total_credit': ZERO, 'solde_final': ZERO}
+    for ligne in lignes:
+        for colonne in totaux:
+            totaux[colonne] += ligne[colonne]
+    return totaux
+
+
+def verifier_balance(exercice):
+    """
+    Contrôle la balance stockée contre les écritures. Retourne la liste des
+    anomalies (libellés) : comptes en écart et déséquilibre débit / crédit.
+    """
+    anomalies = [
+        f"Compte #{compte_id} : stocké {stocke} / calculé {calcule}" if stocke != calcule
+        else f"Compte #{compte_id} : totaux débit / crédit en écart"
+        for compte_id, stocke, calcule in verifier_soldes(exercice)
+    ]
+    totaux = totaux_balance(balance_generale(exercice))
+    if totaux['total_debit'] != totaux['total_credit']:
+        anomalies.append(
+            f"Balance déséquilibrée : débit {totaux['total_debit']} / crédit {totaux['total_credit']}"
+        )
+    return anomalies
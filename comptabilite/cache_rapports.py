@@ -0,0 +1,157 @@
+# comptabilite/cache_rapports.py
+"""
+Cache partagé des rapports calculés : balance générale, résultat net et
+soldes des comptes d'un exercice, soldes des lots. Les rapports sont
+stockés dans le cache Django désigné par COMPTABILITE_CACHE_RAPPORTS
+(alias de CACHES ; None : pas de cache).
+
+Chaque exercice a un numéro de version, stocké dans le même cache et
+intégré à la clé de ses rapports ; les soldes des lots (tous exercices
+confondus) ont la leur, et une version générale couvre tous les rapports
+(plan comptable modifié, base migrée ou vidée). Toute écriture
+passée, modifiée ou supprimée, toute reconstruction ou tout report de
+soldes incrémente la version de l'exercice (`nouvelle_version`) : les
+rapports calculés sur l'ancienne version ne sont plus lus et expirent
+d'eux-mêmes. Un rapport servi depuis le cache n'est donc jamais périmé,
+quel que soit le processus qui l'a calculé, pourvu que le cache soit
+partagé entre les processus (fichiers, Memcached, Redis ; le cache en
+mémoire locale ne convient qu'à un processus unique).
+
+Dans une transaction, les portées périmées sont cumulées et leurs
+versions incrémentées une seule fois, à la validation (rien en cas
+d'annulation) : une écriture de plus ne coûte pas d'accès au cache.
+Jusque-là, les rapports de ces portées lus dans la transaction sont
+calculés sans passer par le cache, pour voir ses propres écritures. Un
+rapport calculé dans une transaction n'est jamais stocké : il peut
+contenir des données non validées.
+"""
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+
+# Portées de version hors exercices
+LOTS = 'lots'
+GENERAL = 'general'
+
+_ABSENT = object()
+
+
+def _cache():
+    alias = getattr(settings, 'COMPTABILITE_CACHE_RAPPORTS', None)
+    return caches[alias] if alias else None
+
+
+def _cle_version(portee):
+    return f'comptabilite:version:{portee}'
+
+
+def _portee_exercice(exercice_id):
+    return f'exercice:{exercice_id}'
+
+
+def _incrementer(portees):
+    cache = _cache()
+    for portee in portees:
+        try:
+            cache.incr(_cle_version(portee))
+        except ValueError:
+            # Version absente (jamais lue, évincée) : une valeur jamais utilisée suffit
+            cache.set(_cle_version(portee), time.time_ns(), None)
+
+
+class _Publication:
+    """Portées dont la version est incrémentée à la validation de la transaction"""
+
+    def __init__(self):
+        self.portees = set()
+
+    def __call__(self):
+        _incrementer(self.portees)
+
+
+def _publication():
+    """Publication en attente dans la transaction en cours (retirée par Django si annulée)"""
+    for _, fonction, *_ in connection.run_on_commit:
+        if isinstance(fonction, _Publication):
+            return fonction
+    return None
+
+
+def versions(portees):
+    """Versions actuelles des portées ; une portée sans version en reçoit une"""
+    cache = _cache()
+    cles = [_cle_version(portee) for portee in portees]
+    valeurs = cache.get_many(cles)
+    for cle in cles:
+        if cle not in valeurs:
+            cache.add(cle, time.time_ns(), None)
+            valeurs[cle] = cache.get(cle)
+    return tuple(valeurs[cle] for cle in cles)
+
+
+def nouvelle_version(exercice_ids=(), lots=False, tout=False):
+    """Périme les rapports des exercices donnés, des lots ou (`tout`) de tous les rapports"""
+    if _cache() is None:
+        return
+    portees = {_portee_exercice(exercice_id) for exercice_id in exercice_ids if exercice_id}
+    if lots:
+        portees.add(LOTS)
+    if tout:
+        portees.add(GENERAL)
+    if not portees:
+        return
+    if not connection.in_atomic_block:
+        _incrementer(portees)
+        return
+    publication = _publication()
+    if publication is None:
+        publication = _Publication()
+        transaction.on_commit(publication)
+    publication.portees |= portees
+
+
+def _argument(valeur):
+    """Valeur d'un argument dans la clé : objets par ID"""
+    if hasattr(valeur, '_meta'):
+        return (valeur._meta.label, valeur.pk)
+    if isinstance(valeur, (list, tuple, set, frozenset)):
+        return tuple(_argument(v) for v in valeur)
+    return valeur
+
+
+def en_cache(nom, portee=None):
+    """
+    Décorateur : le résultat de `fonction(objet, ...)` est mis en cache sous
+    la version de l'exercice `objet` (ou de la portée donnée, ex. LOTS) et
+    la version générale. Les arguments font partie de la clé.
+    """
+    def decorateur(fonction):
+        @functools.wraps(fonction)
+        def enveloppe(objet, *args, **kwargs):
+            cache = _cache()
+            if cache is None:
+                return fonction(objet, *args, **kwargs)
+            portees = [portee or _portee_exercice(objet.pk), GENERAL]
+            if connection.in_atomic_block:
+                publication = _publication()
+                if publication and publication.portees.intersection(portees):
+                    # Portée périmée par la transaction en cours, version pas encore incrémentée
+                    return fonction(objet, *args, **kwargs)
+
+            # Version lue avant le calcul : un calcul concurrent d'une écriture est stocké sous l'ancienne
+            version = versions(portees)
+            arguments = repr((_argument(objet), _argument(args), _argument(sorted(kwargs.items()))))
+            cle = f'comptabilite:rapport:{nom}:{hashlib.md5(repr((version, arguments)).encode()).hexdigest()}'
+
+            resultat = cache.get(cle, _ABSENT)
+            if resultat is _ABSENT:
+                resultat = fonction(objet, *args, **kwargs)
+                if not connection.in_atomic_block:
+                    cache.set(cle, resultat)
+            return resultat
+        return enveloppe
+    return decorateur
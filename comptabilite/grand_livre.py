@@ -0,0 +1,120 @@
+# comptabilite/grand_livre.py
+"""
+Grand livre d'un exercice, produit en flux.
+
+Les écritures sont parcourues par compte puis par date avec
+`.iterator(chunk_size)` (curseur côté serveur sur PostgreSQL) : seules les
+valeurs utiles sont lues et aucune liste complète n'est construite. Le
+solde progressif de chaque compte est calculé au fil de l'eau, à partir
+du solde d'ouverture à la date de début. Les lignes sont écrites au fur
+et à mesure en CSV ou en XLSX (classeur openpyxl en écriture seule).
+"""
+import csv
+import decimal
+
+from .models import EcritureComptable, SoldeExerciceCompte
+from .soldes import ZERO, totaux_par_compte
+
+ENTETE = ['Compte', 'Intitulé', 'Date', 'Libellé', 'Lot', 'Débit', 'Crédit', 'Solde']
+
+CENTIMES = decimal.Decimal('0.01')
+
+# Nombre d'écritures lues par aller-retour avec la base
+TAILLE_PAQUET = 2000
+
+
+def soldes_ouverture(exercice, comptes=None, date_debut=None):
+    """Solde de chaque compte au début de la période : solde initial + mouvements antérieurs à date_debut"""
+    soldes = SoldeExerciceCompte.objects.filter(exercice=exercice)
+    if comptes is not None:
+        soldes = soldes.filter(compte__in=comptes)
+    ouverture = dict(soldes.values_list('compte_id', 'solde_initial'))
+
+    if date_debut:
+        anterieures = EcritureComptable.objects.filter(
+            exercice=exercice, transaction__date_operation__lt=date_debut
+        )
+        if comptes is not None:
+            anterieures = anterieures.filter(compte__in=comptes)
+        for compte_id, (debit, credit) in totaux_par_compte(anterieures).items():
+            ouverture[compte_id] = ouverture.get(compte_id, ZERO) + debit - credit
+    # Les sommes calculées par SQLite perdent l'échelle des décimaux
+    return {compte_id: decimal.Decimal(solde).quantize(CENTIMES) for compte_id, solde in ouverture.items()}
+
+
+def lignes_grand_livre(exercice, comptes=None, date_debut=None, date_fin=None, chunk_size=TAILLE_PAQUET):
+    """
+    Génère les lignes du grand livre (mêmes colonnes que ENTETE) : pour
+    chaque compte mouvementé, une ligne d'ouverture, ses écritures avec le
+    solde progressif, puis une ligne de totaux.
+    """
+    ouverture = soldes_ouverture(exercice, comptes, date_debut)
+
+    ecritures = EcritureComptable.objects.filter(exercice=exercice)
+    if comptes is not None:
+        ecritures = ecritures.filter(compte__in=comptes)
+    if date_debut:
+        ecritures = ecritures.filter(transaction__date_operation__gte=date_debut)
+    if date_fin:
+        ecritures = ecritures.filter(transaction__date_operation__lte=date_fin)
+    ecritures = ecritures.order_by('compte__compte', 'transaction__date_operation', 'id').values_list(
+        'compte_id', 'compte__compte', 'compte__libelle', 'transaction__date_operation',
+        'transaction__libelle', 'lot__code', 'type_ecriture', 'montant'
+    )
+
+    compte_courant = None
+    for compte_id, numero, intitule, date_operation, libelle, lot, type_ecriture, montant in ecritures.iterator(chunk_size):
+        if compte_id != compte_courant:
+            if compte_courant is not None:
+                yield total
+            compte_courant = compte_id
+            solde = ouverture.get(compte_id, ZERO)
+            total_debit = total_credit = ZERO
+            yield [numero, intitule, date_debut or exercice.date_debut, "Solde d'ouverture", '', None, None, solde]
+
+        if type_ecriture == 'DB':
+            debit, credit = montant, None
+            total_debit += montant
+            solde += montant
+        else:
+            debit, credit = None, montant
+            total_credit += montant
+            solde -= montant
+        yield [numero, intitule, date_operation, libelle, lot or '', debit, credit, solde]
+        total = [numero, intitule, date_fin or exercice.date_fin, f"Total {numero}", '', total_debit, total_credit, solde]
+
+    if compte_courant is not None:
+        yield total
+
+
+class _Tampon:
+    """Pseudo-fichier pour csv.writer : chaque ligne écrite est retournée telle quelle"""
+
+    def write(self, valeur):
+        return valeur
+
+
+def flux_csv(lignes):
+    """Lignes CSV (chaînes) produites une à une, pour une StreamingHttpResponse"""
+    ecrivain = csv.writer(_Tampon(), delimiter=';')
+    yield ecrivain.writerow(ENTETE)
+    for ligne in lignes:
+        yield ecrivain.writerow(ligne)
+
+
+def ecrire_csv(lignes, fichier):
+    ecrivain = csv.writer(fichier, delimiter=';')
+    ecrivain.writerow(ENTETE)
+    ecrivain.writerows(lignes)
+
+
+def ecrire_xlsx(lignes, fichier):
+    """Classeur en écriture seule : les lignes sont sérialisées au fil de l'eau, sans garder de cellules en mémoire"""
+    from openpyxl import Workbook
+
+    classeur = Workbook(write_only=True)
+    feuille = classeur.create_sheet("Grand livre")
+    feuille.append(ENTETE)
+    for ligne in lignes:
+        feuille.append(ligne)
+    classeur.save(fichier)
@@ -0,0 +1,232 @@
+# comptabilite/import_ecritures.py
+"""
+Import en masse de lignes de journal (reprise d'historique) depuis un CSV
+ou un XLSX lu en flux.
+
+Colonnes (en-tête, casse indifférente) : piece (facultative), date,
+libelle, compte (numéro), debit, credit, lot (code), immeuble (code,
+facultatif : nécessaire quand un code de lot existe dans plusieurs
+immeubles) et fournisseur (code).
+
+Les lignes consécutives de même pièce forment une transaction ; sans
+colonne `piece`, une transaction est close dès que ses lignes sont
+équilibrées. Comptes, lots et fournisseurs sont résolus par des
+dictionnaires construits une fois pour tout le fichier ; chaque
+transaction est validée comme une saisie (voir comptabilite/saisie.py)
+puis insérée en masse par paquets. Les soldes ne sont mis à jour qu'une
+fois, à la fin, et la mémoire utilisée ne dépend que du référentiel et
+de la taille des paquets, pas du nombre de lignes.
+
+Hors `tout_ou_rien` et simulation, chaque paquet est validé dans sa propre
+transaction : l'import d'un gros fichier ne garde pas la base verrouillée
+de bout en bout, et une interruption laisse les paquets déjà validés
+enregistrés, soldes recalculés.
+"""
+import decimal
+from contextlib import nullcontext
+from datetime import datetime
+
+from django.db import transaction
+
+from patrimoine.models import Lot
+
+from .models import Fournisseur
+from .saisie import Invalide, Referentiel, enregistrer, valider
+from .soldes import recalculer_soldes, recalculer_soldes_lots, session_saisie
+
+# Nombre de transactions insérées par paquet
+TAILLE_PAQUET = 1000
+
+COLONNES = ('piece', 'date', 'libelle', 'compte', 'debit', 'credit', 'lot', 'immeuble', 'fournisseur')
+
+# Marqueur d'un code de lot présent dans plusieurs immeubles
+AMBIGU = object()
+
+
+class _Annulation(Exception):
+    pass
+
+
+def _texte(valeur):
+    return '' if valeur is None else str(valeur).strip()
+
+
+def _montant(valeur):
+    """Montant d'une cellule : nombre, « 1234.56 » ou « 1 234,56 » ; None si vide"""
+    if valeur in (None, ''):
+        return None
+    if isinstance(valeur, (int, float, decimal.Decimal)):
+        return decimal.Decimal(str(valeur))
+    texte = str(valeur).replace('\xa0', '').replace(' ', '')
+    if ',' in texte and '.' not in texte:
+        texte = texte.replace(',', '.')
+    try:
+        return decimal.Decimal(texte) if texte else None
+    except decimal.InvalidOperation:
+        raise Invalide(f"Montant invalide : {valeur!r}")
+
+
+def _date(valeur):
+    """Date d'une cellule : date XLSX, AAAA-MM-JJ ou JJ/MM/AAAA"""
+    texte = _texte(valeur)
+    if isinstance(valeur, datetime) or not texte or '/' not in texte:
+        return valeur
+    try:
+        return datetime.strptime(texte, '%d/%m/%Y').date()
+    except ValueError:
+        raise Invalide(f"Date invalide : {valeur!r}")
+
+
+class ReferentielFichier(Referentiel):
+    """Référentiel complet, avec les lots et fournisseurs indexés par code"""
+
+    def __init__(self):
+        super().__init__()
+        self.fournisseurs_par_code = dict(Fournisseur.objects.values_list('code', 'pk'))
+        self.lots_par_code, self.lots_par_immeuble = {}, {}
+        for pk, code, immeuble in Lot.objects.values_list('pk', 'code', 'immeuble__code').iterator():
+            self.lots_par_immeuble[(immeuble, code)] = pk
+            self.lots_par_code[code] = AMBIGU if code in self.lots_par_code else pk
+
+    def lot(self, code, immeuble=''):
+        if immeuble:
+            lot_id = self.lots_par_immeuble.get((immeuble, code))
+        else:
+            lot_id = self.lots_par_code.get(code)
+            if lot_id is AMBIGU:
+                raise Invalide(f"Lot {code!r} présent dans plusieurs immeubles : préciser la colonne immeuble")
+        if lot_id is None:
+            raise Invalide(f"Lot {code!r} inconnu" + (f" dans l'immeuble {immeuble!r}" if immeuble else ""))
+        return lot_id
+
+    def fournisseur(self, code):
+        if code not in self.fournisseurs_par_code:
+            raise Invalide(f"Fournisseur {code!r} inconnu")
+        return self.fournisseurs_par_code[code]
+
+
+def _ecriture(ligne, referentiel):
+    """Écriture au format de la saisie (IDs résolus) depuis une ligne du fichier"""
+    debit, credit = _montant(ligne.get('debit')), _montant(ligne.get('credit'))
+    if (debit is None) == (credit is None):
+        raise Invalide("Renseigner soit le débit, soit le crédit")
+    lot, fournisseur = _texte(ligne.get('lot')), _texte(ligne.get('fournisseur'))
+    return {
+        'compte': _texte(ligne.get('compte')),
+        'type_ecriture': 'DB' if debit is not None else 'CR',
+        'montant': debit if debit is not None else credit,
+        'lot': referentiel.lot(lot, _texte(ligne.get('immeuble'))) if lot else None,
+        'fournisseur': referentiel.fournisseur(fournisseur) if fournisseur else None,
+    }
+
+
+def grouper(lignes):
+    """
+    Regroupe en transactions les lignes (dictionnaires, avec leur numéro
+    de ligne dans le fichier) : par pièce si la colonne est présente,
+    sinon jusqu'à l'équilibre. Produit des listes de (numéro, ligne).
+    """
+    groupe, piece, solde = [], None, decimal.Decimal(0)
+    for numero, ligne in lignes:
+        if 'piece' in ligne:
+            if groupe and _texte(ligne['piece']) != piece:
+                yield groupe
+                groupe = []
+            piece = _texte(ligne['piece'])
+            groupe.append((numero, ligne))
+            continue
+
+        groupe.append((numero, ligne))
+        try:
+            solde += (_montant(ligne.get('debit')) or 0) - (_montant(ligne.get('credit')) or 0)
+        except Invalide:
+            # Montant illisible : la transaction est rejetée à la validation
+            pass
+        if len(groupe) >= 2 and not solde:
+            yield groupe
+            groupe, solde = [], decimal.Decimal(0)
+    if groupe:
+        yield groupe
+
+
+def _transaction(groupe, referentiel):
+    """Valide un groupe de lignes et retourne (transaction, écritures) non enregistrées"""
+    premiere = groupe[0][1]
+    ecritures = []
+    for numero, ligne in groupe:
+        try:
+            ecritures.append(_ecriture(ligne, referentiel))
+        except Invalide as exc:
+            exc.numero = numero
+            raise
+    return valider({
+        'date_operation': _date(premiere.get('date')),
+        'libelle': _texte(premiere.get('libelle')),
+        'ecritures': ecritures,
+    }, referentiel)
+
+
+def importer_ecritures(lignes, taille=TAILLE_PAQUET, tout_ou_rien=False, dry_run=False, progression=None):
+    """
+    Importe des lignes de journal (la première est l'en-tête). Les
+    transactions invalides sont rejetées et les autres enregistrées ; avec
+    `tout_ou_rien`, une seule erreur annule tout l'import, et `dry_run`
+    annule toujours ; sinon chaque paquet est validé dans sa propre
+    transaction. `progression(lignes lues, transactions valides)` est
+    appelé après chaque paquet. Retourne (transactions valides, erreurs)
+    où erreurs est une liste de (numéro de ligne, message) : ligne fautive,
+    ou première ligne de la transaction rejetée.
+    """
+    lignes = iter(lignes)
+    en_tetes = [_texte(en_tete).lower() for en_tete in next(lignes, None) or []]
+    manquantes = {'date', 'libelle', 'compte', 'debit', 'credit'} - set(en_tetes)
+    if manquantes:
+        return 0, [(1, f"Colonnes manquantes : {', '.join(sorted(manquantes))}")]
+    colonnes = [(index, nom) for index, nom in enumerate(en_tetes) if nom in COLONNES]
+
+    def dictionnaires():
+        for numero, ligne in enumerate(lignes, start=2):
+            if any(valeur not in (None, '') for valeur in ligne):
+                yield numero, {nom: ligne[index] if index < len(ligne) else None for index, nom in colonnes}
+
+    def enregistrer_paquet(paquet):
+        if paquet and not (tout_ou_rien and erreurs):
+            with transaction.atomic():
+                enregistrer(paquet, taille)
+
+    referentiel = ReferentielFichier()
+    total, erreurs, paquet, lues = 0, [], [], 0
+    # Une seule transaction quand tout peut être annulé ; sinon une par paquet
+    try:
+        with transaction.atomic() if tout_ou_rien or dry_run else nullcontext(), session_saisie() as session:
+            # Soldes mis à jour une seule fois, à la sortie de la session
+            try:
+                for groupe in grouper(dictionnaires()):
+                    lues = groupe[-1][0] - 1
+                    try:
+                        paquet.append(_transaction(groupe, referentiel))
+                    except Invalide as exc:
+                        erreurs.append((getattr(exc, 'numero', groupe[0][0]), str(exc)))
+                        continue
+                    if len(paquet) >= taille:
+                        enregistrer_paquet(paquet)
+                        total += len(paquet)
+                        paquet = []
+                        if progression:
+                            progression(lues, total)
+
+                enregistrer_paquet(paquet)
+                total += len(paquet)
+                if progression:
+                    progression(lues, total)
+            except BaseException:
+                if not (tout_ou_rien or dry_run):
+                    # Import interrompu : les paquets déjà validés gardent des soldes justes
+                    recalculer_soldes(session.paires | set(session.deltas))
+                    recalculer_soldes_lots(session.lots | set(session.deltas_lots))
+                raise
+            if dry_run or (tout_ou_rien and erreurs):
+                raise _Annulation
+    except _Annulation:
+        pass
+    return total, erreurs
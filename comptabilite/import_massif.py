@@ -0,0 +1,221 @@
+# comptabilite/import_massif.py
+"""
+Import en masse des ressources django-import-export (plan comptable, lots).
+
+Par défaut, import-export cherche l'instance existante de chaque ligne par
+une requête, résout chaque clé étrangère par une autre requête et
+enregistre ligne à ligne. `ImportParTranchesResource` remplace ces
+accès par ligne :
+
+- les instances existantes sont chargées en une requête `__in` par tranche
+  de clés (`ChargeurParTranches`) et comparées en mémoire (skip_unchanged) ;
+- les références (clés étrangères) sont préchargées de la même façon
+  (`ReferenceWidget`) ;
+- créations et modifications partent par bulk_create / bulk_update.
+
+Pour les gros fichiers, `lire_lignes` lit le CSV ou le XLSX en flux et
+`importer_par_tranches` importe un Dataset tablib de `taille` lignes à la
+fois, chacun dans sa propre transaction, avec un rappel de progression
+(commande `importer`).
+"""
+import csv
+import functools
+from collections import Counter
+from itertools import islice
+
+import tablib
+from django.core.exceptions import MultipleObjectsReturned
+from import_export import instance_loaders, resources, widgets
+
+# Nombre de lignes importées par tranche et de clés par requête `__in`
+TAILLE_TRANCHE = 2000
+
+
+def _par_tranches(iterable, taille):
+    iterateur = iter(iterable)
+    while tranche := list(islice(iterateur, taille)):
+        yield tranche
+
+
+class ReferenceWidget(widgets.ForeignKeyWidget):
+    """ForeignKeyWidget résolvant les références depuis un cache préchargé (`precharger`)"""
+
+    cache = None
+
+    def _cle(self, valeur):
+        champ = self.model._meta.pk if self.field == 'pk' else self.model._meta.get_field(self.field)
+        return champ.to_python(valeur)
+
+    def precharger(self, valeurs):
+        cles = {self._cle(v) for v in valeurs if v not in (None, '')}
+        self.cache = {}
+        for tranche in _par_tranches(cles, TAILLE_TRANCHE):
+            for objet in self.model.objects.filter(**{f'{self.field}__in': tranche}):
+                self.cache[self._cle(getattr(objet, self.field))] = objet
+
+    def clean(self, value, row=None, **kwargs):
+        if self.cache is None or self.use_natural_foreign_keys or '__' in self.field or not value:
+            return super().clean(value, row, **kwargs)
+        objet = self.cache.get(self._cle(value))
+        if objet is None:
+            raise self.model.DoesNotExist(f"{self.model._meta.verbose_name} {value!r} introuvable")
+        return objet.pk if self.key_is_id else objet
+
+
+class ChargeurParTranches(instance_loaders.ModelInstanceLoader):
+    """
+    Charge les instances existantes du dataset par requêtes `__in` sur le
+    premier champ identifiant (une requête par tranche de clés), puis les
+    associe aux lignes en mémoire sur l'ensemble des champs identifiants.
+    """
+
+    def __init__(self, resource, dataset=None):
+        super().__init__(resource, dataset)
+        self.champs = [resource.fields[nom] for nom in resource.get_import_id_fields()]
+        # Valeurs normalisées par le champ du modèle (ex. 7111 lu en nombre dans un XLSX)
+        self.champs_modele = [resource._meta.model._meta.get_field(champ.attribute) for champ in self.champs]
+        self.instances = {}
+
+        if dataset is None or any(champ.column_name not in dataset.headers for champ in self.champs):
+            return
+        cles = set()
+        for row in dataset.dict:
+            try:
+                cles.add(self.cle(row))
+            except Exception:
+                # Ligne invalide : l'erreur est remontée par import_row
+                continue
+
+        premier = self.champs[0]
+        for tranche in _par_tranches({cle[0] for cle in cles}, TAILLE_TRANCHE):
+            for instance in self.get_queryset().filter(**{f'{premier.attribute}__in': tranche}):
+                cle = self.normaliser(champ.get_value(instance) for champ in self.champs)
+                if cle in cles:
+                    # Clé en double en base : signalée à la ligne, comme par .get()
+                    self.instances[cle] = None if cle in self.instances else instance
+
+    def normaliser(self, valeurs):
+        return tuple(champ.to_python(valeur) for champ, valeur in zip(self.champs_modele, valeurs))
+
+    def cle(self, row):
+        return self.normaliser(champ.clean(row) for champ in self.champs)
+
+    def get_instance(self, row):
+        cle = self.cle(row)
+        if cle in self.instances and self.instances[cle] is None:
+            raise MultipleObjectsReturned(f"Plusieurs objets pour la clé {cle}")
+        return self.instances.get(cle)
+
+    def retenir(self, row, instance):
+        """Nouvelle instance en attente de bulk_create : les lignes suivantes de même clé la modifient"""
+        self.instances[self.cle(row)] = instance
+
+
+class ImportParTranchesResource(resources.ModelResource):
+    """ModelResource à import en masse (voir le module) ; les sous-classes déclarent leur Meta"""
+
+    class Meta:
+        use_bulk = True
+        batch_size = 1000
+        instance_loader_class = ChargeurParTranches
+        skip_unchanged = True
+        report_skipped = True
+
+    @classmethod
+    def get_fk_widget(cls, field):
+        widget = super().get_fk_widget(field)
+        return functools.partial(ReferenceWidget, *widget.args, **widget.keywords)
+
+    def before_import(self, dataset, **kwargs):
+        super().before_import(dataset, **kwargs)
+        for champ in self.get_import_fields():
+            if isinstance(champ.widget, ReferenceWidget) and champ.column_name in dataset.headers:
+                champ.widget.precharger(dataset[champ.column_name])
+
+    def get_or_init_instance(self, instance_loader, row):
+        instance, nouveau = super().get_or_init_instance(instance_loader, row)
+        if nouveau and isinstance(instance_loader, ChargeurParTranches):
+            instance_loader.retenir(row, instance)
+        return instance, nouveau
+
+    def save_instance(self, instance, is_create, row, **kwargs):
+        if not is_create and instance.pk is None:
+            # Doublon d'une ligne précédente de la tranche, déjà en attente de création
+            return
+        super().save_instance(instance, is_create, row, **kwargs)
+
+    def get_bulk_update_fields(self):
+        # Attributs du modèle (les noms de champs de la ressource peuvent différer)
+        identifiants = {self.fields[nom].attribute for nom in self.get_import_id_fields()}
+        return list(dict.fromkeys(
+            champ.attribute for champ in self.get_import_fields()
+            if champ.attribute and champ.attribute not in identifiants
+        ))
+
+    def bulk_update(self, using_transactions, dry_run, raise_errors, batch_size=None, result=None):
+        if not self.get_bulk_update_fields():
+            # Seuls les identifiants sont importés : rien à modifier
+            self.update_instances.clear()
+            return
+        super().bulk_update(using_transactions, dry_run, raise_errors, batch_size=batch_size, result=result)
+
+
+def lire_lignes(fichier, format_fichier='csv', delimiteur=','):
+    """Itère en flux sur les lignes (listes de valeurs) d'un fichier CSV ou XLSX, en-tête compris"""
+    if format_fichier == 'xlsx':
+        from openpyxl import load_workbook
+
+        classeur = load_workbook(fichier, read_only=True, data_only=True)
+        try:
+            yield from classeur.active.iter_rows(values_only=True)
+        finally:
+            classeur.close()
+    else:
+        yield from csv.reader(fichier, delimiter=delimiteur)
+
+
+def importer_par_tranches(resource, lignes, taille=TAILLE_TRANCHE, dry_run=False, progression=None):
+    """
+    Importe des lignes (la première est l'en-tête) par tranches de `taille`,
+    chacune dans sa propre transaction. `progression(lignes traitées,
+    totaux)` est appelé après chaque tranche. Retourne (totaux par type
+    d'import, erreurs) où erreurs est une liste de (numéro de ligne du
+    fichier, message). Une tranche en erreur (hors lignes invalides) est
+    annulée seule : `error` compte les lignes en erreur (invalides
+    comprises) et `annulees` les autres lignes des tranches annulées.
+    """
+    lignes = iter(lignes)
+    en_tetes = [str(en_tete).strip() if en_tete is not None else '' for en_tete in next(lignes, None) or []]
+    totaux, erreurs, traitees = Counter(), [], 0
+
+    for tranche in _par_tranches(lignes, taille):
+        # Lignes vides ignorées ; numéros de ligne du fichier (en-tête : ligne 1) conservés pour les erreurs
+        numeros, donnees = [], []
+        for position, ligne in enumerate(tranche, start=traitees + 2):
+            if any(valeur not in (None, '') for valeur in ligne):
+                numeros.append(position)
+                donnees.append((list(ligne) + [None] * len(en_tetes))[:len(en_tetes)])
+        traitees += len(tranche)
+        if not donnees:
+            continue
+
+        resultat = resource.import_data(tablib.Dataset(*donnees, headers=en_tetes), dry_run=dry_run, use_transactions=True)
+        erreurs.extend((None, str(erreur.error)) for erreur in resultat.base_errors)
+        erreurs.extend(
+            (numeros[ligne.number - 1], '; '.join(
+                f"{champ} : {', '.join(messages)}" for champ, messages in ligne.error_dict.items()
+            ))
+            for ligne in resultat.invalid_rows
+        )
+        erreurs.extend(
+            (numeros[ligne.number - 1], str(erreur.error)) for ligne in resultat.error_rows for erreur in ligne.errors
+        )
+        en_erreur = len(resultat.invalid_rows) + len(resultat.error_rows)
+        totaux['error'] += en_erreur
+        if resultat.has_errors():
+            totaux['annulees'] += len(donnees) - en_erreur
+        else:
+            totaux.update({cle: nombre for cle, nombre in resultat.totals.items() if cle not in ('invalid', 'error')})
+        if progression:
+            progression(traitees, totaux)
+    return totaux, erreurs
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from comptabilite.balance import balance_generale, totaux_balance, verifier_balance
+from comptabilite.models import ExerciceComptable
+
+
+class Command(BaseCommand):
+    help = "Affiche la balance générale d'un exercice (soldes initiaux, mouvements, soldes finaux)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--exercice', type=int, help="ID de l'exercice (par défaut : exercice actuel)")
+        parser.add_argument(
+            '--verifier', action='store_true',
+            help="Contrôler la balance contre les écritures (équivaut à verifier_soldes, sans correction)"
+        )
+
+    def handle(self, *args, **options):
+        if options.get('exercice'):
+            exercice = ExerciceComptable.objects.filter(pk=options['exercice']).first()
+        else:
+            exercice = ExerciceComptable.get_exercice_actuel()
+        if not exercice:
+            self.stderr.write("❌ Exercice comptable introuvable!")
+            return
+
+        lignes = balance_generale(exercice)
+        totaux = totaux_balance(lignes)
+
+        self.stdout.write(f"\n📒 Balance générale — {exercice}")
+        entete = f"{'Compte':40} {'Solde initial':>15} {'Débit':>15} {'Crédit':>15} {'Solde final':>15}"
+        self.stdout.write(entete)
+        self.stdout.write("-" * len(entete))
+        for ligne in lignes:
+            self.stdout.write(
+                f"{str(ligne['compte'])[:40]:40} {ligne['solde_initial']:15.2f} {ligne['total_debit']:15.2f} "
+                f"{ligne['total_credit']:15.2f} {ligne['solde_final']:15.2f}"
+            )
+        self.stdout.write("-" * len(entete))
+        self.stdout.write(
+            f"{'Total':40} {totaux['solde_initial']:15.2f} {totaux['total_debit']:15.2f} "
+            f"{totaux['total_credit']:15.2f} {totaux['solde_final']:15.2f}"
+        )
+
+        if options['verifier']:
+            anomalies = verifier_balance(exercice)
+            for anomalie in anomalies:
+                self.stdout.write(f"⚠️ {anomalie}")
+            if anomalies:
+                self.stdout.write(f"❌ {len(anomalies)} anomalie(s) — relancer verifier_soldes --reconstruire")
+            else:
+                self.stdout.write("✅ Balance conforme aux écritures")
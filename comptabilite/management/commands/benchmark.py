@@ -0,0 +1,207 @@
+import io
+import json
+import platform
+import statistics
+import time
+from django.contrib import admin
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from accounts.models import MyUser
+from comptabilite.models import Compte, EcritureComptable, ExerciceComptable, Transaction
+from comptabilite.resources import CompteResource
+from comptabilite.soldes import verifier_soldes
+from comptabilite.synthetique import generer_jeu
+from patrimoine.models import Lot
+from patrimoine.resources import LotResource
+
+
+class Command(BaseCommand):
+    help = (
+        "Suite de mesures de performance sur un jeu synthétique : facturation, clôture, soldes, "
+        "listes de l'admin et import/export, avec nombre de requêtes, sortie JSON et détection des régressions"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--immeubles', type=int, default=5, help="Nombre d'immeubles (défaut : 5)")
+        parser.add_argument('--lots', type=int, default=500, help="Nombre de lots, un abonnement chacun (défaut : 500)")
+        parser.add_argument('--exercices', type=int, default=2, help="Nombre d'exercices générés (défaut : 2)")
+        parser.add_argument('--ecritures', type=int, default=50000, help="Nombre total d'écritures (défaut : 50000)")
+        parser.add_argument('--repetitions', type=int, default=3, help="Nombre de mesures par scénario (défaut : 3)")
+        parser.add_argument(
+            '--scenario', action='append', dest='scenarios', metavar='NOM',
+            help="Ne mesurer que ce scénario (répétable)"
+        )
+        parser.add_argument('--sortie', help="Fichier JSON où écrire les résultats")
+        parser.add_argument('--reference', help="Fichier JSON d'une mesure précédente à comparer")
+        parser.add_argument(
+            '--tolerance', type=float, default=20,
+            help="Ralentissement toléré par rapport à la référence, en %% (défaut : 20)"
+        )
+        parser.add_argument(
+            '--seuil-ms', type=float, default=5,
+            help="Écart absolu en dessous duquel un ralentissement est ignoré (défaut : 5 ms)"
+        )
+
+    def handle(self, *args, **options):
+        reference = None
+        if options.get('reference'):
+            with open(options['reference'], encoding='utf-8') as fichier:
+                reference = json.load(fichier)
+
+        parametres = {
+            cle: options[cle] for cle in ('immeubles', 'lots', 'exercices', 'ecritures', 'repetitions')
+        }
+        resultats = {}
+
+        # Tout est annulé en fin de mesure : la base n'est pas modifiée
+        with transaction.atomic():
+            self.stdout.write(f"\n🏗️ Génération du jeu synthétique ({options['ecritures']} écritures)...")
+            debut = time.perf_counter()
+            jeu = generer_jeu(
+                immeubles=options['immeubles'],
+                lots=options['lots'],
+                exercices=max(1, options['exercices']),
+                ecritures=options['ecritures'],
+                actuel=True
+            )
+            self.stdout.write(f"✅ Jeu généré en {time.perf_counter() - debut:.1f}s")
+
+            scenarios = self.scenarios(jeu)
+            if options.get('scenarios'):
+                inconnus = set(options['scenarios']) - set(scenarios)
+                if inconnus:
+                    raise CommandError(f"Scénario(s) inconnu(s) : {', '.join(sorted(inconnus))}")
+                scenarios = {nom: scenario for nom, scenario in scenarios.items() if nom in options['scenarios']}
+
+            for nom, (fonction, modifie) in scenarios.items():
+                self.stdout.write(f"⏱️ {nom}...")
+                resultats[nom] = self.mesurer(fonction, modifie, options['repetitions'])
+
+            transaction.set_rollback(True)
+
+        rapport = {
+            'date': timezone.now().isoformat(timespec='seconds'),
+            'sgbd': connection.vendor,
+            'python': platform.python_version(),
+            'parametres': parametres,
+            'resultats': resultats,
+        }
+        regressions = self.afficher(rapport, reference, options['tolerance'], options['seuil_ms'])
+
+        if options.get('sortie'):
+            with open(options['sortie'], 'w', encoding='utf-8') as fichier:
+                json.dump(rapport, fichier, indent=2, ensure_ascii=False)
+            self.stdout.write(f"💾 Résultats écrits dans {options['sortie']}")
+
+        if regressions:
+            raise CommandError(f"{len(regressions)} régression(s) : {', '.join(regressions)}")
+
+    def mesurer(self, fonction, modifie, repetitions):
+        """Durées (ms) et nombre de requêtes ; un scénario qui modifie la base est annulé après chaque mesure"""
+        durees, requetes = [], None
+        for _ in range(max(1, repetitions)):
+            sid = transaction.savepoint() if modifie else None
+            with CaptureQueriesContext(connection) as capture:
+                debut = time.perf_counter()
+                fonction()
+                durees.append((time.perf_counter() - debut) * 1000)
+            if requetes is None:
+                requetes = len(capture.captured_queries)
+            if sid:
+                transaction.savepoint_rollback(sid)
+        return {
+            'min_ms': round(min(durees), 2),
+            'mediane_ms': round(statistics.median(durees), 2),
+            'requetes': requetes,
+        }
+
+    def scenarios(self, jeu):
+        """Scénarios mesurés : nom -> (fonction, modifie la base)"""
+        exercice = jeu['exercices'][-1]
+        compte_recette = jeu['comptes']["7111"]
+        utilisateur = MyUser(email="benchmark@exemple.ma", is_active=True, is_staff=True, is_superuser=True)
+        fabrique = RequestFactory()
+
+        def facturation():
+            # Rattrapage explicite (--to) : toutes les périodes dues jusqu'au début de l'exercice
+            call_command('facturation_copro', date_fin=str(exercice.date_debut), stdout=io.StringIO(), stderr=io.StringIO())
+
+        def cloture():
+            ExerciceComptable.objects.get(pk=exercice.pk).close_exercice()
+
+        def liste(modele, **parametres):
+            def afficher():
+                request = fabrique.get('/admin/', parametres)
+                request.user = utilisateur
+                admin.site._registry[modele].changelist_view(request).render()
+            return afficher
+
+        # Curseur de la page suivante : 101e écriture, ou la dernière sur un petit jeu
+        ids = list(EcritureComptable.objects.order_by('-id').values_list('pk', flat=True)[:101])
+        curseur = ids[-1] if ids else 0
+
+        def exporter_comptes():
+            CompteResource().export().csv
+
+        def importer_comptes():
+            # Réimport à l'identique (simulation) : chaque ligne est comparée à l'existant
+            donnees = CompteResource().export()
+            CompteResource().import_data(donnees, dry_run=True)
+
+        def exporter_lots():
+            LotResource().export().csv
+
+        def importer_lots():
+            donnees = LotResource().export()
+            LotResource().import_data(donnees, dry_run=True)
+
+        return {
+            'facturation_copro': (facturation, True),
+            'close_exercice': (cloture, True),
+            'mettre_a_jour_solde': (lambda: compte_recette.mettre_a_jour_solde(exercice), True),
+            'verifier_soldes': (lambda: verifier_soldes(exercice), False),
+            'admin_comptes': (liste(Compte), False),
+            'admin_ecritures': (liste(EcritureComptable), False),
+            'admin_ecritures_page_suivante': (
+                liste(EcritureComptable, apres=curseur), False
+            ),
+            'admin_transactions': (liste(Transaction), False),
+            'admin_lots': (liste(Lot), False),
+            'export_comptes': (exporter_comptes, False),
+            'import_comptes': (importer_comptes, True),
+            'export_lots': (exporter_lots, False),
+            'import_lots': (importer_lots, True),
+        }
+
+    def afficher(self, rapport, reference, tolerance, seuil_ms):
+        """Affiche les mesures et retourne la liste des scénarios en régression par rapport à la référence"""
+        anciens = (reference or {}).get('resultats', {})
+        regressions = []
+
+        self.stdout.write(f"\n{'Scénario':32} {'min (ms)':>10} {'médiane':>10} {'requêtes':>9}  {'référence':>18}")
+        for nom, mesure in rapport['resultats'].items():
+            ligne = f"{nom:32} {mesure['min_ms']:10.1f} {mesure['mediane_ms']:10.1f} {mesure['requetes']:9}"
+            ancien = anciens.get(nom)
+            if not ancien:
+                self.stdout.write(ligne)
+                continue
+
+            ligne += f"  {ancien['min_ms']:10.1f} / {ancien['requetes']:5}"
+            lent = (
+                mesure['min_ms'] > ancien['min_ms'] * (1 + tolerance / 100) and
+                mesure['min_ms'] - ancien['min_ms'] > seuil_ms
+            )
+            if lent or mesure['requetes'] > ancien['requetes']:
+                regressions.append(nom)
+                ligne += "  ⚠️ régression"
+            self.stdout.write(ligne)
+
+        if reference and reference.get('parametres') != rapport['parametres']:
+            self.stdout.write("⚠️ Paramètres différents de la référence : comparaison indicative")
+        if reference and not regressions:
+            self.stdout.write("✅ Aucune régression par rapport à la référence")
+        return regressions
@@ -0,0 +1,131 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction, models
+from comptabilite.models import Compte, EcritureComptable, ExerciceComptable
+from comptabilite.synthetique import generer_jeu
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure le gain des index composites et de l'exercice dénormalisé sur "
+        "mettre_a_jour_solde, calculer_resultat_net et la lecture du solde avance d'un lot"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ecritures', type=int, default=0,
+            help="Générer un jeu synthétique de N écritures avant la mesure (ex: 1000000)"
+        )
+        parser.add_argument('--lots', type=int, default=2000, help="Nombre de lots du jeu synthétique")
+        parser.add_argument('--repetitions', type=int, default=5, help="Nombre de mesures par opération (meilleur temps retenu)")
+        parser.add_argument(
+            '--conserver', action='store_true',
+            help="Conserver le jeu synthétique (par défaut tout est annulé en fin de mesure)"
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            self.stderr.write("❌ Mesure sans index impossible : DDL non transactionnel sur ce SGBD")
+            return
+
+        with transaction.atomic():
+            if options['ecritures']:
+                exercice = self.generer(options['ecritures'], options['lots'])
+            else:
+                exercice = ExerciceComptable.get_exercice_actuel()
+            if not exercice:
+                self.stderr.write("❌ Aucun exercice comptable actif!")
+                return
+
+            self.analyser()
+            operations = self.operations(exercice)
+            nombre = EcritureComptable.objects.filter(exercice=exercice).count()
+            self.stdout.write(f"\n⏱️ Mesures sur {exercice} ({nombre} écritures, {options['repetitions']} répétitions)")
+
+            # Situation antérieure : index composites supprimés (annulé par le savepoint)
+            sid = transaction.savepoint()
+            self.supprimer_index()
+            avant = {nom: self.mesurer(avant_fn, options['repetitions']) for nom, (avant_fn, _) in operations.items()}
+            transaction.savepoint_rollback(sid)
+            self.analyser()
+
+            apres = {nom: self.mesurer(apres_fn, options['repetitions']) for nom, (_, apres_fn) in operations.items()}
+
+            self.stdout.write(f"\n{'Opération':32} {'avant (ms)':>12} {'après (ms)':>12} {'gain':>8}")
+            for nom in operations:
+                gain = avant[nom] / apres[nom] if apres[nom] else 0
+                self.stdout.write(f"{nom:32} {avant[nom] * 1000:12.1f} {apres[nom] * 1000:12.1f} {gain:7.1f}x")
+
+            if not options['conserver']:
+                transaction.set_rollback(True)
+
+    def mesurer(self, fonction, repetitions):
+        durees = []
+        for _ in range(max(1, repetitions)):
+            debut = time.perf_counter()
+            fonction()
+            durees.append(time.perf_counter() - debut)
+        return min(durees)
+
+    def operations(self, exercice):
+        """Couples (avant, après) : jointure sur Transaction contre colonne exercice dénormalisée"""
+        compte = Compte.objects.filter(ecritures__exercice=exercice).annotate(
+            nombre=models.Count('ecritures')
+        ).order_by('-nombre').first()
+        compte_avance = Compte.objects.filter(compte="4421").first()
+        lots = list(
+            EcritureComptable.objects.filter(compte=compte_avance, lot__isnull=False)
+            .values_list('lot_id', flat=True).distinct()[:200]
+        )
+
+        def totaux(filtre):
+            for type_ecriture in ('DB', 'CR'):
+                EcritureComptable.objects.filter(
+                    compte=compte, type_ecriture=type_ecriture, **filtre
+                ).aggregate(models.Sum('montant'))
+
+        def resultat(filtre):
+            for type_compte, type_ecriture in (('recette', 'CR'), ('depense', 'DB')):
+                EcritureComptable.objects.filter(
+                    compte__type_compte=type_compte, type_ecriture=type_ecriture, **filtre
+                ).aggregate(models.Sum('montant'))
+
+        def avances():
+            for lot_id in lots:
+                EcritureComptable.objects.filter(lot_id=lot_id, compte=compte_avance).aggregate(
+                    solde=models.Sum(
+                        models.Case(
+                            models.When(type_ecriture='CR', then=models.F('montant')),
+                            models.When(type_ecriture='DB', then=-models.F('montant')),
+                            output_field=models.DecimalField()
+                        )
+                    )
+                )
+
+        return {
+            f'mettre_a_jour_solde ({compte.compte if compte else "-"})': (
+                lambda: totaux({'transaction__exercice': exercice}),
+                lambda: totaux({'exercice': exercice}),
+            ),
+            'calculer_resultat_net': (
+                lambda: resultat({'transaction__exercice': exercice}),
+                lambda: resultat({'exercice': exercice}),
+            ),
+            f'solde avance ({len(lots)} lots)': (avances, avances),
+        }
+
+    def supprimer_index(self):
+        # DROP INDEX brut : le schema editor SQLite est inutilisable dans une transaction
+        with connection.cursor() as cursor:
+            for index in EcritureComptable._meta.indexes:
+                cursor.execute(f"DROP INDEX {connection.ops.quote_name(index.name)}")
+        self.analyser()
+
+    def analyser(self):
+        # Statistiques à jour pour le planificateur
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def generer(self, nombre_ecritures, nombre_lots):
+        self.stdout.write(f"🏗️ Génération de {nombre_ecritures} écritures...")
+        return generer_jeu(lots=nombre_lots, abonnements=0, ecritures=nombre_ecritures)['exercices'][-1]
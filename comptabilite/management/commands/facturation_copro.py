@@ -1,145 +1,448 @@
+import io
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from django import setup as django_setup
+from django.apps import apps
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from django.db import transaction, models
-from django.db.models.functions import ExtractMonth, ExtractYear
+from django.db import OperationalError, connections, transaction, models
 from datetime import timedelta
-from comptabilite.models import Abonnement, Transaction, EcritureComptable, Compte, ExerciceComptable
+from comptabilite.models import (
+    Abonnement, EcheanceAbonnement, Transaction, EcritureComptable, Compte, ExerciceComptable, Modification, SoldeLot
+)
+from comptabilite.modifications import journaliser
+from comptabilite.referentiel import compte
+from comptabilite.profilage import actif as profiler_actif, collecte, forcer, profiler, resume
+from comptabilite.soldes import creer_ecritures, session_saisie
+
+# Nombre de tentatives d'un shard en cas de verrou d'écriture concurrent
+TENTATIVES_VERROU = 10
+
+
+def _initialiser_processus():
+    # Processus « spawn » : Django n'est pas encore initialisé
+    if not apps.ready:
+        django_setup()
+
+
+def facturer_shard(cle, filtre, contexte, profilage=False):
+    """Facture un shard dans sa propre transaction ; les erreurs restent confinées au shard"""
+    sortie = io.StringIO()
+    commande = Command(stdout=sortie, stderr=sortie)
+    resultat = {
+        'cle': cle, 'total': 0, 'existants': 0, 'nouveaux': 0, 'periodes': {}, 'hors_exercice': 0,
+        'en_retard': 0, 'exclues': 0, 'erreur': None
+    }
+    for tentative in range(TENTATIVES_VERROU):
+        sortie.seek(0)
+        sortie.truncate()
+        try:
+            # Les mesures du shard sont renvoyées au processus principal pour le résumé
+            with forcer() if profilage else nullcontext(), collecte() as mesures:
+                with profiler(f"facturation_copro shard {cle}"):
+                    resultat.update(commande.facturer_abonnements(filtre, **contexte))
+            resultat['mesures'] = mesures
+            resultat['erreur'] = None
+            break
+        except OperationalError as exc:
+            # Verrou d'écriture concurrent (SQLite) ou interblocage : on rejoue le shard
+            resultat['erreur'] = f"{type(exc).__name__}: {exc}"
+            if not any(motif in str(exc).lower() for motif in ('locked', 'deadlock')):
+                break
+            time.sleep(random.uniform(0.1, 0.5) * (tentative + 1))
+        except Exception as exc:
+            resultat['erreur'] = f"{type(exc).__name__}: {exc}"
+            break
+    resultat['sortie'] = sortie.getvalue()
+    return resultat
+
 
 class Command(BaseCommand):
-    help = "Facture les abonnements mensuels avec contrôle des doublons par mois"
+    help = "Facture les échéances dues des abonnements (mensuels, trimestriels, annuels) avec contrôle des doublons"
 
     def add_arguments(self, parser):
-        parser.add_argument('--date', help="Date de simulation (format YYYY-MM-DD)")
+        parser.add_argument(
+            '--date',
+            help="Date de simulation (format YYYY-MM-DD) ; sans --from / --to, seule la période "
+                 "en cours est facturée"
+        )
+        parser.add_argument(
+            '--from', dest='date_debut',
+            help="Rattrapage : facturer les périodes dues commençant à partir de cette date (YYYY-MM-DD) ; "
+                 "un abonnement ayant encore des périodes dues antérieures n'est pas facturé (signalé)"
+        )
+        parser.add_argument(
+            '--to', dest='date_fin',
+            help="Rattrapage : facturer toutes les périodes dues jusqu'à cette date (YYYY-MM-DD)"
+        )
         parser.add_argument('--force', action='store_true', help="Forcer la facturation même si déjà faite")
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help="Nombre d'abonnements facturés par lot d'insertions (défaut : 1000)"
+        )
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help="Nombre de processus de facturation en parallèle (défaut : 1)"
+        )
+        parser.add_argument(
+            '--shard-by', choices=['immeuble', 'lot'],
+            help="Découpage en shards facturés chacun dans sa transaction : par immeuble ou par plage d'ID de lot"
+        )
+        parser.add_argument(
+            '--shards', type=int,
+            help="Nombre de plages d'ID de lot avec --shard-by lot (défaut : --workers)"
+        )
+        parser.add_argument(
+            '--shard', action='append', dest='shards_cibles', metavar='CLE',
+            help="Ne facturer que ce shard (ex: immeuble-3, lots-1-500) ; répétable, pour reprendre après un échec"
+        )
+        parser.add_argument(
+            '--profiler', action='store_true',
+            help="Mesurer requêtes SQL et durées (comme COMPTABILITE_PROFILAGE) et afficher un résumé"
+        )
 
     def handle(self, *args, **options):
+        with forcer() if options['profiler'] else nullcontext(), collecte() as mesures:
+            with profiler('facturation_copro'):
+                self.traiter(**options)
+        if mesures:
+            self.stdout.write(f"\n🔬 Profilage:")
+            for ligne in resume(mesures):
+                self.stdout.write(ligne)
+
+    def traiter(self, **options):
         try:
-            # Gestion de la date
+            # Gestion des dates
+            date_fin = options.get('date_fin') or options.get('date')
             aujourdhui = (
-                timezone.datetime.strptime(options['date'], '%Y-%m-%d').date() 
-                if options.get('date') 
+                timezone.datetime.strptime(date_fin, '%Y-%m-%d').date()
+                if date_fin
                 else timezone.now().date()
             )
+            date_debut = (
+                timezone.datetime.strptime(options['date_debut'], '%Y-%m-%d').date()
+                if options.get('date_debut')
+                else None
+            )
         except ValueError:
             self.stderr.write("❌ Format de date invalide. Utilisez YYYY-MM-DD")
             return
 
         debut_mois = aujourdhui.replace(day=1)
         fin_mois = (debut_mois + timedelta(days=32)).replace(day=1)
+        workers = max(1, options['workers'])
+        # Rattrapage explicite seulement : par défaut, seule la période en cours est facturée
+        rattrapage = bool(date_debut or options.get('date_fin'))
+
+        if date_debut:
+            self.stdout.write(f"\n📅 Rattrapage des abonnements du {date_debut} au {aujourdhui}")
+        elif rattrapage:
+            self.stdout.write(f"\n📅 Rattrapage des abonnements jusqu'au {aujourdhui}")
+        else:
+            self.stdout.write(f"\n📅 Traitement des abonnements pour {aujourdhui} (mois: {debut_mois} à {fin_mois})")
 
-        self.stdout.write(f"\n📅 Traitement des abonnements pour {aujourdhui} (mois: {debut_mois} à {fin_mois})")
+        exercice = ExerciceComptable.get_exercice_actuel()
+        if not exercice:
+            self.stderr.write("❌ Aucun exercice comptable actif!")
+            return
 
-        with transaction.atomic():
-            exercice = ExerciceComptable.get_exercice_actuel()
-            if not exercice:
-                self.stderr.write("❌ Aucun exercice comptable actif!")
-                return
+        compte_recette = compte(
+            "7111",
+            defaults={'libelle': 'Appels de fonds', 'type_compte': 'recette'}
+        )
+        compte_client = compte(
+            "3421",
+            defaults={'libelle': 'Copropriétaire individualisé', 'type_compte': 'actif'}
+        )
 
-            compte_recette, _ = Compte.objects.get_or_create(
-                compte="7111", 
-                defaults={'libelle': 'Appels de fonds', 'type_compte': 'recette'}
-            )
-            compte_client, _ = Compte.objects.get_or_create(
-                compte="3421", 
-                defaults={'libelle': 'Copropriétaire individualisé', 'type_compte': 'actif'}
+        compte_avance = compte(
+            "4421",
+            defaults={'libelle': 'Copropriétaire – avances', 'type_compte': 'passif'}
+        )
+
+        self.planifier_abonnements()
+
+        contexte = {
+            'aujourdhui': aujourdhui,
+            'date_debut': date_debut,
+            'rattrapage': rattrapage,
+            'exercice_id': exercice.pk,
+            'compte_recette_id': compte_recette.pk,
+            'compte_client_id': compte_client.pk,
+            'compte_avance_id': compte_avance.pk,
+            'force': options['force'],
+            'chunk_size': max(1, options['chunk_size']),
+        }
+
+        shard_by = options.get('shard_by') or ('immeuble' if workers > 1 else None)
+        shards = self.repartir(shard_by, options.get('shards') or workers)
+        if options.get('shards_cibles'):
+            shards = [(cle, filtre) for cle, filtre in shards if cle in options['shards_cibles']]
+
+        profilage = profiler_actif()
+        if workers > 1 and len(shards) > 1:
+            # Les connexions ne doivent pas être partagées avec les processus fils
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=_initialiser_processus) as executor:
+                resultats = list(executor.map(
+                    facturer_shard,
+                    [cle for cle, _ in shards],
+                    [filtre for _, filtre in shards],
+                    [contexte] * len(shards),
+                    [profilage] * len(shards)
+                ))
+            # Mesures des processus fils : ajoutées au résumé de la commande
+            with collecte() as mesures:
+                for resultat in resultats:
+                    mesures.extend(resultat.get('mesures', []))
+        else:
+            resultats = [facturer_shard(cle, filtre, contexte) for cle, filtre in shards]
+
+        total, existants, nouveaux, hors_exercice, en_retard, exclues = 0, 0, 0, 0, 0, 0
+        periodes = {}
+        echecs = []
+        for resultat in resultats:
+            self.stdout.write(resultat['sortie'], ending='')
+            if resultat['erreur']:
+                echecs.append(resultat)
+                continue
+            total += resultat['total']
+            existants += resultat['existants']
+            nouveaux += resultat['nouveaux']
+            hors_exercice += resultat['hors_exercice']
+            en_retard += resultat['en_retard']
+            exclues += resultat['exclues']
+            for periode, nombre in resultat['periodes'].items():
+                periodes[periode] = periodes.get(periode, 0) + nombre
+
+        self.stdout.write(f"\n📊 Récapitulatif:")
+        if shard_by:
+            self.stdout.write(f"• Shards traités       : {len(resultats) - len(echecs)}/{len(resultats)} (par {shard_by})")
+        self.stdout.write(f"• Factures trouvées    : {total}")
+        self.stdout.write(f"• Déjà facturés         : {existants}")
+        self.stdout.write(f"• Nouvelles facturations  : {nouveaux}")
+        if len(periodes) > 1 or rattrapage:
+            for periode in sorted(periodes):
+                self.stdout.write(f"    - {periode:%Y-%m} : {periodes[periode]}")
+        if hors_exercice:
+            self.stdout.write(f"• Hors exercice ouvert  : {hors_exercice} (échéances reportées)")
+        if exclues:
+            limite = f"au {date_debut}" if date_debut else "à la période en cours"
+            self.stdout.write(
+                f"• Périodes exclues      : {exclues} antérieure(s) {limite} sur {en_retard} abonnement(s), "
+                f"laissées dues (rattrapage : --from / --to)"
             )
 
-            compte_avance, _ = Compte.objects.get_or_create(
-                compte="4421", 
-                defaults={'libelle': 'Copropriétaire – avances', 'type_compte': 'passif'}
+        if echecs:
+            for resultat in echecs:
+                self.stderr.write(f"❌ Shard {resultat['cle']} annulé : {resultat['erreur']}")
+            reprise = " ".join(f"--shard {resultat['cle']}" for resultat in echecs)
+            self.stderr.write(f"🔁 Relancer les shards en échec avec : {reprise}")
+            return
+        self.stdout.write(f"🎯 Traitement terminé avec succès!")
+
+    def repartir(self, shard_by, nombre):
+        """Liste des shards (clé, filtre sur les abonnements) selon le mode de découpage"""
+        if not shard_by:
+            return [('tous', {})]
+
+        lots = Abonnement.objects.filter(actif=True, lot__isnull=False)
+        if shard_by == 'immeuble':
+            immeubles = lots.values_list('lot__immeuble_id', flat=True).distinct().order_by('lot__immeuble_id')
+            return [(f"immeuble-{pk}", {'abonnement__lot__immeuble_id': pk}) for pk in immeubles]
+
+        lot_ids = list(lots.values_list('lot_id', flat=True).distinct().order_by('lot_id'))
+        taille = -(-len(lot_ids) // max(1, nombre))
+        shards = []
+        for i in range(0, len(lot_ids), taille or 1):
+            premier, dernier = lot_ids[i], lot_ids[min(i + taille, len(lot_ids)) - 1]
+            shards.append((f"lots-{premier}-{dernier}", {'abonnement__lot_id__gte': premier, 'abonnement__lot_id__lte': dernier}))
+        return shards
+
+    def planifier_abonnements(self):
+        """Crée l'échéance des abonnements qui n'en ont pas encore (ex: créés en masse)"""
+        abonnements = Abonnement.objects.filter(echeance__isnull=True).only('pk', 'date_debut')
+        EcheanceAbonnement.objects.bulk_create(
+            [
+                EcheanceAbonnement(abonnement=abo, prochaine_echeance=abo.premiere_periode)
+                for abo in abonnements.iterator()
+            ],
+            batch_size=1000,
+            ignore_conflicts=True
+        )
+
+    def facturer_abonnements(self, filtre, aujourdhui, date_debut, exercice_id, compte_recette_id,
+                             compte_client_id, compte_avance_id, force, chunk_size, rattrapage=False):
+        """
+        Facture en une seule passe, dans une seule transaction, les périodes
+        dues des échéances correspondant au filtre : la période en cours, ou
+        avec `rattrapage` toutes les périodes dues jusqu'à `aujourdhui` (à
+        partir de `date_debut`). Un abonnement dont une période due précède
+        cette fenêtre n'est pas facturé : l'échéancier ne saute jamais une
+        période due.
+        """
+        with transaction.atomic(), session_saisie():
+            exercice_actuel = ExerciceComptable.objects.get(pk=exercice_id)
+            exercices = list(ExerciceComptable.objects.filter(est_ouvert=True, en_cloture=False))
+            comptes = Compte.objects.in_bulk([compte_recette_id, compte_client_id, compte_avance_id])
+            compte_recette = comptes[compte_recette_id]
+            compte_client = comptes[compte_client_id]
+            compte_avance = comptes[compte_avance_id]
+
+            echeances = EcheanceAbonnement.objects.filter(
+                abonnement__actif=True,
+                abonnement__date_debut__lte=aujourdhui,
+                abonnement__lot__isnull=False,
+                **filtre
             )
+            if force:
+                existants = 0
+            else:
+                # Contrôle des doublons : l'échéance d'un abonnement déjà facturé est dans le futur
+                existants = echeances.filter(
+                    derniere_periode__isnull=False,
+                    prochaine_echeance__gt=aujourdhui
+                ).count()
+                echeances = echeances.filter(prochaine_echeance__lte=aujourdhui).filter(
+                    models.Q(abonnement__date_fin__isnull=True) |
+                    models.Q(abonnement__date_fin__gte=models.F('prochaine_echeance'))
+                )
+            echeances = echeances.select_related('abonnement__lot').select_for_update(of=('self',)).order_by('pk')
 
-            # Préchargement des transactions existantes pour le mois
-            transactions_existantes = Transaction.objects.filter(
-                date_operation__gte=debut_mois,
-                date_operation__lt=fin_mois,
-                libelle__startswith="CONTRIBUTION MENSUELLE"
-            ).annotate(
-                annee=ExtractYear('date_operation'),
-                mois=ExtractMonth('date_operation')
-            ).values_list('libelle', 'annee', 'mois')
-
-            transactions_existantes = set(transactions_existantes)
-
-            abonnements = Abonnement.objects.filter(
-                frequence='mensuel',
-                actif=True,
-                date_debut__lte=aujourdhui
-            ).select_related('lot')
-
-            total, existants, nouveaux = 0, 0, 0
-
-            for abo in abonnements:
-                libelle = f"CONTRIBUTION MENSUELLE LOT#{abo.lot.code} - {aujourdhui.strftime('%Y-%m')}"
-                cle_doublon = (libelle, aujourdhui.year, aujourdhui.month)
-                total += 1
-
-                if not options['force'] and cle_doublon in transactions_existantes:
-                    self.stdout.write(f"⏭️ {str(abo.lot):5} : déjà facturé (mois en cours)")
-                    existants += 1
-                    continue
-
-                # Calcul du solde du compte avance pour ce lot
-                solde_avance = EcritureComptable.objects.filter(
-                    lot=abo.lot,
-                    compte=compte_avance
-                ).aggregate(
-                    solde=models.Sum(
-                        models.Case(
-                            models.When(type_ecriture='CR', then=models.F('montant')),
-                            models.When(type_ecriture='DB', then=-models.F('montant')),
-                            output_field=models.DecimalField()
+            # Préchargement du solde du compte avance de chaque lot, lu dans les soldes de lots
+            # (solde débiteur - créditeur : une avance est un solde négatif)
+            soldes_avance = {
+                lot_id: -solde
+                for lot_id, solde in SoldeLot.objects.filter(
+                    compte=compte_avance,
+                    lot__in=echeances.values('abonnement__lot_id')
+                ).values_list('lot_id', 'solde')
+            }
+
+            nouveaux, hors_exercice, en_retard, exclues = 0, 0, 0, 0
+            periodes_facturees = {}
+            a_facturer = []
+
+            for echeance in echeances.iterator(chunk_size=chunk_size):
+                abo = echeance.abonnement
+                if force:
+                    periodes = [abo.periode_contenant(aujourdhui)]
+                else:
+                    periodes = []
+                    periode = echeance.prochaine_echeance
+                    while periode <= aujourdhui and not (abo.date_fin and periode > abo.date_fin):
+                        periodes.append(periode)
+                        periode = abo.periode_suivante(periode)
+
+                    # Fenêtre du traitement : la période en cours, ou à partir de --from en rattrapage
+                    limite = date_debut if rattrapage else abo.periode_contenant(aujourdhui)
+                    anterieures = sum(1 for periode in periodes if limite and periode < limite)
+                    if anterieures:
+                        # Périodes dues hors fenêtre : l'abonnement reste dû en entier, signalé
+                        en_retard += 1
+                        exclues += anterieures
+                        self.stdout.write(
+                            f"⏸️ {str(abo.lot):5} : {anterieures} période(s) due(s) depuis "
+                            f"{periodes[0]:%Y-%m} hors de la fenêtre, non facturé"
                         )
+                        continue
+
+                for periode in periodes:
+                    if abo.date_fin and periode > abo.date_fin:
+                        break
+
+                    # Date d'opération : la date de traitement pour la période en cours,
+                    # sinon le début de la période rattrapée
+                    date_operation = aujourdhui if periode <= aujourdhui < abo.periode_suivante(periode) else periode
+                    exercice = next(
+                        (e for e in exercices if e.date_debut <= date_operation <= e.date_fin),
+                        exercice_actuel if date_operation == aujourdhui else None
+                    )
+                    if exercice is None:
+                        # Aucun exercice ouvert pour cette période : elle reste due
+                        hors_exercice += 1
+                        self.stdout.write(f"⚠️ {str(abo.lot):5} : aucun exercice ouvert pour {periode:%Y-%m}")
+                        break
+
+                    a_facturer.append((echeance, periode, date_operation, exercice))
+                    periodes_facturees[periode] = periodes_facturees.get(periode, 0) + 1
+
+                if len(a_facturer) >= chunk_size:
+                    nouveaux += self.facturer(
+                        a_facturer, soldes_avance,
+                        compte_recette, compte_client, compte_avance
                     )
-                )['solde'] or 0
+                    a_facturer = []
 
-                transac = Transaction.objects.create(
-                    date_operation=aujourdhui,
-                    libelle=libelle,
-                    exercice=exercice
+            if a_facturer:
+                nouveaux += self.facturer(
+                    a_facturer, soldes_avance,
+                    compte_recette, compte_client, compte_avance
                 )
 
-                if solde_avance >= abo.montant:
-                    # Le solde avance couvre la facture - on débite le compte avance
-                    EcritureComptable.objects.bulk_create([
-                        EcritureComptable(
-                            compte=compte_avance,
-                            montant=abo.montant,
-                            type_ecriture='DB',
-                            transaction=transac,
-                            lot=abo.lot
-                        ),
-                        EcritureComptable(
-                            compte=compte_recette,
-                            montant=abo.montant,
-                            type_ecriture='CR',
-                            transaction=transac
-                        )
-                    ])
-                    self.stdout.write(f"✅ {str(abo.lot):5} : {abo.montant:8.2f} MAD (payé par avance)")
-                else:
-                    # Le solde avance ne couvre pas la facture - on débite le compte client
-                    EcritureComptable.objects.bulk_create([
-                        EcritureComptable(
-                            compte=compte_client,
-                            montant=abo.montant,
-                            type_ecriture='DB',
-                            transaction=transac,
-                            lot=abo.lot
-                        ),
-                        EcritureComptable(
-                            compte=compte_recette,
-                            montant=abo.montant,
-                            type_ecriture='CR',
-                            transaction=transac
-                        )
-                    ])
-                    self.stdout.write(f"✅ {str(abo.lot):5} : {abo.montant:8.2f} MAD (facturé au client)")
+        if existants:
+            self.stdout.write(f"⏭️ {existants} abonnement(s) déjà facturé(s) pour la période en cours")
+        return {
+            'total': existants + nouveaux,
+            'existants': existants,
+            'nouveaux': nouveaux,
+            'periodes': periodes_facturees,
+            'hors_exercice': hors_exercice,
+            'en_retard': en_retard,
+            'exclues': exclues,
+        }
 
-                nouveaux += 1
+    def facturer(self, a_facturer, soldes_avance, compte_recette, compte_client, compte_avance):
+        """Construit en mémoire puis insère en masse les transactions et écritures d'un lot de périodes"""
+        transactions = Transaction.objects.bulk_create([
+            Transaction(
+                date_operation=date_operation,
+                libelle=echeance.abonnement.libelle_facturation(periode),
+                exercice=exercice
+            )
+            for echeance, periode, date_operation, exercice in a_facturer
+        ])
+        journaliser(transactions, Modification.CREATION)
 
-        self.stdout.write(f"\n📊 Récapitulatif:")
-        self.stdout.write(f"• Factures trouvées    : {total}")
-        self.stdout.write(f"• Déjà facturés         : {existants}")
-        self.stdout.write(f"• Nouvelles facturations  : {nouveaux}")
-        self.stdout.write(f"🎯 Traitement terminé avec succès!")
\ No newline at end of file
+        ecritures = []
+        for (echeance, periode, _, _), transac in zip(a_facturer, transactions):
+            abo = echeance.abonnement
+            solde_avance = soldes_avance.get(abo.lot_id) or 0
+
+            if solde_avance >= abo.montant:
+                # Le solde avance couvre la facture - on débite le compte avance
+                compte_debit = compte_avance
+                soldes_avance[abo.lot_id] = solde_avance - abo.montant
+                self.stdout.write(f"✅ {str(abo.lot):5} : {abo.montant:8.2f} MAD (payé par avance)")
+            else:
+                # Le solde avance ne couvre pas la facture - on débite le compte client
+                compte_debit = compte_client
+                self.stdout.write(f"✅ {str(abo.lot):5} : {abo.montant:8.2f} MAD (facturé au client)")
+
+            ecritures.append(EcritureComptable(
+                compte=compte_debit,
+                montant=abo.montant,
+                type_ecriture='DB',
+                transaction=transac,
+                lot=abo.lot
+            ))
+            ecritures.append(EcritureComptable(
+                compte=compte_recette,
+                montant=abo.montant,
+                type_ecriture='CR',
+                transaction=transac
+            ))
+
+            # Avancement de l'échéancier (jamais en arrière, même en mode --force)
+            if not echeance.derniere_periode or periode > echeance.derniere_periode:
+                echeance.derniere_periode = periode
+            echeance.prochaine_echeance = max(echeance.prochaine_echeance, abo.periode_suivante(periode))
+
+        creer_ecritures(ecritures)
+        EcheanceAbonnement.objects.bulk_update(
+            {echeance for echeance, _, _, _ in a_facturer},
+            ['prochaine_echeance', 'derniere_periode']
+        )
+        return len(transactions)
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from comptabilite.synthetique import generer_jeu
+
+
+class Command(BaseCommand):
+    help = "Génère un jeu de données synthétique (immeubles, lots, abonnements, exercices, écritures)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--immeubles', type=int, default=5, help="Nombre d'immeubles (défaut : 5)")
+        parser.add_argument('--lots', type=int, default=500, help="Nombre de lots (défaut : 500)")
+        parser.add_argument('--abonnements', type=int, help="Nombre d'abonnements (défaut : un par lot)")
+        parser.add_argument('--exercices', type=int, default=1, help="Nombre d'exercices consécutifs (défaut : 1)")
+        parser.add_argument('--ecritures', type=int, default=100000, help="Nombre total d'écritures (défaut : 100000)")
+        parser.add_argument('--annee', type=int, default=2100, help="Année du premier exercice (défaut : 2100)")
+        parser.add_argument(
+            '--actuel', action='store_true',
+            help="Le dernier exercice généré devient l'exercice actuel"
+        )
+        parser.add_argument('--graine', type=int, default=42, help="Graine aléatoire (défaut : 42)")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"\n🏗️ Génération du jeu synthétique...")
+        with transaction.atomic():
+            jeu = generer_jeu(
+                immeubles=options['immeubles'],
+                lots=options['lots'],
+                abonnements=options['abonnements'],
+                exercices=max(1, options['exercices']),
+                ecritures=options['ecritures'],
+                annee=options['annee'],
+                actuel=options['actuel'],
+                graine=options['graine'],
+                sortie=self.stdout
+            )
+        dernier = jeu['exercices'][-1]
+        self.stdout.write(f"🎯 Jeu généré : {jeu['ecritures']} écritures, exercice ouvert {dernier}")
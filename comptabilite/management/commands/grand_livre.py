@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from comptabilite.grand_livre import ecrire_csv, ecrire_xlsx, lignes_grand_livre
+from comptabilite.models import Compte, ExerciceComptable
+
+
+class Command(BaseCommand):
+    help = "Exporte en flux le grand livre d'un exercice (CSV ou XLSX), avec solde progressif par compte"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--exercice', type=int, help="ID de l'exercice (par défaut : exercice actuel)")
+        parser.add_argument(
+            '--compte', action='append', dest='comptes', metavar='NUMERO',
+            help="Numéro de compte à exporter (répétable ; par défaut : tous les comptes)"
+        )
+        parser.add_argument('--du', help="Date de début (YYYY-MM-DD)")
+        parser.add_argument('--au', help="Date de fin (YYYY-MM-DD)")
+        parser.add_argument('--format', choices=['csv', 'xlsx'], default='csv', help="Format de sortie (défaut : csv)")
+        parser.add_argument('--sortie', help="Fichier de sortie (par défaut : sortie standard, en CSV uniquement)")
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help="Nombre d'écritures lues par aller-retour avec la base (défaut : 2000)"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            date_debut, date_fin = (
+                timezone.datetime.strptime(options[cle], '%Y-%m-%d').date() if options.get(cle) else None
+                for cle in ('du', 'au')
+            )
+        except ValueError:
+            self.stderr.write("❌ Format de date invalide. Utilisez YYYY-MM-DD")
+            return
+
+        if options.get('exercice'):
+            exercice = ExerciceComptable.objects.filter(pk=options['exercice']).first()
+        else:
+            exercice = ExerciceComptable.get_exercice_actuel()
+        if not exercice:
+            self.stderr.write("❌ Exercice comptable introuvable!")
+            return
+
+        comptes = None
+        if options.get('comptes'):
+            comptes = list(Compte.objects.filter(compte__in=options['comptes']))
+            inconnus = set(options['comptes']) - {compte.compte for compte in comptes}
+            if inconnus:
+                self.stderr.write(f"❌ Compte(s) introuvable(s) : {', '.join(sorted(inconnus))}")
+                return
+
+        if options['format'] == 'xlsx' and not options.get('sortie'):
+            self.stderr.write("❌ L'export XLSX nécessite --sortie")
+            return
+
+        lignes = lignes_grand_livre(exercice, comptes, date_debut, date_fin, max(1, options['chunk_size']))
+        if options['format'] == 'xlsx':
+            ecrire_xlsx(lignes, options['sortie'])
+        elif options.get('sortie'):
+            with open(options['sortie'], 'w', newline='', encoding='utf-8') as fichier:
+                ecrire_csv(lignes, fichier)
+        else:
+            ecrire_csv(lignes, self.stdout)
+            return
+
+        self.stdout.write(f"✅ Grand livre de {exercice} écrit dans {options['sortie']}")
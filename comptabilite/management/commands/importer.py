@@ -0,0 +1,61 @@
+import os
+import time
+from django.core.management.base import BaseCommand
+from comptabilite.import_massif import TAILLE_TRANCHE, importer_par_tranches, lire_lignes
+from comptabilite.resources import CompteResource
+from patrimoine.resources import LotResource
+
+RESSOURCES = {
+    'comptes': CompteResource,
+    'lots': LotResource,
+}
+
+
+class Command(BaseCommand):
+    help = "Importe en flux et par tranches un gros fichier CSV ou XLSX (plan comptable ou lots)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('ressource', choices=sorted(RESSOURCES), help="Données à importer")
+        parser.add_argument('fichier', help="Fichier CSV ou XLSX (en-tête sur la première ligne)")
+        parser.add_argument('--format', choices=['csv', 'xlsx'], help="Format du fichier (par défaut : son extension)")
+        parser.add_argument('--delimiteur', default=',', help="Séparateur des colonnes CSV (défaut : ,)")
+        parser.add_argument(
+            '--taille', type=int, default=TAILLE_TRANCHE,
+            help=f"Nombre de lignes par tranche (défaut : {TAILLE_TRANCHE})"
+        )
+        parser.add_argument('--dry-run', action='store_true', help="Simulation : aucune modification enregistrée")
+
+    def handle(self, *args, **options):
+        format_fichier = options['format'] or ('xlsx' if options['fichier'].lower().endswith('.xlsx') else 'csv')
+        if not os.path.exists(options['fichier']):
+            self.stderr.write(f"❌ Fichier {options['fichier']} introuvable!")
+            return
+
+        debut = time.perf_counter()
+
+        def bilan(totaux):
+            return (
+                f"{totaux['new']} créées, {totaux['update']} modifiées, {totaux['skip']} inchangées, "
+                f"{totaux['error']} en erreur, {totaux['annulees']} annulées avec leur tranche"
+            )
+
+        def progression(traitees, totaux):
+            self.stdout.write(f"⏳ {traitees} lignes ({traitees / (time.perf_counter() - debut):.0f}/s) : {bilan(totaux)}")
+
+        mode = 'r' if format_fichier == 'csv' else 'rb'
+        # utf-8-sig : BOM des CSV exportés par Excel
+        with open(options['fichier'], mode, **({'encoding': 'utf-8-sig', 'newline': ''} if mode == 'r' else {})) as fichier:
+            totaux, erreurs = importer_par_tranches(
+                RESSOURCES[options['ressource']](),
+                lire_lignes(fichier, format_fichier, options['delimiteur']),
+                taille=options['taille'],
+                dry_run=options['dry_run'],
+                progression=progression
+            )
+
+        for numero, message in erreurs:
+            self.stderr.write(f"❌ Ligne {numero or '?'} : {message}")
+        simulation = " (simulation)" if options['dry_run'] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"🎯 Import terminé{simulation} en {time.perf_counter() - debut:.1f}s : {bilan(totaux)}"
+        ))
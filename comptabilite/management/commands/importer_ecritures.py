@@ -0,0 +1,53 @@
+import os
+import time
+from django.core.management.base import BaseCommand
+from comptabilite.import_ecritures import TAILLE_PAQUET, importer_ecritures
+from comptabilite.import_massif import lire_lignes
+
+
+class Command(BaseCommand):
+    help = "Importe en masse des lignes de journal (CSV ou XLSX) regroupées en transactions équilibrées"
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichier', help="Fichier CSV ou XLSX (colonnes : piece, date, libelle, compte, debit, credit, lot, immeuble, fournisseur)")
+        parser.add_argument('--format', choices=['csv', 'xlsx'], help="Format du fichier (par défaut : son extension)")
+        parser.add_argument('--delimiteur', default=',', help="Séparateur des colonnes CSV (défaut : ,)")
+        parser.add_argument(
+            '--taille', type=int, default=TAILLE_PAQUET,
+            help=f"Nombre de transactions insérées par paquet (défaut : {TAILLE_PAQUET})"
+        )
+        parser.add_argument('--tout-ou-rien', action='store_true', help="Annuler tout l'import à la première erreur")
+        parser.add_argument('--dry-run', action='store_true', help="Simulation : validation complète, rien n'est enregistré")
+
+    def handle(self, *args, **options):
+        format_fichier = options['format'] or ('xlsx' if options['fichier'].lower().endswith('.xlsx') else 'csv')
+        if not os.path.exists(options['fichier']):
+            self.stderr.write(f"❌ Fichier {options['fichier']} introuvable!")
+            return
+
+        debut = time.perf_counter()
+
+        def progression(lues, total):
+            self.stdout.write(
+                f"⏳ {lues} lignes ({lues / (time.perf_counter() - debut):.0f}/s), {total} transactions valides"
+            )
+
+        mode = 'r' if format_fichier == 'csv' else 'rb'
+        # utf-8-sig : BOM des CSV exportés par Excel
+        with open(options['fichier'], mode, **({'encoding': 'utf-8-sig', 'newline': ''} if mode == 'r' else {})) as fichier:
+            total, erreurs = importer_ecritures(
+                lire_lignes(fichier, format_fichier, options['delimiteur']),
+                taille=options['taille'],
+                tout_ou_rien=options['tout_ou_rien'],
+                dry_run=options['dry_run'],
+                progression=progression
+            )
+
+        for numero, message in erreurs:
+            self.stderr.write(f"❌ Ligne {numero} : {message}")
+        if options['dry_run'] or (options['tout_ou_rien'] and erreurs):
+            self.stdout.write(f"⚠️ Aucune transaction enregistrée ({total} valides, {len(erreurs)} rejetée(s))")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"🎯 {total} transactions importées en {time.perf_counter() - debut:.1f}s, {len(erreurs)} rejetée(s)"
+        ))
@@ -0,0 +1,47 @@
+import json
+import time
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from comptabilite.models import Modification
+from comptabilite.modifications import modifications_depuis
+
+
+class Command(BaseCommand):
+    help = (
+        "Diffuse dans l'ordre (JSON, une ligne par modification) le journal des modifications après un curseur, "
+        "hors modifications de moins de COMPTABILITE_DELAI_MODIFICATIONS secondes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=int, default=0, help="Dernier ID déjà reçu (défaut : 0, tout le journal)")
+        parser.add_argument(
+            '--modele', action='append', dest='modeles', choices=[cle for cle, _ in Modification.MODELE_CHOICES],
+            help="Modèle à diffuser (répétable ; par défaut : tous)"
+        )
+        parser.add_argument('--limite', type=int, help="Nombre maximal de modifications à diffuser")
+        parser.add_argument('--suivre', action='store_true', help="Continuer à diffuser les nouvelles modifications")
+        parser.add_argument(
+            '--intervalle', type=float, default=2.0,
+            help="Secondes entre deux lectures du journal avec --suivre (défaut : 2)"
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help="Nombre de modifications lues par aller-retour avec la base (défaut : 2000)"
+        )
+
+    def handle(self, *args, **options):
+        curseur, restant = options['since'], options['limite']
+        while True:
+            for modification in modifications_depuis(curseur, options['modeles'], restant).values(
+                'id', 'modele', 'objet_id', 'operation', 'donnees', 'date'
+            ).iterator(chunk_size=options['chunk_size']):
+                self.stdout.write(json.dumps(modification, cls=DjangoJSONEncoder))
+                curseur = modification['id']
+                if restant:
+                    restant -= 1
+            if not options['suivre'] or restant == 0:
+                break
+            time.sleep(options['intervalle'])
+
+        # Curseur à reprendre au prochain appel, hors du flux JSON
+        self.stderr.write(f"✅ Curseur : {curseur}")
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from comptabilite.releve import releves_immeuble, releves_lots
+from patrimoine.models import Immeuble
+
+
+class Command(BaseCommand):
+    help = "Relevé de compte copropriétaire d'un lot, ou de tous les lots d'un immeuble, sur une période"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--immeuble', required=True, help="Code de l'immeuble")
+        parser.add_argument('--lot', help="Code du lot (par défaut : tous les lots de l'immeuble)")
+        parser.add_argument('--du', help="Date de début (YYYY-MM-DD)")
+        parser.add_argument('--au', help="Date de fin (YYYY-MM-DD)")
+        parser.add_argument('--resume', action='store_true', help="N'afficher que les soldes, sans le détail des mouvements")
+
+    def handle(self, *args, **options):
+        try:
+            date_debut, date_fin = (
+                timezone.datetime.strptime(options[cle], '%Y-%m-%d').date() if options.get(cle) else None
+                for cle in ('du', 'au')
+            )
+        except ValueError:
+            self.stderr.write("❌ Format de date invalide. Utilisez YYYY-MM-DD")
+            return
+
+        immeuble = Immeuble.objects.filter(code=options['immeuble']).first()
+        if not immeuble:
+            self.stderr.write(f"❌ Immeuble {options['immeuble']} introuvable!")
+            return
+
+        if options.get('lot'):
+            lots = immeuble.lots.filter(code=options['lot'])
+            if not lots:
+                self.stderr.write(f"❌ Lot {options['lot']} introuvable dans l'immeuble {immeuble.code}!")
+                return
+            releves = releves_lots(lots, date_debut, date_fin)
+        else:
+            releves = releves_immeuble(immeuble, date_debut, date_fin)
+
+        periode = f"du {date_debut or '…'} au {date_fin or '…'}"
+        self.stdout.write(f"\n🧾 Relevés {immeuble} {periode}")
+        total = 0
+        for releve in releves.values():
+            total += releve['solde_cloture']
+            if options['resume']:
+                self.stdout.write(f"• {str(releve['lot']):25} : {releve['solde_cloture']:12.2f} MAD")
+                continue
+
+            self.stdout.write(f"\n🏠 {releve['lot']}")
+            self.stdout.write(f"{'':10} {'Solde d’ouverture':45} {'':12} {'':12} {releve['solde_ouverture']:12.2f}")
+            for ligne in releve['mouvements']:
+                self.stdout.write(
+                    f"{ligne['date']:%Y-%m-%d} {ligne['libelle'][:38]:38} {ligne['compte']:>6} "
+                    f"{ligne['debit']:12.2f} {ligne['credit']:12.2f} {ligne['solde']:12.2f}"
+                )
+            self.stdout.write(
+                f"{'':10} {'Solde de clôture':45} {releve['total_debit']:12.2f} "
+                f"{releve['total_credit']:12.2f} {releve['solde_cloture']:12.2f}"
+            )
+
+        self.stdout.write(f"\n📊 {len(releves)} lot(s), solde total : {total:.2f} MAD (positif : dû, négatif : avance)")
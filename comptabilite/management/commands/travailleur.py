@@ -0,0 +1,41 @@
+import os
+import socket
+import time
+from django.core.management.base import BaseCommand
+from comptabilite.taches import DELAI_REPRISE, executer, prendre
+
+
+class Command(BaseCommand):
+    help = "Exécute les tâches de fond en attente (clôtures d'exercice), reprises comprises"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--une-fois', action='store_true', help="S'arrêter quand la file est vide")
+        parser.add_argument(
+            '--intervalle', type=float, default=5.0,
+            help="Secondes entre deux lectures de la file quand elle est vide (défaut : 5)"
+        )
+        parser.add_argument(
+            '--delai-reprise', type=int, default=DELAI_REPRISE,
+            help=f"Secondes sans activité après lesquelles une tâche en cours est reprise (défaut : {DELAI_REPRISE})"
+        )
+        parser.add_argument('--nom', default=f"{socket.gethostname()}:{os.getpid()}", help="Nom du travailleur")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"👷 Travailleur {options['nom']} démarré")
+        while True:
+            tache = prendre(options['nom'], options['delai_reprise'])
+            if tache is None:
+                if options['une_fois']:
+                    break
+                time.sleep(options['intervalle'])
+                continue
+
+            reprise = f" (reprise à la phase {tache.etape + 1}/{tache.etapes})" if tache.etape else ""
+            self.stdout.write(f"⏳ {tache.libelle}{reprise}")
+            debut = time.perf_counter()
+            if executer(tache):
+                self.stdout.write(self.style.SUCCESS(f"✅ {tache.libelle} terminée en {time.perf_counter() - debut:.1f}s"))
+            else:
+                tache.refresh_from_db()
+                self.stderr.write(f"❌ {tache.libelle} : {tache.get_statut_display()}")
+        self.stdout.write("🎯 File vide")
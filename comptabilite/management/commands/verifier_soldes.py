@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from comptabilite.models import Compte, ExerciceComptable
+from patrimoine.models import Lot
+from comptabilite.soldes import verifier_soldes, verifier_soldes_lots
+
+class Command(BaseCommand):
+    help = "Vérifie les soldes stockés contre les écritures et les reconstruit si demandé"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--exercice', type=int, help="ID de l'exercice (par défaut : exercice actuel)")
+        parser.add_argument('--reconstruire', action='store_true', help="Corriger les soldes en écart")
+
+    def handle(self, *args, **options):
+        if options.get('exercice'):
+            exercice = ExerciceComptable.objects.filter(pk=options['exercice']).first()
+        else:
+            exercice = ExerciceComptable.get_exercice_actuel()
+        if not exercice:
+            self.stderr.write("❌ Exercice comptable introuvable!")
+            return
+
+        ecarts = verifier_soldes(exercice, reconstruire=options['reconstruire'])
+        comptes = Compte.objects.in_bulk([compte_id for compte_id, _, _ in ecarts])
+
+        self.stdout.write(f"\n🔎 Vérification des soldes de {exercice}")
+        for compte_id, stocke, calcule in ecarts:
+            stocke = f"{stocke:12.2f}" if stocke is not None else f"{'absent':>12}"
+            self.stdout.write(f"⚠️ {str(comptes[compte_id]):30} : stocké {stocke} / calculé {calcule:12.2f}")
+
+        if not ecarts:
+            self.stdout.write("✅ Aucun écart détecté")
+        elif options['reconstruire']:
+            self.stdout.write(f"🔧 {len(ecarts)} solde(s) reconstruit(s)")
+        else:
+            self.stdout.write(f"❌ {len(ecarts)} écart(s) détecté(s) — relancer avec --reconstruire")
+
+        ecarts_lots = verifier_soldes_lots(reconstruire=options['reconstruire'])
+        lots = Lot.objects.in_bulk([lot_id for lot_id, _, _, _ in ecarts_lots])
+        comptes = Compte.objects.in_bulk([compte_id for _, compte_id, _, _ in ecarts_lots])
+
+        self.stdout.write(f"\n🔎 Vérification des soldes de lots")
+        for lot_id, compte_id, stocke, calcule in ecarts_lots:
+            stocke = f"{stocke:12.2f}" if stocke is not None else f"{'absent':>12}"
+            self.stdout.write(
+                f"⚠️ {str(lots[lot_id]):20} {str(comptes[compte_id]):30} : stocké {stocke} / calculé {calcule:12.2f}"
+            )
+
+        if not ecarts_lots:
+            self.stdout.write("✅ Aucun écart détecté")
+        elif options['reconstruire']:
+            self.stdout.write(f"🔧 {len(ecarts_lots)} solde(s) de lot reconstruit(s)")
+        else:
+            self.stdout.write(f"❌ {len(ecarts_lots)} écart(s) détecté(s) — relancer avec --reconstruire")
@@ -0,0 +1,88 @@
+# Generated by Django 4.2.16 on 2026-10-18 19:24
+
+from datetime import date, datetime
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+
+
+PREFIXE_MENSUEL = "CONTRIBUTION MENSUELLE LOT#"
+MOIS_PAR_FREQUENCE = {'mensuel': 1, 'trimestriel': 3, 'annuel': 12}
+
+
+def periode_en_cours(abo, jour):
+    """Début de la période de l'abonnement (alignée sur son mois de début) qui contient `jour`"""
+    ecart = (jour.year - abo.date_debut.year) * 12 + jour.month - abo.date_debut.month
+    mois = abo.date_debut.year * 12 + abo.date_debut.month - 1 + ecart - ecart % MOIS_PAR_FREQUENCE[abo.frequence]
+    return date(mois // 12, mois % 12 + 1, 1)
+
+
+def creer_echeances(apps, schema_editor):
+    """
+    Initialise l'échéancier à partir des contributions mensuelles déjà
+    facturées. L'ancienne facturation ne traitait que le mois en cours des
+    abonnements mensuels : un abonnement sans facture retrouvée (dont tout
+    abonnement trimestriel ou annuel) démarre à la période en cours, et non
+    à sa date de début, faute de quoi la facturation par défaut le
+    signalerait « non facturé » jusqu'à un rattrapage. Les périodes
+    antérieures restent facturables par un rattrapage explicite (--from / --to).
+    """
+    Abonnement = apps.get_model('comptabilite', 'Abonnement')
+    EcheanceAbonnement = apps.get_model('comptabilite', 'EcheanceAbonnement')
+    Transaction = apps.get_model('comptabilite', 'Transaction')
+
+    # Dernier mois facturé par code de lot (ancien contrôle des doublons par libellé)
+    derniers_mois = {}
+    libelles = Transaction.objects.filter(libelle__startswith=PREFIXE_MENSUEL).values_list('libelle', flat=True)
+    for libelle in libelles.iterator():
+        code, _, mois = libelle[len(PREFIXE_MENSUEL):].rpartition(' - ')
+        try:
+            periode = datetime.strptime(mois, '%Y-%m').date()
+        except ValueError:
+            continue
+        derniers_mois[code] = max(periode, derniers_mois.get(code, periode))
+
+    aujourdhui = timezone.localdate()
+    echeances = []
+    for abo in Abonnement.objects.select_related('lot').iterator():
+        premiere_periode = abo.date_debut.replace(day=1)
+        derniere_periode = None
+        if abo.lot and abo.frequence == 'mensuel':
+            derniere_periode = derniers_mois.get(abo.lot.code.upper())
+        if derniere_periode and derniere_periode >= premiere_periode:
+            mois = derniere_periode.month % 12 + 1
+            annee = derniere_periode.year + (derniere_periode.month == 12)
+            prochaine_echeance = derniere_periode.replace(year=annee, month=mois)
+        else:
+            derniere_periode = None
+            prochaine_echeance = max(premiere_periode, periode_en_cours(abo, aujourdhui))
+        echeances.append(EcheanceAbonnement(
+            abonnement=abo,
+            prochaine_echeance=prochaine_echeance,
+            derniere_periode=derniere_periode
+        ))
+    EcheanceAbonnement.objects.bulk_create(echeances, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comptabilite', '0003_alter_fournisseur_telephone'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EcheanceAbonnement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prochaine_echeance', models.DateField(db_index=True, verbose_name='Prochaine échéance')),
+                ('derniere_periode', models.DateField(blank=True, null=True, verbose_name='Dernière période facturée')),
+                ('abonnement', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='echeance', to='comptabilite.abonnement', verbose_name='Abonnement')),
+            ],
+            options={
+                'verbose_name': "Échéance d'abonnement",
+                'verbose_name_plural': "Échéances d'abonnements",
+            },
+        ),
+        migrations.RunPython(creer_echeances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.16 on 2026-10-18 19:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def renseigner_exercice(apps, schema_editor):
+    EcritureComptable = apps.get_model('comptabilite', 'EcritureComptable')
+    Transaction = apps.get_model('comptabilite', 'Transaction')
+    EcritureComptable.objects.update(
+        exercice_id=models.Subquery(
+            Transaction.objects.filter(pk=models.OuterRef('transaction_id')).values('exercice_id')[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comptabilite', '0004_echeanceabonnement'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ecriturecomptable',
+            name='exercice',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ecritures', to='comptabilite.exercicecomptable', verbose_name='Exercice'),
+        ),
+        migrations.RunPython(renseigner_exercice, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='ecriturecomptable',
+            index=models.Index(fields=['compte', 'exercice', 'type_ecriture'], name='comptabilit_compte__5fe8e4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ecriturecomptable',
+            index=models.Index(fields=['lot', 'compte'], name='comptabilit_lot_id_1539af_idx'),
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 4.2.16 on 2026-10-18 19:40
+
+import decimal
+
+from django.db import migrations, models
+
+
+def renseigner_totaux(apps, schema_editor):
+    """
+    Renseigne les totaux débit / crédit depuis les écritures. Dans les
+    exercices ouverts, le solde actuel est aussi recalculé (solde initial +
+    débit - crédit) et les soldes manquants sont créés : les écritures ne
+    font plus ensuite qu'ajouter leur montant aux soldes, un écart antérieur
+    se perpétuerait. Les exercices clôturés gardent leur solde arrêté.
+    """
+    EcritureComptable = apps.get_model('comptabilite', 'EcritureComptable')
+    ExerciceComptable = apps.get_model('comptabilite', 'ExerciceComptable')
+    SoldeExerciceCompte = apps.get_model('comptabilite', 'SoldeExerciceCompte')
+
+    montant = models.DecimalField(max_digits=14, decimal_places=2)
+    centimes = decimal.Decimal('0.01')
+    zero = decimal.Decimal('0.00')
+
+    def total(type_ecriture):
+        return models.Sum(
+            models.Case(
+                models.When(type_ecriture=type_ecriture, then=models.F('montant')),
+                default=models.Value(0),
+                output_field=montant
+            ),
+            output_field=montant
+        )
+
+    # SQLite somme en flottants : totaux ramenés au centime
+    totaux = {
+        (t['compte_id'], t['exercice_id']): (
+            decimal.Decimal(t['debit'] or 0).quantize(centimes),
+            decimal.Decimal(t['credit'] or 0).quantize(centimes),
+        )
+        for t in EcritureComptable.objects.values('compte_id', 'exercice_id')
+        .annotate(debit=total('DB'), credit=total('CR')).order_by().iterator()
+    }
+    ouverts = set(ExerciceComptable.objects.filter(est_ouvert=True).values_list('pk', flat=True))
+
+    soldes = []
+    for solde in SoldeExerciceCompte.objects.iterator():
+        solde.total_debit, solde.total_credit = totaux.pop((solde.compte_id, solde.exercice_id), (zero, zero))
+        if solde.exercice_id in ouverts:
+            solde.solde_actuel = decimal.Decimal(solde.solde_initial) + solde.total_debit - solde.total_credit
+        soldes.append(solde)
+    SoldeExerciceCompte.objects.bulk_update(
+        soldes, ['solde_actuel', 'total_debit', 'total_credit'], batch_size=1000
+    )
+    SoldeExerciceCompte.objects.bulk_create((
+        SoldeExerciceCompte(
+            compte_id=compte_id, exercice_id=exercice_id,
+            total_debit=debit, total_credit=credit, solde_actuel=debit - credit
+        )
+        for (compte_id, exercice_id), (debit, credit) in totaux.items() if exercice_id in ouverts
+    ), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comptabilite', '0005_ecriturecomptable_exercice'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='soldeexercicecompte',
+            name='total_credit',
+            field=models.DecimalField(decimal_places=2, default=0.0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='soldeexercicecompte',
+            name='total_debit',
+            field=models.DecimalField(decimal_places=2, default=0.0, max_digits=14),
+        ),
+        migrations.RunPython(renseigner_totaux, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 4.2.16 on 2026-10-18 19:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def creer_soldes_lots(apps, schema_editor):
+    EcritureComptable = apps.get_model('comptabilite', 'EcritureComptable')
+    SoldeLot = apps.get_model('comptabilite', 'SoldeLot')
+
+    montant = models.DecimalField(max_digits=14, decimal_places=2)
+
+    def total(type_ecriture):
+        return models.Sum(
+            models.Case(
+                models.When(type_ecriture=type_ecriture, then=models.F('montant')),
+                default=models.Value(0),
+                output_field=montant
+            ),
+            output_field=montant
+        )
+
+    totaux = (
+        EcritureComptable.objects.filter(lot__isnull=False)
+        .values('lot_id', 'compte_id')
+        .annotate(debit=total('DB'), credit=total('CR'))
+        .order_by()
+    )
+    SoldeLot.objects.bulk_create(
+        (
+            SoldeLot(
+                lot_id=t['lot_id'],
+                compte_id=t['compte_id'],
+                total_debit=t['debit'],
+                total_credit=t['credit'],
+                solde=t['debit'] - t['credit']
+            )
+            for t in totaux.iterator()
+        ),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patrimoine', '0001_initial'),
+        ('comptabilite', '0006_soldeexercicecompte_totaux'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SoldeLot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_debit', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('total_credit', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('solde', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('compte', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='soldes_lot', to='comptabilite.compte', verbose_name='Compte comptable')),
+                ('lot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='soldes', to='patrimoine.lot', verbose_name='Lot')),
+            ],
+            options={
+                'verbose_name': 'Solde de lot',
+                'verbose_name_plural': 'Soldes de lots',
+                'unique_together': {('lot', 'compte')},
+            },
+        ),
+        migrations.RunPython(creer_soldes_lots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.16 on 2026-10-18 19:51
+
+import django.core.serializers.json
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comptabilite', '0007_soldelot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Modification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modele', models.CharField(choices=[('ecriture', 'Écriture comptable'), ('transaction', 'Transaction'), ('solde', "Solde d'exercice")], max_length=20, verbose_name='Modèle')),
+                ('objet_id', models.BigIntegerField(verbose_name="ID de l'objet")),
+                ('operation', models.CharField(choices=[('creation', 'Création'), ('modification', 'Modification'), ('suppression', 'Suppression')], max_length=20, verbose_name='Opération')),
+                ('donnees', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='Données')),
+                ('date', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Date')),
+            ],
+            options={
+                'verbose_name': 'Modification',
+                'verbose_name_plural': 'Modifications',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['modele', 'id'], name='comptabilit_modele_54ee32_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.16 on 2026-10-18 20:28
+
+import django.core.serializers.json
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comptabilite', '0008_modification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('cloture_exercice', "Clôture d'exercice")], max_length=50, verbose_name='Type')),
+                ('libelle', models.CharField(max_length=255, verbose_name='Libellé')),
+                ('parametres', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='Paramètres')),
+                ('statut', models.CharField(choices=[('en_attente', 'En attente'), ('en_cours', 'En cours'), ('terminee', 'Terminée'), ('echec', 'Échec')], default='en_attente', max_length=20, verbose_name='Statut')),
+                ('etape', models.PositiveIntegerField(default=0, verbose_name='Phases terminées')),
+                ('etapes', models.PositiveIntegerField(default=0, verbose_name='Nombre de phases')),
+                ('phase', models.CharField(blank=True, max_length=100, verbose_name='Phase en cours')),
+                ('etat', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='État')),
+                ('erreur', models.TextField(blank=True, verbose_name='Erreur')),
+                ('tentatives', models.PositiveIntegerField(default=0, verbose_name='Tentatives')),
+                ('travailleur', models.CharField(blank=True, max_length=100, verbose_name='Travailleur')),
+                ('date_creation', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Créée le')),
+                ('date_debut', models.DateTimeField(blank=True, null=True, verbose_name='Démarrée le')),
+                ('date_fin', models.DateTimeField(blank=True, null=True, verbose_name='Terminée le')),
+                ('date_activite', models.DateTimeField(blank=True, null=True, verbose_name='Dernière activité')),
+            ],
+            options={
+                'verbose_name': 'Tâche',
+                'verbose_name_plural': 'Tâches',
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['statut', 'id'], name='comptabilit_statut_0889d3_idx')],
+            },
+        ),
+    ]
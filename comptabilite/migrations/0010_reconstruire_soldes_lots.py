@@ -0,0 +1,55 @@
+import decimal
+
+from django.db import migrations, models
+
+
+def reconstruire_soldes_lots(apps, schema_editor):
+    """
+    Reconstruit SoldeLot depuis les écritures : les bases alimentées par
+    insertion brute (jeu synthétique) après 0007 n'ont aucun solde de lot.
+    """
+    EcritureComptable = apps.get_model('comptabilite', 'EcritureComptable')
+    SoldeLot = apps.get_model('comptabilite', 'SoldeLot')
+
+    montant = models.DecimalField(max_digits=14, decimal_places=2)
+    centimes = decimal.Decimal('0.01')
+
+    def total(type_ecriture):
+        return models.Sum(
+            models.Case(
+                models.When(type_ecriture=type_ecriture, then=models.F('montant')),
+                default=models.Value(0),
+                output_field=montant
+            ),
+            output_field=montant
+        )
+
+    totaux = (
+        EcritureComptable.objects.filter(lot__isnull=False)
+        .values('lot_id', 'compte_id')
+        .annotate(debit=total('DB'), credit=total('CR'))
+        .order_by()
+    )
+
+    def solde_lot(t):
+        # SQLite somme en flottants : totaux ramenés au centime
+        debit = decimal.Decimal(t['debit'] or 0).quantize(centimes)
+        credit = decimal.Decimal(t['credit'] or 0).quantize(centimes)
+        return SoldeLot(
+            lot_id=t['lot_id'], compte_id=t['compte_id'],
+            total_debit=debit, total_credit=credit, solde=debit - credit
+        )
+
+    SoldeLot.objects.all().delete()
+    SoldeLot.objects.bulk_create((solde_lot(t) for t in totaux.iterator()), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comptabilite', '0009_tache'),
+    ]
+
+    operations = [
+        migrations.RunPython(reconstruire_soldes_lots, migrations.RunPython.noop),
+    ]
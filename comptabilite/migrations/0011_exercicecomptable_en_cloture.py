@@ -0,0 +1,24 @@
+# Generated by Django 4.2.16 on 2026-10-18 20:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comptabilite', '0010_reconstruire_soldes_lots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exercicecomptable',
+            name='en_cloture',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='exercice',
+            field=models.ForeignKey(limit_choices_to={'en_cloture': False, 'est_ouvert': True}, on_delete=django.db.models.deletion.CASCADE, related_name='transactions_exercice', to='comptabilite.exercicecomptable'),
+        ),
+    ]
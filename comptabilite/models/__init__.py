@@ -3,8 +3,12 @@ from .exercice_comptable import ExerciceComptable
 from .transaction import Transaction
 from .ecriture_comptable import EcritureComptable
 from .solde_exercice_compte import SoldeExerciceCompte
+from .solde_lot import SoldeLot
 from .fournisseur import Fournisseur
 from .abonnement import Abonnement
+from .echeance_abonnement import EcheanceAbonnement
+from .modification import Modification
+from .tache import Tache
 
 __all__ = [
     'Compte',
@@ -12,6 +16,10 @@ __all__ = [
     'Transaction',
     'EcritureComptable',
     'SoldeExerciceCompte',
+    'SoldeLot',
     'Abonnement',
+    'EcheanceAbonnement',
+    'Modification',
+    'Tache',
     'Fournisseur',
 ]
\ No newline at end of file
@@ -1,11 +1,23 @@
 from django.db import models
 
+
+def ajouter_mois(jour, mois):
+    """Premier jour du mois situé `mois` mois après celui de `jour`"""
+    mois = jour.year * 12 + jour.month - 1 + mois
+    return jour.replace(year=mois // 12, month=mois % 12 + 1, day=1)
+
+
 class Abonnement(models.Model):
     FREQUENCE_CHOICES = [
         ('mensuel', 'Mensuel'),
         ('trimestriel', 'Trimestriel'),
         ('annuel', 'Annuel'),
     ]
+    MOIS_PAR_FREQUENCE = {
+        'mensuel': 1,
+        'trimestriel': 3,
+        'annuel': 12,
+    }
 
     lot = models.ForeignKey(
         'patrimoine.Lot',
@@ -43,6 +55,24 @@ class Abonnement(models.Model):
     def __str__(self):
         return f"Abonnement {self.frequence} - {self.lot} ({self.montant}MAD)"
 
+    @property
+    def premiere_periode(self):
+        """Les périodes sont alignées sur le mois de début de l'abonnement"""
+        return self.date_debut.replace(day=1)
+
+    def periode_suivante(self, periode):
+        return ajouter_mois(periode, self.MOIS_PAR_FREQUENCE[self.frequence])
+
+    def periode_contenant(self, jour):
+        """Début de la période de facturation qui contient `jour`"""
+        pas = self.MOIS_PAR_FREQUENCE[self.frequence]
+        ecart = (jour.year - self.date_debut.year) * 12 + jour.month - self.date_debut.month
+        return ajouter_mois(self.premiere_periode, ecart - ecart % pas)
+
+    def libelle_facturation(self, periode):
+        frequence = {'mensuel': 'MENSUELLE', 'trimestriel': 'TRIMESTRIELLE', 'annuel': 'ANNUELLE'}[self.frequence]
+        return f"CONTRIBUTION {frequence} LOT#{self.lot.code} - {periode.strftime('%Y-%m')}".upper()
+
     class Meta:
         verbose_name = "Abonnement"
         verbose_name_plural = "Abonnements"
\ No newline at end of file
@@ -2,6 +2,7 @@ from django.db import models
 from django.core.exceptions import ValidationError
 from django.db.models import Sum
 import decimal
+from ..profilage import profile
 
 class Compte(models.Model):
     compte = models.CharField(max_length=20, unique=True)
@@ -36,16 +37,17 @@ class Compte(models.Model):
         solde_exercice, _ = self.get_solde_exercice(exercice)
         return solde_exercice.solde_initial
 
+    @profile('mettre_a_jour_solde')
     def mettre_a_jour_solde(self, exercice):
         solde_exercice, _ = self.get_solde_exercice(exercice)
         total_debit = self.ecritures.filter(
             type_ecriture='DB', 
-            transaction__exercice=exercice
+            exercice=exercice
         ).aggregate(Sum('montant'))['montant__sum'] or decimal.Decimal(0.0)
         
         total_credit = self.ecritures.filter(
             type_ecriture='CR', 
-            transaction__exercice=exercice
+            exercice=exercice
         ).aggregate(Sum('montant'))['montant__sum'] or decimal.Decimal(0.0)
         
         solde_exercice.solde_actuel = (
@@ -53,4 +55,6 @@ class Compte(models.Model):
             decimal.Decimal(total_debit) - 
             decimal.Decimal(total_credit)
         )
+        solde_exercice.total_debit = total_debit
+        solde_exercice.total_credit = total_credit
         solde_exercice.save()
\ No newline at end of file
@@ -0,0 +1,30 @@
+from django.db import models
+from .abonnement import Abonnement
+
+class EcheanceAbonnement(models.Model):
+    """
+    Échéancier de facturation d'un abonnement : prochaine période à facturer
+    et dernière période facturée (contrôle des doublons par clé).
+    """
+    abonnement = models.OneToOneField(
+        Abonnement,
+        on_delete=models.CASCADE,
+        related_name='echeance',
+        verbose_name="Abonnement"
+    )
+    prochaine_echeance = models.DateField(
+        db_index=True,
+        verbose_name="Prochaine échéance"
+    )
+    derniere_periode = models.DateField(
+        null=True,
+        blank=True,
+        verbose_name="Dernière période facturée"
+    )
+
+    class Meta:
+        verbose_name = "Échéance d'abonnement"
+        verbose_name_plural = "Échéances d'abonnements"
+
+    def __str__(self):
+        return f"{self.abonnement} - prochaine échéance {self.prochaine_echeance}"
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.exceptions import ValidationError
 from patrimoine.models import Lot
 from .compte import Compte
@@ -28,6 +28,16 @@ class EcritureComptable(models.Model):
         related_name='ecritures',
         verbose_name="Transaction liée"
     )
+    # Copie de transaction.exercice : évite la jointure sur Transaction dans
+    # les agrégats par exercice (synchronisée par save / creer_ecritures)
+    exercice = models.ForeignKey(
+        'ExerciceComptable',
+        on_delete=models.CASCADE,
+        related_name='ecritures',
+        null=True,
+        editable=False,
+        verbose_name="Exercice"
+    )
     
     # Références aux tiers
     lot = models.ForeignKey(
@@ -51,10 +61,34 @@ class EcritureComptable(models.Model):
         verbose_name = "Écriture comptable"
         verbose_name_plural = "Écritures comptables"
         ordering = ['-transaction__id']
-        
+        indexes = [
+            models.Index(fields=['compte', 'exercice', 'type_ecriture']),
+            models.Index(fields=['lot', 'compte']),
+        ]
+
     def __str__(self):
         return f"{self.compte} - {self.get_type_ecriture_display()} - {self.montant}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Mémorise l'état en base pour que le signal n'applique que la différence
+        instance._etat_initial = instance.etat_comptable()
+        return instance
+
+    def etat_comptable(self):
+        """Champs qui déterminent l'impact de l'écriture sur les soldes"""
+        deferred = self.get_deferred_fields()
+        if deferred & {'compte_id', 'exercice_id', 'type_ecriture', 'montant', 'lot_id'}:
+            return None
+        return (self.compte_id, self.exercice_id, self.type_ecriture, self.montant, self.lot_id)
+
+    def save(self, *args, **kwargs):
+        self.exercice_id = self.transaction.exercice_id
+        # Écriture, soldes et journal des modifications (signaux) validés ensemble
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     def clean(self):
         """Validation des règles métiers"""
         # Un seul tiers autorisé (lot OU fournisseur)
@@ -1,14 +1,40 @@
 from django.db import models, transaction
 from django.db.models import Sum, F
 from django.core.exceptions import ValidationError
+from contextlib import contextmanager
 import decimal
+import logging
+import time
 from datetime import timedelta
+from ..cache_rapports import en_cache, nouvelle_version
+from ..profilage import profile
+
+logger = logging.getLogger(__name__)
+
+CENTIMES = decimal.Decimal('0.01')
+# Nombre de comptes par UPDATE lors de la propagation des écarts de report
+TAILLE_ECARTS = 500
+# Nombre de comptes reportés par étape de la phase report_soldes (chaque étape est validée à part)
+TAILLE_REPORT = 1000
+
+
+@contextmanager
+def _chronometre(rapport, phase):
+    debut = time.perf_counter()
+    try:
+        yield
+    finally:
+        rapport[phase] = time.perf_counter() - debut
+
 
 class ExerciceComptable(models.Model):
     date_debut = models.DateField()
     date_fin = models.DateField()
     est_ouvert = models.BooleanField(default=True)
     est_actuel = models.BooleanField(default=False)
+    # Clôture engagée (première phase passée), ou exercice créé par une clôture dont
+    # les soldes ne sont pas encore reportés : plus aucune écriture n'est acceptée
+    en_cloture = models.BooleanField(default=False)
 
     class Meta:
         constraints = [
@@ -24,127 +50,334 @@ class ExerciceComptable(models.Model):
 
     @staticmethod
     def get_exercice_actuel():
-        return ExerciceComptable.objects.filter(est_actuel=True).first()
+        from ..referentiel import exercice_actuel
+        return exercice_actuel()
 
+    # Phases de la clôture, dans l'ordre (voir executer_phase_cloture)
+    PHASES_CLOTURE = ('soldes', 'cloture_produits_charges', 'report_resultat', 'creation_exercice', 'report_soldes')
+
+    @profile('close_exercice')
     def close_exercice(self):
-        from .compte import Compte
-        from .transaction import Transaction
-        from .ecriture_comptable import EcritureComptable
-        
+        from ..soldes import session_saisie
+
         if not self.est_ouvert:
             raise ValidationError(f"L'exercice {self} est déjà clôturé.")
 
-        with transaction.atomic():            
-            compte_resultat_classe8 = Compte.objects.get(compte="890")
-            self.clore_comptes_produits_charges(compte_resultat_classe8)
-            compte_resultat_classe1 = Compte.objects.get(compte="119")
-            self.reporter_resultat_net(
-                self.calculer_resultat_net(), 
-                compte_resultat_classe8, 
-                compte_resultat_classe1
-            )
-            
-            new_exercice = ExerciceComptable.objects.create(
-                date_debut=self.date_fin + timedelta(days=1),
-                date_fin=self.date_fin + timedelta(days=365),
-                est_ouvert=True
-            )
-            
-            self.report_soldes_comptes(new_exercice)
+        # Durée (en secondes) de chaque phase de la clôture
+        self.rapport_cloture = rapport = {}
+
+        with transaction.atomic():
+            etat = {}
+            for phase in self.PHASES_CLOTURE:
+                # Une session par phase, comme en tâche de fond : chaque phase part
+                # des soldes mis à jour par la précédente (recalcul compris dans sa durée)
+                with _chronometre(rapport, phase), session_saisie():
+                    while not self.executer_phase_cloture(phase, etat):
+                        pass
+
             self.est_ouvert = False
+            self.en_cloture = False
             self.save()
-            
-        return new_exercice
 
-    def report_soldes_comptes(self, exercice_suivant):
+        logger.info(
+            "Clôture de %s : %s", self,
+            ", ".join(f"{phase}={duree:.3f}s" for phase, duree in rapport.items())
+        )
+        return ExerciceComptable.objects.get(pk=etat['nouvel_exercice'])
+
+    def executer_phase_cloture(self, phase, etat):
+        """
+        Exécute une phase de la clôture. `etat`, sérialisable en JSON, porte
+        d'une phase à l'autre les soldes des comptes (mis à jour des écritures
+        de clôture) et l'ID du nouvel exercice : c'est le point de reprise de
+        la clôture en tâche de fond (voir comptabilite/taches.py). Retourne
+        False si la phase n'est pas terminée et doit être rappelée (report
+        des soldes par tranches de comptes).
+
+        La première phase met l'exercice en clôture : les soldes calculés ne
+        peuvent plus être contredits par une écriture passée entre deux phases.
+        L'exercice suivant créé par la clôture reste en clôture jusqu'à la fin
+        du report des soldes, qui écrase ses soldes.
+        Si l'exercice suivant existe déjà (créé à la main, ou clôture après
+        réouverture), il est repris et seuls les écarts de report sont
+        propagés (`propager_ecarts_reports`) : ses mouvements sont conservés.
+        """
+        from ..referentiel import compte
         from .compte import Compte
+
+        termine = True
+        if phase == 'soldes':
+            self.en_cloture = True
+            self.save(update_fields=['en_cloture'])
+            soldes = self.calculer_soldes_comptes()
+        else:
+            soldes = {int(compte_id): decimal.Decimal(solde) for compte_id, solde in etat['soldes'].items()}
+
+        if phase == 'cloture_produits_charges':
+            self.clore_comptes_produits_charges(compte("890"), soldes)
+        elif phase == 'report_resultat':
+            self.reporter_resultat_net(self.calculer_resultat_net(), compte("890"), compte("119"), soldes)
+        elif phase == 'creation_exercice':
+            suivant = self.exercices_suivants().first()
+            etat['report_differentiel'] = suivant is not None
+            if suivant is None:
+                # Créé en clôture : une écriture passée avant le report des soldes serait écrasée par celui-ci
+                suivant = ExerciceComptable.objects.create(
+                    date_debut=self.date_fin + timedelta(days=1),
+                    date_fin=self.date_fin + timedelta(days=365),
+                    est_ouvert=True,
+                    en_cloture=True
+                )
+            etat['nouvel_exercice'] = suivant.pk
+        elif phase == 'report_soldes' and etat.get('report_differentiel'):
+            self.propager_ecarts_reports()
+        elif phase == 'report_soldes':
+            comptes = list(
+                Compte.objects.filter(type_compte__in=['actif', 'passif'], pk__gt=etat.get('report_depuis', 0))
+                .order_by('pk').values_list('pk', flat=True)[:TAILLE_REPORT + 1]
+            )
+            termine = len(comptes) <= TAILLE_REPORT
+            comptes = comptes[:TAILLE_REPORT]
+            suivant = ExerciceComptable.objects.get(pk=etat['nouvel_exercice'])
+            self.report_soldes_comptes(suivant, soldes, comptes)
+            if comptes:
+                etat['report_depuis'] = comptes[-1]
+            if termine and suivant.en_cloture:
+                # Soldes reportés : le nouvel exercice accepte les écritures
+                suivant.en_cloture = False
+                suivant.save(update_fields=['en_cloture'])
+
+        etat['soldes'] = {str(compte_id): str(solde) for compte_id, solde in soldes.items()}
+        return termine
+
+    def exercices_suivants(self):
+        """Exercices postérieurs à celui-ci, dans l'ordre chronologique"""
+        return ExerciceComptable.objects.filter(date_debut__gt=self.date_fin).order_by('date_debut')
+
+    def rouvrir(self):
+        """Rouvre un exercice clôturé pour y passer des écritures d'ajustement ; `recloturer` le referme"""
+        if self.est_ouvert:
+            raise ValidationError(f"L'exercice {self} n'est pas clôturé.")
+        self.est_ouvert = True
+        self.save()
+
+    @profile('recloturer')
+    def recloturer(self):
+        """
+        Referme un exercice rouvert. Seuls les ajustements sont traités : les
+        soldes restants des comptes de produits et charges sont soldés et
+        leur résultat reporté, puis l'écart de chaque compte de bilan modifié
+        est propagé aux exercices suivants (`propager_ecarts_reports`). Le
+        coût dépend du nombre de comptes ajustés, pas du volume du grand
+        livre. Retourne les écarts propagés {compte_id: montant}.
+        """
+        from ..referentiel import compte
+        from ..soldes import session_saisie
         from .solde_exercice_compte import SoldeExerciceCompte
-        
-        comptes = Compte.objects.filter(type_compte__in=['actif', 'passif'])
-        for compte in comptes:
-            solde_final = compte.get_solde_actuel(self)
-            SoldeExerciceCompte.objects.update_or_create(
-                compte=compte, 
-                exercice=exercice_suivant,
-                defaults={
-                    'solde_initial': solde_final, 
-                    'solde_actuel': solde_final
-                }
+
+        if not self.est_ouvert:
+            raise ValidationError(f"L'exercice {self} n'est pas rouvert.")
+        if not self.exercices_suivants().exists():
+            raise ValidationError(f"L'exercice {self} n'a jamais été clôturé : utiliser la clôture.")
+
+        with transaction.atomic():
+            with session_saisie():
+                # Soldes laissés par les ajustements sur les comptes de produits et charges
+                residus = dict(
+                    SoldeExerciceCompte.objects.filter(exercice=self, compte__type_compte__in=['recette', 'depense'])
+                    .exclude(solde_actuel=0).values_list('compte_id', 'solde_actuel')
+                )
+                if residus:
+                    compte_resultat_classe8 = compte("890")
+                    resultat_net = -sum(residus.values())
+                    self.clore_comptes_produits_charges(compte_resultat_classe8, residus)
+                    if resultat_net:
+                        self.reporter_resultat_net(resultat_net, compte_resultat_classe8, compte("119"))
+
+            # Soldes de l'exercice à jour (sortie de session) : écarts reportés
+            ecarts = self.propager_ecarts_reports()
+            self.est_ouvert = False
+            self.save()
+
+        logger.info("Reclôture de %s : %d compte(s) reporté(s)", self, len(ecarts))
+        return ecarts
+
+    def propager_ecarts_reports(self):
+        """
+        Reporte sur tous les exercices suivants l'écart entre le solde final
+        des comptes de bilan et leur solde initial dans l'exercice suivant :
+        une requête sélectionne les comptes en écart, puis un UPDATE par
+        tranche de comptes décale solde initial et solde actuel sur tous les
+        exercices suivants (clôturés compris). Retourne les écarts
+        {compte_id: montant}.
+        """
+        from django.db.models import Case, DecimalField, OuterRef, Subquery, Value, When
+        from django.db.models.functions import Coalesce
+        from ..modifications import journaliser, journaliser_soldes
+        from .modification import Modification
+        from .solde_exercice_compte import SoldeExerciceCompte
+
+        suivants = list(self.exercices_suivants().values_list('pk', flat=True))
+        if not suivants:
+            return {}
+
+        montant = DecimalField(max_digits=12, decimal_places=2)
+        reporte = SoldeExerciceCompte.objects.filter(
+            exercice_id=suivants[0], compte=OuterRef('compte')
+        ).values('solde_initial')
+        lignes = (
+            SoldeExerciceCompte.objects.filter(exercice=self, compte__type_compte__in=['actif', 'passif'])
+            .annotate(reporte=Coalesce(Subquery(reporte), Value(decimal.Decimal(0)), output_field=montant))
+            .exclude(solde_actuel=F('reporte'))
+            .values_list('compte_id', 'solde_actuel', 'reporte')
+        )
+        # SQLite ne conserve pas l'échelle des décimaux calculés (Coalesce)
+        ecarts = {
+            compte_id: (decimal.Decimal(str(final)) - decimal.Decimal(str(reporte))).quantize(CENTIMES)
+            for compte_id, final, reporte in lignes
+        }
+        ecarts = {compte_id: ecart for compte_id, ecart in ecarts.items() if ecart}
+        if not ecarts:
+            return ecarts
+
+        soldes = SoldeExerciceCompte.objects.filter(exercice_id__in=suivants, compte_id__in=ecarts)
+        existants = set(soldes.values_list('compte_id', 'exercice_id'))
+        comptes = list(ecarts)
+        for debut in range(0, len(comptes), TAILLE_ECARTS):
+            tranche = comptes[debut:debut + TAILLE_ECARTS]
+            # UPDATE direct : les soldes des exercices clôturés ne sont modifiables que par ce report contrôlé
+            ecart = Case(*[When(compte_id=compte_id, then=Value(ecarts[compte_id])) for compte_id in tranche], output_field=montant)
+            SoldeExerciceCompte.objects.filter(exercice_id__in=suivants, compte_id__in=tranche).update(
+                solde_initial=F('solde_initial') + ecart,
+                solde_actuel=F('solde_actuel') + ecart
             )
-    
+        # Compte sans solde dans un exercice suivant : ni report ni mouvement, le solde est l'écart
+        crees = SoldeExerciceCompte.objects.bulk_create([
+            SoldeExerciceCompte(compte_id=compte_id, exercice_id=exercice_id, solde_initial=ecart, solde_actuel=ecart)
+            for exercice_id in suivants
+            for compte_id, ecart in ecarts.items()
+            if (compte_id, exercice_id) not in existants
+        ])
+        journaliser_soldes(existants)
+        journaliser(crees, Modification.CREATION)
+        nouvelle_version(suivants)
+        return ecarts
+
+    @en_cache('soldes_comptes')
+    def calculer_soldes_comptes(self):
+        """Solde actuel de chaque compte (initial + débit - crédit), en une requête groupée"""
+        from .solde_exercice_compte import SoldeExerciceCompte
+        from .ecriture_comptable import EcritureComptable
+        from ..soldes import totaux_par_compte
+
+        soldes = dict(
+            SoldeExerciceCompte.objects.filter(exercice=self)
+            .values_list('compte_id', 'solde_initial')
+        )
+        totaux = totaux_par_compte(EcritureComptable.objects.filter(exercice=self))
+        for compte_id, (debit, credit) in totaux.items():
+            soldes[compte_id] = decimal.Decimal(soldes.get(compte_id, 0)) + debit - credit
+        return soldes
+
+    def report_soldes_comptes(self, exercice_suivant, soldes=None, comptes=None):
+        """Reporte les soldes des comptes de bilan (ou des seuls `comptes` donnés) sur l'exercice suivant"""
+        from ..modifications import journaliser_soldes
+        from .compte import Compte
+        from .modification import Modification
+        from .solde_exercice_compte import SoldeExerciceCompte
+
+        if soldes is None:
+            soldes = self.calculer_soldes_comptes()
+
+        if comptes is None:
+            comptes = list(Compte.objects.filter(type_compte__in=['actif', 'passif']).values_list('pk', flat=True))
+        existants = set(
+            SoldeExerciceCompte.objects.filter(exercice=exercice_suivant, compte_id__in=comptes)
+            .values_list('compte_id', flat=True)
+        )
+        SoldeExerciceCompte.objects.bulk_create(
+            [
+                SoldeExerciceCompte(
+                    compte_id=compte_id,
+                    exercice=exercice_suivant,
+                    solde_initial=soldes.get(compte_id, 0),
+                    solde_actuel=soldes.get(compte_id, 0),
+                    total_debit=0,
+                    total_credit=0
+                )
+                for compte_id in comptes
+            ],
+            update_conflicts=True,
+            unique_fields=['compte', 'exercice'],
+            update_fields=['solde_initial', 'solde_actuel', 'total_debit', 'total_credit']
+        )
+        # Upsert sans signaux : soldes reportés relus pour le journal des modifications
+        journaliser_soldes(
+            [(compte_id, exercice_suivant.pk) for compte_id in comptes if compte_id not in existants],
+            Modification.CREATION
+        )
+        journaliser_soldes([(compte_id, exercice_suivant.pk) for compte_id in comptes if compte_id in existants])
+        nouvelle_version([exercice_suivant.pk])
+
     @transaction.atomic
-    def clore_comptes_produits_charges(self, compte_resultat):
-        resultat_net = self.calculer_resultat_net()
+    def clore_comptes_produits_charges(self, compte_resultat, soldes=None):
         from .transaction import Transaction
         from .ecriture_comptable import EcritureComptable
         from .compte import Compte
 
+        if soldes is None:
+            soldes = self.calculer_soldes_comptes()
+
         transaction_cloture = Transaction.objects.create(
             exercice=self,
             date_operation=self.date_fin,
             libelle="Clôture des comptes de produits et charges"
         )
 
-        # Clôturer les comptes de produits
-        comptes_produits = Compte.objects.filter(type_compte='recette')
-        for compte in comptes_produits:
-            solde = compte.get_solde_actuel(self)
+        # Clôturer les comptes de produits et de charges : chaque solde est
+        # soldé sur son compte et reporté sur le compte de résultat
+        ecritures = []
+        comptes = Compte.objects.filter(type_compte__in=['recette', 'depense']).values_list('pk', flat=True)
+        for compte_id in comptes:
+            solde = soldes.get(compte_id, 0)
             if solde == 0:
                 continue
-            
-            EcritureComptable.objects.create(
-                compte=compte,
+
+            ecritures.append(EcritureComptable(
+                compte_id=compte_id,
                 montant=abs(solde),
                 type_ecriture='CR' if solde > 0 else 'DB',
                 transaction=transaction_cloture
-            )
-
-            EcritureComptable.objects.create(
+            ))
+            ecritures.append(EcritureComptable(
                 compte=compte_resultat,
                 montant=abs(solde),
                 type_ecriture='DB' if solde > 0 else 'CR',
                 transaction=transaction_cloture
-            )
+            ))
 
-        # Clôturer les comptes de charges
-        comptes_charges = Compte.objects.filter(type_compte='depense')
-        for compte in comptes_charges:
-            solde = compte.get_solde_actuel(self)
-            if solde == 0:
-                continue
-                
-            EcritureComptable.objects.create(
-                compte=compte,
-                montant=abs(solde),
-                type_ecriture='CR' if solde > 0 else 'DB',
-                transaction=transaction_cloture
-            )
-            
-            EcritureComptable.objects.create(
-                compte=compte_resultat,
-                montant=abs(solde),
-                type_ecriture='CR' if solde < 0 else 'DB',
-                transaction=transaction_cloture
-            )
+        self._enregistrer_ecritures_cloture(ecritures, soldes)
 
+    @en_cache('resultat_net')
     def calculer_resultat_net(self):
         from .ecriture_comptable import EcritureComptable
 
         total_produits = EcritureComptable.objects.filter(
             compte__type_compte='recette', 
-            transaction__exercice=self, 
+            exercice=self, 
             type_ecriture='CR'
         ).aggregate(total=Sum(F('montant')))['total'] or decimal.Decimal(0.0)
 
         total_charges = EcritureComptable.objects.filter(
             compte__type_compte='depense', 
-            transaction__exercice=self, 
+            exercice=self, 
             type_ecriture='DB'
         ).aggregate(total=Sum(F('montant')))['total'] or decimal.Decimal(0.0)
 
-        return total_produits - total_charges
+        # Sommes SQLite flottantes : résultat ramené au centime
+        return (decimal.Decimal(total_produits) - decimal.Decimal(total_charges)).quantize(CENTIMES)
 
-    def reporter_resultat_net(self, resultat_net, compte_resultat_classe8, compte_resultat_classe1):
+    def reporter_resultat_net(self, resultat_net, compte_resultat_classe8, compte_resultat_classe1, soldes=None):
         from .transaction import Transaction
         from .ecriture_comptable import EcritureComptable
 
@@ -154,16 +387,30 @@ class ExerciceComptable(models.Model):
             libelle="Report du résultat net"
         )
 
-        EcritureComptable.objects.create(
-            compte=compte_resultat_classe8,
-            montant=abs(resultat_net),
-            type_ecriture='CR' if resultat_net < 0 else 'DB',
-            transaction=transaction_report
-        )
-        
-        EcritureComptable.objects.create(
-            compte=compte_resultat_classe1,
-            montant=abs(resultat_net),
-            type_ecriture='CR' if resultat_net > 0 else 'DB',
-            transaction=transaction_report
-        )
\ No newline at end of file
+        self._enregistrer_ecritures_cloture([
+            EcritureComptable(
+                compte=compte_resultat_classe8,
+                montant=abs(resultat_net),
+                type_ecriture='CR' if resultat_net < 0 else 'DB',
+                transaction=transaction_report
+            ),
+            EcritureComptable(
+                compte=compte_resultat_classe1,
+                montant=abs(resultat_net),
+                type_ecriture='CR' if resultat_net > 0 else 'DB',
+                transaction=transaction_report
+            ),
+        ], soldes)
+
+    def _enregistrer_ecritures_cloture(self, ecritures, soldes=None):
+        """Insère les écritures en masse et reporte leur effet sur les soldes calculés"""
+        from ..soldes import creer_ecritures, montant_signe
+
+        creer_ecritures(ecritures)
+        if soldes is None:
+            return
+        for ecriture in ecritures:
+            soldes[ecriture.compte_id] = (
+                decimal.Decimal(soldes.get(ecriture.compte_id, 0)) +
+                montant_signe(ecriture.type_ecriture, ecriture.montant)
+            )
\ No newline at end of file
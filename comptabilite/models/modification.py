@@ -0,0 +1,41 @@
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.utils import timezone
+
+
+class Modification(models.Model):
+    """
+    Journal des modifications (append-only) des écritures, transactions et
+    soldes, lu par les systèmes aval : l'ID croissant sert de curseur.
+    """
+    CREATION = 'creation'
+    MODIFICATION = 'modification'
+    SUPPRESSION = 'suppression'
+    OPERATION_CHOICES = [
+        (CREATION, 'Création'),
+        (MODIFICATION, 'Modification'),
+        (SUPPRESSION, 'Suppression'),
+    ]
+    MODELE_CHOICES = [
+        ('ecriture', 'Écriture comptable'),
+        ('transaction', 'Transaction'),
+        ('solde', "Solde d'exercice"),
+    ]
+
+    modele = models.CharField(max_length=20, choices=MODELE_CHOICES, verbose_name="Modèle")
+    objet_id = models.BigIntegerField(verbose_name="ID de l'objet")
+    operation = models.CharField(max_length=20, choices=OPERATION_CHOICES, verbose_name="Opération")
+    # État de l'objet après l'opération (avant, pour une suppression)
+    donnees = models.JSONField(encoder=DjangoJSONEncoder, verbose_name="Données")
+    date = models.DateTimeField(default=timezone.now, verbose_name="Date")
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['modele', 'id']),
+        ]
+        verbose_name = "Modification"
+        verbose_name_plural = "Modifications"
+
+    def __str__(self):
+        return f"#{self.pk} {self.operation} {self.modele} {self.objet_id}"
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.exceptions import ValidationError
 
 class SoldeExerciceCompte(models.Model):
@@ -22,6 +22,17 @@ class SoldeExerciceCompte(models.Model):
         decimal_places=2, 
         default=0.0
     )
+    # Mouvements de l'exercice, tenus à jour avec le solde (balance générale)
+    total_debit = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0.0
+    )
+    total_credit = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0.0
+    )
 
     class Meta:
         unique_together = ('compte', 'exercice')
@@ -32,4 +43,6 @@ class SoldeExerciceCompte(models.Model):
     def save(self, *args, **kwargs):
         if not self.exercice.est_ouvert:
             raise ValidationError("Impossible de modifier le solde pour un exercice clôturé.")
-        super().save(*args, **kwargs)
\ No newline at end of file
+        # Solde et journal des modifications (signal) validés ensemble
+        with transaction.atomic():
+            super().save(*args, **kwargs)
\ No newline at end of file
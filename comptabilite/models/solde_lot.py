@@ -0,0 +1,32 @@
+from django.db import models
+
+
+class SoldeLot(models.Model):
+    """
+    Solde cumulé (tous exercices) d'un lot sur un compte de tiers, tenu à
+    jour à chaque écriture : relevé copropriétaire sans ré-agréger les écritures.
+    """
+    lot = models.ForeignKey(
+        'patrimoine.Lot',
+        on_delete=models.CASCADE,
+        related_name='soldes',
+        verbose_name="Lot"
+    )
+    compte = models.ForeignKey(
+        'Compte',
+        on_delete=models.CASCADE,
+        related_name='soldes_lot',
+        verbose_name="Compte comptable"
+    )
+    total_debit = models.DecimalField(max_digits=14, decimal_places=2, default=0.0)
+    total_credit = models.DecimalField(max_digits=14, decimal_places=2, default=0.0)
+    # Débit - crédit : positif si le copropriétaire doit, négatif s'il dispose d'une avance
+    solde = models.DecimalField(max_digits=14, decimal_places=2, default=0.0)
+
+    class Meta:
+        unique_together = ('lot', 'compte')
+        verbose_name = "Solde de lot"
+        verbose_name_plural = "Soldes de lots"
+
+    def __str__(self):
+        return f"Solde {self.lot} sur {self.compte}"
@@ -0,0 +1,59 @@
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.utils import timezone
+
+
+class Tache(models.Model):
+    """
+    Tâche de fond (file d'attente en base), exécutée par la commande
+    `travailleur` phase par phase : `etape` compte les phases terminées et
+    `etat` porte le point de reprise (voir comptabilite/taches.py).
+    """
+    EN_ATTENTE = 'en_attente'
+    EN_COURS = 'en_cours'
+    TERMINEE = 'terminee'
+    ECHEC = 'echec'
+    STATUT_CHOICES = [
+        (EN_ATTENTE, 'En attente'),
+        (EN_COURS, 'En cours'),
+        (TERMINEE, 'Terminée'),
+        (ECHEC, 'Échec'),
+    ]
+    CLOTURE_EXERCICE = 'cloture_exercice'
+    TYPE_CHOICES = [
+        (CLOTURE_EXERCICE, "Clôture d'exercice"),
+    ]
+
+    type = models.CharField(max_length=50, choices=TYPE_CHOICES, verbose_name="Type")
+    libelle = models.CharField(max_length=255, verbose_name="Libellé")
+    parametres = models.JSONField(default=dict, encoder=DjangoJSONEncoder, verbose_name="Paramètres")
+    statut = models.CharField(max_length=20, choices=STATUT_CHOICES, default=EN_ATTENTE, verbose_name="Statut")
+    etape = models.PositiveIntegerField(default=0, verbose_name="Phases terminées")
+    etapes = models.PositiveIntegerField(default=0, verbose_name="Nombre de phases")
+    phase = models.CharField(max_length=100, blank=True, verbose_name="Phase en cours")
+    # Point de reprise : état enregistré avec chaque phase terminée
+    etat = models.JSONField(default=dict, encoder=DjangoJSONEncoder, verbose_name="État")
+    erreur = models.TextField(blank=True, verbose_name="Erreur")
+    tentatives = models.PositiveIntegerField(default=0, verbose_name="Tentatives")
+    travailleur = models.CharField(max_length=100, blank=True, verbose_name="Travailleur")
+    date_creation = models.DateTimeField(default=timezone.now, verbose_name="Créée le")
+    date_debut = models.DateTimeField(null=True, blank=True, verbose_name="Démarrée le")
+    date_fin = models.DateTimeField(null=True, blank=True, verbose_name="Terminée le")
+    # Dernier signe de vie du travailleur : une tâche en cours muette trop longtemps est reprise
+    date_activite = models.DateTimeField(null=True, blank=True, verbose_name="Dernière activité")
+
+    class Meta:
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['statut', 'id']),
+        ]
+        verbose_name = "Tâche"
+        verbose_name_plural = "Tâches"
+
+    def __str__(self):
+        return f"#{self.pk} {self.libelle} ({self.get_statut_display()})"
+
+    @property
+    def progression(self):
+        """Avancement en pourcentage des phases terminées"""
+        return 100 if self.statut == self.TERMINEE else int(100 * self.etape / self.etapes) if self.etapes else 0
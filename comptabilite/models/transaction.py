@@ -1,8 +1,12 @@
 import os
 from datetime import date
-from django.db import models
+from decimal import Decimal
+from django.db import models, transaction
+from django.db.models import Q, Sum
 from django.core.exceptions import ValidationError
 
+MESSAGE_DESEQUILIBRE = "Les écritures comptables doivent être équilibrées (Total débit = Total crédit)."
+
 class Transaction(models.Model):
     date_creation = models.DateField(auto_now_add=True)
     date_operation = models.DateField()
@@ -12,7 +16,7 @@ class Transaction(models.Model):
         'ExerciceComptable', 
         on_delete=models.CASCADE, 
         related_name='transactions_exercice', 
-        limit_choices_to={'est_ouvert': True}
+        limit_choices_to={'est_ouvert': True, 'en_cloture': False}
     )
 
     class Meta:
@@ -21,12 +25,46 @@ class Transaction(models.Model):
     def __str__(self):
         return f"{self.date_operation} - {self.libelle.upper()} - {self.exercice}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._exercice_initial = instance.__dict__.get('exercice_id')
+        return instance
+
     def save(self, *args, **kwargs):
         self.libelle = self.libelle.upper()
         self.clean_justif()
         if self.justif:
             self.justif.name = self.generate_filename()
-        super().save(*args, **kwargs)
+        # Transaction, écritures déplacées et journal des modifications validés ensemble
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            exercice_initial = getattr(self, '_exercice_initial', None)
+            if exercice_initial and exercice_initial != self.exercice_id:
+                self.deplacer_ecritures(exercice_initial)
+        self._exercice_initial = self.exercice_id
+
+    def deplacer_ecritures(self, exercice_initial):
+        """Reporte un changement d'exercice sur les écritures et sur les soldes des deux exercices"""
+        from ..cache_rapports import nouvelle_version
+        from ..modifications import journaliser
+        from ..soldes import recalculer_soldes, session_active
+        from .modification import Modification
+
+        compte_ids = set(self.ecritures.values_list('compte_id', flat=True))
+        self.ecritures.update(exercice_id=self.exercice_id)
+        journaliser(self.ecritures.all(), Modification.MODIFICATION)
+        paires = [(compte_id, exercice_initial) for compte_id in compte_ids] + \
+            [(compte_id, self.exercice_id) for compte_id in compte_ids]
+        session = session_active()
+        if session:
+            # Recalcul en fin de session : il remplace les deltas en attente de ces couples
+            for compte_id, exercice_id in paires:
+                session.marquer(compte_id, exercice_id)
+        else:
+            recalculer_soldes(paires)
+        nouvelle_version([exercice_initial, self.exercice_id])
         
     def generate_filename(self):
         return f"{self.date_operation.strftime('%Y%m%d')}_{self.libelle.replace(' ', '_')}_{self.justif.name.split('/')[-1]}"
@@ -36,17 +74,31 @@ class Transaction(models.Model):
             self.justif.delete(False)
         super().delete(*args, **kwargs)
 
+    @staticmethod
+    def verifier_lignes(lignes):
+        """Équilibre de lignes en mémoire, couples (type_ecriture, montant) : aucune requête"""
+        totaux = {'DB': Decimal(0), 'CR': Decimal(0)}
+        for type_ecriture, montant in lignes:
+            totaux[type_ecriture] += montant
+        if totaux['DB'] != totaux['CR']:
+            raise ValidationError(MESSAGE_DESEQUILIBRE)
+
+    def verifier_equilibre(self):
+        """Équilibre des écritures enregistrées, en une requête"""
+        totaux = self.ecritures.aggregate(
+            debit=Sum('montant', filter=Q(type_ecriture='DB')),
+            credit=Sum('montant', filter=Q(type_ecriture='CR'))
+        )
+        # Sommes SQLite flottantes : comparaison au centime
+        debit, credit = (Decimal(totaux[cle] or 0).quantize(Decimal('0.01')) for cle in ('debit', 'credit'))
+        if debit != credit:
+            raise ValidationError(MESSAGE_DESEQUILIBRE)
+
     def clean(self):
+        # Écritures enregistrées (full_clean : formulaires, imports, shell) ; les lignes
+        # d'un formulaire pas encore enregistrées sont contrôlées par verifier_lignes
         if self.pk:
-            from django.db.models import Sum
-            from decimal import Decimal
-            
-            balance = self.ecritures.values('type_ecriture').annotate(total=Sum('montant'))
-            total_debit = next((b['total'] for b in balance if b['type_ecriture'] == 'DB'), Decimal(0.0))
-            total_credit = next((b['total'] for b in balance if b['type_ecriture'] == 'CR'), Decimal(0.0))
-            
-            if total_debit != total_credit:
-                raise ValidationError("Les écritures comptables doivent être équilibrées (Total débit = Total crédit).")
+            self.verifier_equilibre()
 
     def clean_justif(self):
         if self.justif:
@@ -0,0 +1,123 @@
+# comptabilite/modifications.py
+"""
+Flux des modifications pour les systèmes aval (BI, portail copropriétaires).
+
+Chaque création, modification ou suppression d'écriture, de transaction ou
+de solde d'exercice ajoute une ligne à la table Modification, dans la même
+transaction que l'opération elle-même (outbox) : une opération annulée ne
+laisse pas de trace. Les enregistrements unitaires sont captés par les
+signaux, dans la transaction que `save()` ouvre pour l'objet et son
+journal (la suppression est déjà atomique) ; les chemins qui les
+contournent (bulk_create, UPDATE F(), reconstruction des soldes) appellent
+`journaliser` / `journaliser_soldes` avec une insertion groupée, dans
+leur propre transaction.
+
+Un consommateur lit les lignes d'ID supérieur à son dernier curseur
+(`modifications_depuis`, API `?since=`, commande `modifications`) : le
+coût d'une synchronisation est proportionnel au volume de modifications,
+pas à la taille du grand livre. Les données enregistrées sont l'état de
+l'objet après l'opération (avant, pour une suppression).
+
+Les IDs sont attribués à l'insertion mais visibles à la validation : avec
+des écritures concurrentes (PostgreSQL, MySQL), une ligne d'ID inférieur
+peut apparaître après qu'un consommateur a dépassé son ID. Le flux
+retient donc les lignes de moins de COMPTABILITE_DELAI_MODIFICATIONS
+secondes, délai à choisir supérieur à la durée de la plus longue
+transaction d'écriture (0 avec SQLite, où les écritures sont sérialisées).
+"""
+import decimal
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+from .models import EcritureComptable, Modification, SoldeExerciceCompte, Transaction
+
+# Âge minimal (secondes) d'une modification pour être diffusée, par défaut
+DELAI_VISIBILITE = 60
+
+MODELES = {
+    EcritureComptable: 'ecriture',
+    Transaction: 'transaction',
+    SoldeExerciceCompte: 'solde',
+}
+
+
+def actif():
+    return getattr(settings, 'COMPTABILITE_JOURNAL_MODIFICATIONS', True)
+
+
+def delai_visibilite():
+    return getattr(settings, 'COMPTABILITE_DELAI_MODIFICATIONS', DELAI_VISIBILITE)
+
+
+def serialiser(instance):
+    """Valeurs des champs de l'objet (clés étrangères par ID)"""
+    donnees = {}
+    for champ in instance._meta.concrete_fields:
+        valeur = champ.value_from_object(instance)
+        if isinstance(champ, models.FileField):
+            valeur = valeur.name or None
+        elif isinstance(champ, models.DecimalField) and valeur is not None:
+            # Valeur en mémoire éventuellement float ou non arrondie (valeurs par défaut)
+            valeur = decimal.Decimal(str(valeur)).quantize(decimal.Decimal(1).scaleb(-champ.decimal_places))
+        donnees[champ.attname] = valeur
+    return donnees
+
+
+def journaliser(instances, operation, soldes=()):
+    """
+    Enregistre l'opération pour chaque objet, et la modification des soldes
+    des couples (compte_id, exercice_id) `soldes`, en une insertion groupée
+    """
+    if not actif():
+        return
+    modifications = [(instance, operation) for instance in instances]
+    modifications += [(solde, Modification.MODIFICATION) for solde in _relire_soldes(soldes)]
+    Modification.objects.bulk_create([
+        Modification(
+            modele=MODELES[type(instance)],
+            objet_id=instance.pk,
+            operation=operation,
+            donnees=serialiser(instance)
+        )
+        for instance, operation in modifications
+    ], batch_size=1000)
+
+
+def _relire_soldes(paires):
+    """
+    Soldes des couples (compte_id, exercice_id) relus en base : nécessaire
+    après un UPDATE F() dont la valeur résultante n'est pas connue en mémoire.
+    """
+    if not paires:
+        return []
+    paires = set(paires)
+    soldes = SoldeExerciceCompte.objects.filter(
+        compte_id__in={compte_id for compte_id, _ in paires},
+        exercice_id__in={exercice_id for _, exercice_id in paires}
+    )
+    return [s for s in soldes if (s.compte_id, s.exercice_id) in paires]
+
+
+def journaliser_soldes(paires, operation=Modification.MODIFICATION):
+    """Enregistre l'état actuel, relu en base, des soldes des couples (compte_id, exercice_id)"""
+    if not actif() or not paires:
+        return
+    journaliser(_relire_soldes(paires), operation)
+
+
+def modifications_depuis(curseur=0, modeles=None, limite=None):
+    """
+    Modifications d'ID strictement supérieur au curseur, dans l'ordre, hors
+    celles de moins de `delai_visibilite()` secondes (voir le module)
+    """
+    modifications = Modification.objects.filter(id__gt=curseur).order_by('id')
+    if delai_visibilite():
+        modifications = modifications.filter(date__lte=timezone.now() - timedelta(seconds=delai_visibilite()))
+    if modeles:
+        modifications = modifications.filter(modele__in=modeles)
+    if limite:
+        modifications = modifications[:limite]
+    return modifications
@@ -0,0 +1,38 @@
+# comptabilite/pagination.py
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginateur à nombre d'éléments estimé : évite le COUNT(*) complet sur
+    les grandes tables. Sans filtre sous PostgreSQL, l'estimation des
+    statistiques (pg_class.reltuples) est utilisée ; sinon le comptage est
+    borné à `limite` lignes.
+    """
+    limite = 10000
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.estime = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [queryset.model._meta.db_table]
+                )
+                ligne = cursor.fetchone()
+            if ligne and ligne[0] > 0:
+                self.estime = True
+                return ligne[0]
+
+        nombre = queryset.order_by().values('pk')[:self.limite + 1].count()
+        self.estime = nombre > self.limite
+        return nombre
@@ -0,0 +1,189 @@
+# comptabilite/profilage.py
+"""
+Profilage optionnel des chemins critiques de la comptabilité.
+
+`profiler(nom)` (ou le décorateur `profile`) mesure une opération : nombre
+de requêtes SQL, temps total passé en base, requêtes les plus lentes et
+durée totale. Les mesures imbriquées comptent chacune les requêtes de leur
+bloc, mais une requête lente n'est retenue que par la mesure la plus
+interne : le résumé ne la liste qu'une fois. Chaque mesure est émise dans le journal
+`comptabilite.profilage` (données structurées dans `extra['profilage']`)
+et, dans un bloc `collecte()`, conservée pour le résumé de fin de commande.
+
+Le profilage est activé par le réglage COMPTABILITE_PROFILAGE, ou
+localement avec `forcer()` (option --profiler des commandes). Désactivé,
+il se réduit à un test de booléen : aucun wrapper SQL n'est installé.
+"""
+import functools
+import heapq
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# Nombre de requêtes lentes conservées par mesure
+REQUETES_LENTES = 5
+
+_local = threading.local()
+
+
+def actif():
+    return getattr(_local, 'force', False) or getattr(settings, 'COMPTABILITE_PROFILAGE', False)
+
+
+@contextmanager
+def forcer():
+    """Active le profilage pour le thread courant, quel que soit le réglage"""
+    precedent = getattr(_local, 'force', False)
+    _local.force = True
+    try:
+        yield
+    finally:
+        _local.force = precedent
+
+
+class Mesure:
+    """Mesure d'une opération, alimentée par un wrapper d'exécution SQL"""
+
+    def __init__(self, nom):
+        self.nom = nom
+        self.requetes = 0
+        self.duree_sql = 0.0
+        self.duree = 0.0
+        self.lentes = []  # tas (durée, ordre, sql) des requêtes les plus lentes
+
+    def __call__(self, execute, sql, params, many, context):
+        debut = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duree = time.perf_counter() - debut
+            self.requetes += 1
+            self.duree_sql += duree
+            entree = (duree, self.requetes, sql)
+            # Requête lente retenue par la mesure la plus interne seulement
+            if _local.actives[-1] is self:
+                if len(self.lentes) < REQUETES_LENTES:
+                    heapq.heappush(self.lentes, entree)
+                elif duree > self.lentes[0][0]:
+                    heapq.heapreplace(self.lentes, entree)
+
+    def as_dict(self):
+        return {
+            'operation': self.nom,
+            'requetes': self.requetes,
+            'duree_ms': round(self.duree * 1000, 2),
+            'duree_sql_ms': round(self.duree_sql * 1000, 2),
+            'duree_python_ms': round((self.duree - self.duree_sql) * 1000, 2),
+            'requetes_lentes': [
+                {'duree_ms': round(duree * 1000, 2), 'sql': sql[:500]}
+                for duree, _, sql in sorted(self.lentes, reverse=True)
+            ],
+        }
+
+
+@contextmanager
+def profiler(nom):
+    """Mesure le bloc si le profilage est actif ; sinon ne fait rien"""
+    if not actif():
+        yield None
+        return
+
+    mesure = Mesure(nom)
+    if not hasattr(_local, 'actives'):
+        _local.actives = []
+    _local.actives.append(mesure)
+    debut = time.perf_counter()
+    try:
+        with connection.execute_wrapper(mesure):
+            yield mesure
+    finally:
+        mesure.duree = time.perf_counter() - debut
+        _local.actives.pop()
+        donnees = mesure.as_dict()
+        logger.info(
+            "%s : %d requête(s), %.1f ms dont %.1f ms en base",
+            nom, mesure.requetes, donnees['duree_ms'], donnees['duree_sql_ms'],
+            extra={'profilage': donnees}
+        )
+        mesures = getattr(_local, 'mesures', None)
+        if mesures is not None:
+            mesures.append(mesure)
+
+
+def profile(nom=None):
+    """Décorateur : profile chaque appel de la fonction sous `nom` (par défaut son nom qualifié)"""
+    def decorateur(fonction):
+        libelle = nom or fonction.__qualname__
+
+        @functools.wraps(fonction)
+        def enveloppe(*args, **kwargs):
+            if not actif():
+                return fonction(*args, **kwargs)
+            with profiler(libelle):
+                return fonction(*args, **kwargs)
+        return enveloppe
+    return decorateur
+
+
+@contextmanager
+def collecte():
+    """Conserve les mesures terminées dans le bloc (pour un résumé de fin de commande)"""
+    precedentes = getattr(_local, 'mesures', None)
+    _local.mesures = mesures = []
+    try:
+        yield mesures
+    finally:
+        _local.mesures = precedentes
+        if precedentes is not None:
+            precedentes.extend(mesures)
+
+
+def resume(mesures):
+    """Lignes de résumé : totaux par opération puis requêtes les plus lentes"""
+    if not mesures:
+        return []
+
+    par_operation = {}
+    for mesure in mesures:
+        appels, requetes, duree, duree_sql = par_operation.get(mesure.nom, (0, 0, 0.0, 0.0))
+        par_operation[mesure.nom] = (
+            appels + 1, requetes + mesure.requetes, duree + mesure.duree, duree_sql + mesure.duree_sql
+        )
+
+    lignes = [f"{'Opération':40} {'appels':>7} {'requêtes':>9} {'total (ms)':>11} {'SQL (ms)':>10}"]
+    for nom, (appels, requetes, duree, duree_sql) in sorted(par_operation.items(), key=lambda o: -o[1][2]):
+        lignes.append(f"{nom:40} {appels:7} {requetes:9} {duree * 1000:11.1f} {duree_sql * 1000:10.1f}")
+
+    lentes = heapq.nlargest(REQUETES_LENTES, (entree for mesure in mesures for entree in mesure.lentes))
+    if lentes:
+        lignes.append("Requêtes les plus lentes :")
+        lignes += [f"  {duree * 1000:8.1f} ms  {sql[:150]}" for duree, _, sql in lentes]
+    return lignes
+
+
+class ProfilageMiddleware:
+    """Profile les vues (dont l'admin) et expose les mesures dans l'en-tête Server-Timing"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not actif():
+            return self.get_response(request)
+
+        with profiler(f"{request.method} {request.path}") as mesure:
+            response = self.get_response(request)
+            if hasattr(response, 'render') and not getattr(response, 'is_rendered', True):
+                # Réponse différée (admin) : le rendu fait partie de la mesure
+                response.render()
+        response['Server-Timing'] = (
+            f"db;desc=\"{mesure.requetes} requêtes\";dur={mesure.duree_sql * 1000:.1f}, "
+            f"total;dur={mesure.duree * 1000:.1f}"
+        )
+        return response
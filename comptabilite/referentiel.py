@@ -0,0 +1,78 @@
+# comptabilite/referentiel.py
+"""
+Cache local au processus des données de référence (exercice actuel,
+comptes par numéro), partagé par l'admin, les commandes et l'API.
+
+Ces données changent quelques fois par an mais sont lues à chaque
+facturation, clôture ou page d'admin. Le cache est vidé par les signaux
+post_save / post_delete de ExerciceComptable et Compte (voir signals.py) ;
+les mises à jour par QuerySet.update() doivent appeler `invalider()`.
+
+Dans une transaction qui a modifié le référentiel, les lectures
+contournent le cache jusqu'à sa fin (validation ou annulation) : aucune
+donnée non validée n'y est conservée. Les autres processus ne reçoivent
+pas les signaux : COMPTABILITE_REFERENTIEL_DUREE (secondes, None : sans
+limite) borne la durée pendant laquelle ils peuvent lire une valeur périmée.
+
+Les objets retournés sont des copies : les modifier n'altère pas le cache.
+"""
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Compte, ExerciceComptable
+
+_cache = {}
+_local = threading.local()
+
+
+def _duree():
+    return getattr(settings, 'COMPTABILITE_REFERENTIEL_DUREE', None)
+
+
+def vider():
+    _cache.clear()
+
+
+def invalider():
+    """Vide le cache ; dans une transaction, le contourne jusqu'à sa fin et le vide à nouveau à la validation"""
+    vider()
+    if connection.in_atomic_block:
+        _local.modifie = True
+        transaction.on_commit(vider)
+
+
+def _lire(cle, charger):
+    if getattr(_local, 'modifie', False):
+        if connection.in_atomic_block:
+            return charger()
+        # Transaction terminée (validée ou annulée) : lectures faites entre-temps écartées
+        _local.modifie = False
+        vider()
+
+    entree = _cache.get(cle)
+    duree = _duree()
+    if entree is None or (duree is not None and time.monotonic() - entree[1] > duree):
+        entree = _cache[cle] = (charger(), time.monotonic())
+    return copy.deepcopy(entree[0])
+
+
+def exercice_actuel():
+    """Exercice marqué actuel (None s'il n'y en a pas)"""
+    return _lire('exercice_actuel', lambda: ExerciceComptable.objects.filter(est_actuel=True).first())
+
+
+def compte(numero, defaults=None):
+    """
+    Compte de numéro donné. S'il n'existe pas, il est créé avec `defaults`
+    (comme get_or_create) ou Compte.DoesNotExist est levée.
+    """
+    def charger():
+        if defaults is None:
+            return Compte.objects.get(compte=numero)
+        return Compte.objects.get_or_create(compte=numero, defaults=defaults)[0]
+
+    return _lire(('compte', numero), charger)
@@ -0,0 +1,110 @@
+# comptabilite/releve.py
+"""
+Relevé de compte des copropriétaires (par lot).
+
+Le solde d'un lot est lu dans SoldeLot, tenu à jour à chaque écriture :
+« combien doit le lot B12 ? » est une lecture d'une ligne par compte, sans
+agrégat sur les écritures. Pour un relevé sur une période, le solde
+d'ouverture est déduit du solde stocké, diminué des mouvements de la
+période et des mouvements postérieurs : seules les écritures à partir de
+la date de début sont lues. Le mode par immeuble produit les relevés de
+tous ses lots avec le même nombre de requêtes que pour un seul lot.
+
+Convention de signe : débit - crédit, positif quand le copropriétaire
+doit, négatif quand il dispose d'une avance.
+"""
+import decimal
+from collections import defaultdict
+
+from django.db.models import Sum
+
+from .cache_rapports import LOTS, en_cache
+from .models import EcritureComptable, SoldeLot
+from .soldes import CENTIMES, ZERO, totaux_groupes
+
+# Compte client (appels de fonds) et compte d'avances des copropriétaires
+COMPTES_COPROPRIETAIRE = ("3421", "4421")
+
+
+@en_cache('solde_lot', portee=LOTS)
+def solde_lot(lot, comptes=COMPTES_COPROPRIETAIRE):
+    """Solde actuel du lot sur les comptes copropriétaire (tous exercices confondus)"""
+    return decimal.Decimal(SoldeLot.objects.filter(lot=lot, compte__compte__in=comptes).aggregate(
+        solde=Sum('solde')
+    )['solde'] or ZERO).quantize(CENTIMES)
+
+
+def releve_lot(lot, date_debut=None, date_fin=None, comptes=COMPTES_COPROPRIETAIRE):
+    """Relevé d'un lot sur la période (bornes incluses, ouvertes si None) ; voir `releves_lots`"""
+    return releves_lots([lot], date_debut, date_fin, comptes)[lot.pk]
+
+
+def releves_immeuble(immeuble, date_debut=None, date_fin=None, comptes=COMPTES_COPROPRIETAIRE):
+    """Relevés de tous les lots d'un immeuble, en une passe"""
+    return releves_lots(immeuble.lots.order_by('code'), date_debut, date_fin, comptes)
+
+
+def releves_lots(lots, date_debut=None, date_fin=None, comptes=COMPTES_COPROPRIETAIRE):
+    """
+    Relevés des lots donnés, indexés par ID de lot. Chaque relevé contient
+    le lot, la période, le solde d'ouverture, les mouvements datés avec le
+    solde progressif, les totaux débit / crédit et le solde de clôture.
+    Trois requêtes au plus, quel que soit le nombre de lots.
+    """
+    lots = list(lots)
+    lot_ids = [lot.pk for lot in lots]
+
+    soldes = {
+        lot_id: decimal.Decimal(total or ZERO).quantize(CENTIMES)
+        for lot_id, total in SoldeLot.objects.filter(lot_id__in=lot_ids, compte__compte__in=comptes)
+        .values('lot_id').annotate(total=Sum('solde')).order_by().values_list('lot_id', 'total')
+    }
+
+    ecritures = EcritureComptable.objects.filter(lot_id__in=lot_ids, compte__compte__in=comptes)
+    if date_debut:
+        ecritures = ecritures.filter(transaction__date_operation__gte=date_debut)
+
+    # Mouvements postérieurs à la période : retirés du solde stocké pour obtenir la clôture
+    posterieurs = {}
+    if date_fin:
+        posterieurs = totaux_groupes(ecritures.filter(transaction__date_operation__gt=date_fin), 'lot_id')
+        ecritures = ecritures.filter(transaction__date_operation__lte=date_fin)
+
+    mouvements = defaultdict(list)
+    for lot_id, date_operation, libelle, numero, type_ecriture, montant in ecritures.order_by(
+        'lot_id', 'transaction__date_operation', 'id'
+    ).values_list(
+        'lot_id', 'transaction__date_operation', 'transaction__libelle', 'compte__compte', 'type_ecriture', 'montant'
+    ).iterator():
+        mouvements[lot_id].append({
+            'date': date_operation,
+            'libelle': libelle,
+            'compte': numero,
+            'debit': montant if type_ecriture == 'DB' else ZERO,
+            'credit': montant if type_ecriture == 'CR' else ZERO,
+        })
+
+    releves = {}
+    for lot in lots:
+        debit_posterieur, credit_posterieur = posterieurs.get(lot.pk, (ZERO, ZERO))
+        cloture = (soldes.get(lot.pk) or ZERO) - debit_posterieur + credit_posterieur
+        lignes = mouvements.get(lot.pk, [])
+        total_debit = sum((ligne['debit'] for ligne in lignes), ZERO)
+        total_credit = sum((ligne['credit'] for ligne in lignes), ZERO)
+
+        solde = ouverture = cloture - total_debit + total_credit
+        for ligne in lignes:
+            solde += ligne['debit'] - ligne['credit']
+            ligne['solde'] = solde
+
+        releves[lot.pk] = {
+            'lot': lot,
+            'du': date_debut,
+            'au': date_fin,
+            'solde_ouverture': ouverture,
+            'mouvements': lignes,
+            'total_debit': total_debit,
+            'total_credit': total_credit,
+            'solde_cloture': cloture,
+        }
+    return releves
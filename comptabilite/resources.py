@@ -1,8 +1,12 @@
 # comptabilite/resources.py
-from import_export import resources, fields
+from import_export import fields
+from import_export.results import RowResult
+from .cache_rapports import nouvelle_version
+from .import_massif import ImportParTranchesResource
 from .models import Compte
+from .referentiel import invalider
 
-class CompteResource(resources.ModelResource):
+class CompteResource(ImportParTranchesResource):
     compte = fields.Field(attribute='compte', column_name='compte')
 
     class Meta:
@@ -11,3 +15,18 @@ class CompteResource(resources.ModelResource):
         import_id_fields = ['compte']  # Utiliser 'compte' comme identifiant
         skip_unchanged = True
         report_skipped = True
+
+    def import_instance(self, instance, row, **kwargs):
+        super().import_instance(instance, row, **kwargs)
+        # Normalisation de Compte.save(), que bulk_create / bulk_update n'appellent pas
+        if instance.libelle:
+            instance.libelle = instance.libelle.upper()
+
+    def after_import(self, dataset, result, **kwargs):
+        super().after_import(dataset, result, **kwargs)
+        # bulk_create / bulk_update ne déclenchent pas les signaux post_save de Compte (voir signals.py)
+        if not self._is_dry_run(kwargs) and (
+            result.totals[RowResult.IMPORT_TYPE_NEW] or result.totals[RowResult.IMPORT_TYPE_UPDATE]
+        ):
+            invalider()
+            nouvelle_version(tout=True)
@@ -0,0 +1,185 @@
+# comptabilite/saisie.py
+"""
+Saisie en masse de transactions équilibrées (imports bancaires, API).
+
+Le lot de transactions est validé entièrement en mémoire : comptes, lots
+et fournisseurs sont préchargés en une requête chacun, l'équilibre débit /
+crédit et l'exercice (ouvert, contenant la date) sont contrôlés sans accès
+à la base. Les transactions valides sont ensuite insérées par bulk_create
+dans une seule transaction ; leurs montants sont ajoutés aux soldes en
+UPDATE F() groupés, sans ré-agréger les écritures de l'exercice.
+"""
+import decimal
+from datetime import date, datetime
+
+from django.db import transaction
+
+from patrimoine.models import Lot
+
+from .models import Compte, EcritureComptable, ExerciceComptable, Fournisseur, Modification, Transaction
+from .modifications import journaliser
+from .soldes import creer_ecritures, verifier_mouvements_autorises
+
+TYPES_ECRITURE = ('DB', 'CR')
+
+
+class Invalide(Exception):
+    pass
+
+
+def _date(valeur):
+    if isinstance(valeur, datetime):
+        return valeur.date()
+    if isinstance(valeur, date):
+        return valeur
+    try:
+        return date.fromisoformat(str(valeur))
+    except ValueError:
+        raise Invalide(f"Date invalide : {valeur!r}")
+
+
+def _identifiant(valeur):
+    """ID de tiers (entier ou chaîne de chiffres) ; les autres valeurs sont laissées pour le rejet"""
+    if isinstance(valeur, str) and valeur.isdigit():
+        return int(valeur)
+    return valeur
+
+
+def _montant(valeur):
+    try:
+        montant = decimal.Decimal(str(valeur))
+    except decimal.InvalidOperation:
+        raise Invalide(f"Montant invalide : {valeur!r}")
+    if not montant.is_finite() or montant <= 0 or montant != montant.quantize(decimal.Decimal('0.01')):
+        raise Invalide(f"Montant invalide : {valeur!r} (positif, deux décimales au plus)")
+    return montant
+
+
+class Referentiel:
+    """
+    Comptes, lots, fournisseurs et exercices ouverts nécessaires au lot,
+    chargés en une requête chacun. Sans transactions, tout le référentiel
+    est chargé (imports de fichiers lus en flux).
+    """
+
+    def __init__(self, transactions=None):
+        comptes, lots, fournisseurs = Compte.objects.all(), Lot.objects.all(), Fournisseur.objects.all()
+        if transactions is not None:
+            numeros, lot_ids, fournisseur_ids = set(), set(), set()
+            for donnees in transactions:
+                for ligne in donnees.get('ecritures') or []:
+                    if not isinstance(ligne, dict):
+                        continue
+                    numeros.add(str(ligne.get('compte')))
+                    if ligne.get('lot'):
+                        lot_ids.add(_identifiant(ligne['lot']))
+                    if ligne.get('fournisseur'):
+                        fournisseur_ids.add(_identifiant(ligne['fournisseur']))
+            comptes = comptes.filter(compte__in=numeros)
+            lots = lots.filter(pk__in=self._entiers(lot_ids))
+            fournisseurs = fournisseurs.filter(pk__in=self._entiers(fournisseur_ids))
+
+        self.comptes = dict(comptes.values_list('compte', 'pk'))
+        self.lots = set(lots.values_list('pk', flat=True))
+        self.fournisseurs = set(fournisseurs.values_list('pk', flat=True))
+        # Un exercice en cours de clôture n'accepte plus d'écritures
+        self.exercices = list(ExerciceComptable.objects.filter(est_ouvert=True, en_cloture=False))
+
+    @staticmethod
+    def _entiers(valeurs):
+        return [v for v in valeurs if isinstance(v, int) and not isinstance(v, bool)]
+
+    def exercice(self, date_operation, exercice_id=None):
+        for exercice in self.exercices:
+            if exercice_id not in (None, exercice.pk):
+                continue
+            if exercice.date_debut <= date_operation <= exercice.date_fin:
+                return exercice
+        if exercice_id is not None:
+            raise Invalide(f"Exercice {exercice_id} clôturé, en clôture, inexistant ou ne contenant pas le {date_operation}")
+        raise Invalide(f"Aucun exercice ouvert ne contient le {date_operation}")
+
+
+def valider(donnees, referentiel):
+    """Construit (sans l'enregistrer) la transaction et ses écritures ; lève Invalide au premier défaut"""
+    if not isinstance(donnees, dict):
+        raise Invalide("Transaction attendue sous forme d'objet")
+    libelle = str(donnees.get('libelle') or '').strip()
+    if not libelle:
+        raise Invalide("Libellé obligatoire")
+    date_operation = _date(donnees.get('date_operation'))
+    exercice = referentiel.exercice(date_operation, _identifiant(donnees.get('exercice')))
+
+    lignes = donnees.get('ecritures') or []
+    if len(lignes) < 2:
+        raise Invalide("Une transaction comporte au moins deux écritures")
+
+    transac = Transaction(date_operation=date_operation, libelle=libelle.upper(), exercice=exercice)
+    ecritures, totaux = [], {'DB': decimal.Decimal(0), 'CR': decimal.Decimal(0)}
+    for numero, ligne in enumerate(lignes, start=1):
+        if not isinstance(ligne, dict):
+            raise Invalide(f"Écriture {numero} : objet attendu")
+        compte_id = referentiel.comptes.get(str(ligne.get('compte')))
+        if compte_id is None:
+            raise Invalide(f"Écriture {numero} : compte {ligne.get('compte')!r} inconnu")
+        type_ecriture = ligne.get('type_ecriture')
+        if type_ecriture not in TYPES_ECRITURE:
+            raise Invalide(f"Écriture {numero} : type {type_ecriture!r} invalide (DB ou CR)")
+        montant = _montant(ligne.get('montant'))
+        lot_id, fournisseur_id = _identifiant(ligne.get('lot')), _identifiant(ligne.get('fournisseur'))
+        if lot_id and fournisseur_id:
+            raise Invalide(f"Écriture {numero} : un seul tiers autorisé (lot ou fournisseur)")
+        if lot_id and lot_id not in referentiel.lots:
+            raise Invalide(f"Écriture {numero} : lot {lot_id!r} inconnu")
+        if fournisseur_id and fournisseur_id not in referentiel.fournisseurs:
+            raise Invalide(f"Écriture {numero} : fournisseur {fournisseur_id!r} inconnu")
+
+        totaux[type_ecriture] += montant
+        ecritures.append(EcritureComptable(
+            compte_id=compte_id, type_ecriture=type_ecriture, montant=montant,
+            lot_id=lot_id or None, fournisseur_id=fournisseur_id or None,
+            transaction=transac, exercice=exercice
+        ))
+
+    if totaux['DB'] != totaux['CR']:
+        raise Invalide(f"Transaction déséquilibrée : débit {totaux['DB']} / crédit {totaux['CR']}")
+    return transac, ecritures
+
+
+def saisir_transactions(transactions, tout_ou_rien=False, batch_size=1000):
+    """
+    Valide puis enregistre un lot de transactions, chacune au format
+    {'date_operation', 'libelle', 'exercice' (facultatif), 'ecritures': [
+    {'compte' (numéro), 'type_ecriture', 'montant', 'lot', 'fournisseur'}]}.
+
+    Retourne (transactions créées, erreurs) où erreurs est une liste de
+    {'index', 'erreur'}. Les transactions invalides sont rejetées et les
+    autres enregistrées ; avec `tout_ou_rien`, une seule erreur fait
+    rejeter tout le lot.
+    """
+    transactions = list(transactions)
+    referentiel = Referentiel([t for t in transactions if isinstance(t, dict)])
+
+    valides, erreurs = [], []
+    for index, donnees in enumerate(transactions):
+        try:
+            valides.append(valider(donnees, referentiel))
+        except Invalide as exc:
+            erreurs.append({'index': index, 'erreur': str(exc)})
+
+    if not valides or (tout_ou_rien and erreurs):
+        return [], erreurs
+
+    with transaction.atomic():
+        crees = enregistrer(valides, batch_size)
+    return crees, erreurs
+
+
+def enregistrer(valides, batch_size=1000):
+    """Insère en masse des couples (transaction, écritures) validés par `valider`"""
+    # Le référentiel a pu être chargé avant qu'une clôture ne démarre : contrôle en base, une requête
+    verifier_mouvements_autorises({transac.exercice_id for transac, _ in valides})
+    crees = Transaction.objects.bulk_create([transac for transac, _ in valides], batch_size=batch_size)
+    journaliser(crees, Modification.CREATION)
+    creer_ecritures([ecriture for _, lignes in valides for ecriture in lignes], batch_size=batch_size, par_deltas=True)
+    return crees
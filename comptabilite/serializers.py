@@ -0,0 +1,84 @@
+# comptabilite/serializers.py
+from rest_framework import serializers
+from .models import Abonnement, Compte, EcritureComptable, Modification, SoldeExerciceCompte, Transaction
+
+
+def champs_demandes(request):
+    """Champs demandés par `?fields=a,b` (None : tous les champs)"""
+    if request is None or not request.query_params.get('fields'):
+        return None
+    return {champ.strip() for champ in request.query_params['fields'].split(',') if champ.strip()}
+
+
+class ChampsDynamiquesMixin:
+    """Ne sérialise que les champs demandés par `?fields=` (sparse fieldsets)"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        champs = champs_demandes(self.context.get('request'))
+        if champs:
+            for nom in set(self.fields) - champs:
+                self.fields.pop(nom)
+
+
+class CompteSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Compte
+        fields = ('id', 'compte', 'libelle', 'type_compte')
+
+
+class LigneTransactionSerializer(serializers.ModelSerializer):
+    """Écriture dans le détail d'une transaction (sans rappel de la transaction)"""
+
+    class Meta:
+        model = EcritureComptable
+        fields = ('id', 'compte', 'type_ecriture', 'montant', 'lot', 'fournisseur')
+
+
+class TransactionSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
+    ecritures = LigneTransactionSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Transaction
+        fields = ('id', 'date_operation', 'libelle', 'exercice', 'date_creation', 'ecritures')
+
+
+class EcritureComptableSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
+    numero_compte = serializers.CharField(source='compte.compte', read_only=True)
+    date_operation = serializers.DateField(source='transaction.date_operation', read_only=True)
+    libelle = serializers.CharField(source='transaction.libelle', read_only=True)
+
+    class Meta:
+        model = EcritureComptable
+        fields = (
+            'id', 'transaction', 'exercice', 'date_operation', 'libelle', 'compte', 'numero_compte',
+            'type_ecriture', 'montant', 'lot', 'fournisseur'
+        )
+
+
+class SoldeExerciceCompteSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
+    numero_compte = serializers.CharField(source='compte.compte', read_only=True)
+
+    class Meta:
+        model = SoldeExerciceCompte
+        fields = (
+            'id', 'compte', 'numero_compte', 'exercice', 'solde_initial', 'total_debit', 'total_credit', 'solde_actuel'
+        )
+
+
+class AbonnementSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
+    prochaine_echeance = serializers.DateField(source='echeance.prochaine_echeance', read_only=True, default=None)
+    derniere_periode = serializers.DateField(source='echeance.derniere_periode', read_only=True, default=None)
+
+    class Meta:
+        model = Abonnement
+        fields = (
+            'id', 'lot', 'montant', 'frequence', 'date_debut', 'date_fin', 'actif', 'description',
+            'prochaine_echeance', 'derniere_periode'
+        )
+
+
+class ModificationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Modification
+        fields = ('id', 'modele', 'objet_id', 'operation', 'donnees', 'date')
@@ -1,8 +1,134 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_delete, post_migrate, post_save
 from django.dispatch import receiver
+from .models.abonnement import Abonnement
+from .models.compte import Compte
+from .models.echeance_abonnement import EcheanceAbonnement
 from .models.ecriture_comptable import EcritureComptable
+from .models.exercice_comptable import ExerciceComptable
+from .models.modification import Modification
+from .models.solde_exercice_compte import SoldeExerciceCompte
+from .models.transaction import Transaction
+from .cache_rapports import nouvelle_version
+from .modifications import journaliser
+from .referentiel import invalider
+from .soldes import appliquer_mouvements, recalculer_soldes_lots, session_active
 
+
+def _exercice(instance, exercice_id):
+    if exercice_id == instance.exercice_id:
+        return instance.exercice
+    return ExerciceComptable.objects.get(pk=exercice_id)
+
+
+def _reporter_soldes(instance, etat_initial, etat):
+    """
+    Reporte sur les soldes le passage de l'écriture de `etat_initial` à
+    `etat` (None : écriture absente). Retourne les couples (compte_id,
+    exercice_id) des soldes existants modifiés, à journaliser.
+    """
+    mouvements = []
+    if etat_initial and etat_initial != etat:
+        compte_id, exercice_id, type_ecriture, montant, lot_id = etat_initial
+        mouvements.append((compte_id, exercice_id, type_ecriture, -montant, lot_id))
+    if etat and etat != etat_initial:
+        mouvements.append(etat)
+
+    session = session_active()
+    if session:
+        # Dans une session de saisie, les mouvements sont cumulés puis appliqués en fin de session
+        for mouvement in mouvements:
+            session.ajouter(*mouvement)
+        return []
+    return appliquer_mouvements([
+        (compte_id, _exercice(instance, exercice_id), type_ecriture, montant, lot_id)
+        for compte_id, exercice_id, type_ecriture, montant, lot_id in mouvements
+    ])
+
+
+def _perimer(instance, *etats):
+    # Écriture déplacée : les rapports de son ancien exercice (ou lot) sont aussi périmés
+    etats = [etat for etat in etats if etat]
+    nouvelle_version(
+        {instance.exercice_id} | {etat[1] for etat in etats},
+        lots=bool(instance.lot_id) or any(etat[4] for etat in etats)
+    )
+
+
+# Soldes, journal des modifications et version des rapports d'une écriture : un seul
+# receveur par opération, les soldes relus étant journalisés avec l'écriture
 @receiver(post_save, sender=EcritureComptable)
+def enregistrer_ecriture(sender, instance, created, **kwargs):
+    etat = instance.etat_comptable()
+    etat_initial = None if created else getattr(instance, '_etat_initial', None)
+    modifies = []
+    if created or etat_initial:
+        modifies = _reporter_soldes(instance, etat_initial, etat)
+    elif session_active():
+        # État en base inconnu (instance non chargée ou chargée partiellement) : couples recalculés
+        session_active().marquer(instance.compte_id, instance.exercice_id, instance.lot_id)
+    else:
+        instance.compte.mettre_a_jour_solde(instance.exercice)
+        if instance.lot_id:
+            recalculer_soldes_lots([(instance.lot_id, instance.compte_id)])
+    instance._etat_initial = instance.etat_comptable()
+
+    journaliser([instance], Modification.CREATION if created else Modification.MODIFICATION, soldes=modifies)
+    _perimer(instance, etat_initial)
+
+
 @receiver(post_delete, sender=EcritureComptable)
-def update_solde(sender, instance, **kwargs):
-    instance.compte.mettre_a_jour_solde(instance.transaction.exercice)
\ No newline at end of file
+def supprimer_ecriture(sender, instance, **kwargs):
+    etat = getattr(instance, '_etat_initial', None) or instance.etat_comptable()
+    modifies = _reporter_soldes(instance, etat, None)
+    instance._etat_initial = None
+
+    journaliser([instance], Modification.SUPPRESSION, soldes=modifies)
+    _perimer(instance, etat)
+
+
+@receiver(post_save, sender=SoldeExerciceCompte)
+@receiver(post_delete, sender=SoldeExerciceCompte)
+def perimer_rapports(sender, instance, **kwargs):
+    nouvelle_version([instance.exercice_id])
+
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_save, sender=SoldeExerciceCompte)
+def journaliser_enregistrement(sender, instance, created, **kwargs):
+    journaliser([instance], Modification.CREATION if created else Modification.MODIFICATION)
+
+
+@receiver(post_delete, sender=Transaction)
+@receiver(post_delete, sender=SoldeExerciceCompte)
+def journaliser_suppression(sender, instance, **kwargs):
+    journaliser([instance], Modification.SUPPRESSION)
+
+
+@receiver(post_save, sender=ExerciceComptable)
+@receiver(post_delete, sender=ExerciceComptable)
+@receiver(post_save, sender=Compte)
+@receiver(post_delete, sender=Compte)
+def invalider_referentiel(sender, **kwargs):
+    invalider()
+    if sender is Compte:
+        # Libellé ou type du compte : balance et résultat de tous les exercices
+        nouvelle_version(tout=True)
+
+
+@receiver(post_migrate)
+def perimer_tous_rapports(sender, app_config=None, **kwargs):
+    # Base recréée ou vidée (flush, base de test) : les IDs repartent de zéro
+    if app_config and app_config.label == 'comptabilite':
+        nouvelle_version(tout=True)
+
+
+@receiver(post_save, sender=Abonnement)
+def planifier_abonnement(sender, instance, **kwargs):
+    echeance, cree = EcheanceAbonnement.objects.get_or_create(
+        abonnement=instance,
+        defaults={'prochaine_echeance': instance.premiere_periode}
+    )
+    # Tant que rien n'est facturé, l'échéancier suit la date de début
+    if not cree and not echeance.derniere_periode and echeance.prochaine_echeance != instance.premiere_periode:
+        echeance.prochaine_echeance = instance.premiere_periode
+        echeance.save(update_fields=['prochaine_echeance'])
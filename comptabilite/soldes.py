@@ -0,0 +1,409 @@
+# comptabilite/soldes.py
+"""
+Moteur de maintenance des soldes (SoldeExerciceCompte).
+
+Chaque écriture applique uniquement son montant au total débit ou crédit
+et au solde actuel (débit +, crédit -) de son compte via une mise à jour
+atomique F(), au lieu de ré-agréger toutes les écritures de l'exercice.
+`verifier_soldes` recalcule soldes et totaux depuis les écritures pour
+détecter (et corriger) les dérives. Les écritures rattachées à un lot
+alimentent de la même façon le solde cumulé du lot (SoldeLot).
+
+Dans une `session_saisie`, le travail est différé : les montants signés
+des écritures sont cumulés par (compte, exercice) et (lot, compte), puis
+appliqués à la sortie de la session en quelques UPDATE F() groupés. Les
+insertions en masse (bulk_create, qui ne déclenche pas les signaux) passent
+par `creer_ecritures` : leurs montants sont cumulés de même (`par_deltas`,
+saisie et import) ou leurs couples recalculés depuis les écritures
+(écritures de clôture, passées dans un exercice en clôture). Les écritures
+dont l'état en base est inconnu font aussi recalculer leurs couples.
+"""
+import decimal
+import functools
+import operator
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Q, Sum, Value, When
+
+from .cache_rapports import nouvelle_version
+from .models import EcritureComptable, ExerciceComptable, Modification, SoldeExerciceCompte, SoldeLot
+from .modifications import journaliser, journaliser_soldes
+
+ZERO = decimal.Decimal('0.00')
+CENTIMES = decimal.Decimal('0.01')
+
+# Nombre de soldes modifiés par UPDATE groupé
+TAILLE_DELTAS = 200
+
+_local = threading.local()
+
+
+class SessionSaisie:
+    """
+    Mouvements en attente d'une session de saisie : deltas (débit, crédit)
+    par (compte_id, exercice_id) et (lot_id, compte_id), et couples à
+    recalculer depuis les écritures
+    """
+
+    def __init__(self):
+        self.deltas = defaultdict(lambda: [ZERO, ZERO])
+        self.deltas_lots = defaultdict(lambda: [ZERO, ZERO])
+        self.paires = set()
+        self.lots = set()
+
+    def ajouter(self, compte_id, exercice_id, type_ecriture, montant, lot_id=None):
+        """Cumule le montant d'une écriture (négatif pour l'annuler)"""
+        montant = decimal.Decimal(montant)
+        sens = 0 if type_ecriture == 'DB' else 1
+        self.deltas[(compte_id, exercice_id)][sens] += montant
+        if lot_id:
+            self.deltas_lots[(lot_id, compte_id)][sens] += montant
+
+    def marquer(self, compte_id, exercice_id, lot_id=None):
+        """Couples à recalculer depuis les écritures"""
+        self.paires.add((compte_id, exercice_id))
+        if lot_id:
+            self.lots.add((lot_id, compte_id))
+
+    def marquer_ecritures(self, ecritures):
+        for ecriture in ecritures:
+            self.marquer(ecriture.compte_id, ecriture.exercice_id, ecriture.lot_id)
+
+
+def session_active():
+    return getattr(_local, 'session', None)
+
+
+@contextmanager
+def session_saisie():
+    """
+    Diffère et regroupe la mise à jour des soldes jusqu'à la sortie du bloc.
+    Les sessions imbriquées partagent la session englobante ; en cas
+    d'exception, rien n'est recalculé (la transaction est annulée).
+    """
+    session = session_active()
+    if session is not None:
+        yield session
+        return
+
+    session = _local.session = SessionSaisie()
+    try:
+        yield session
+    finally:
+        _local.session = None
+    # Les couples recalculés depuis les écritures intègrent déjà leurs deltas
+    appliquer_deltas(
+        {cle: delta for cle, delta in session.deltas.items() if cle not in session.paires},
+        {cle: delta for cle, delta in session.deltas_lots.items() if cle not in session.lots},
+    )
+    recalculer_soldes(session.paires)
+    recalculer_soldes_lots(session.lots)
+
+
+def creer_ecritures(ecritures, batch_size=None, par_deltas=False):
+    """
+    bulk_create d'écritures avec recalcul des soldes concernés ; avec
+    `par_deltas`, leurs montants sont ajoutés aux soldes, sans ré-agréger
+    l'exercice (exercices ouverts aux mouvements uniquement)
+    """
+    for ecriture in ecritures:
+        # bulk_create n'appelle pas save() : synchronisation de l'exercice dénormalisé
+        ecriture.exercice_id = ecriture.transaction.exercice_id
+    with transaction.atomic(), session_saisie() as session:
+        ecritures = EcritureComptable.objects.bulk_create(ecritures, batch_size=batch_size)
+        if par_deltas:
+            for ecriture in ecritures:
+                session.ajouter(
+                    ecriture.compte_id, ecriture.exercice_id, ecriture.type_ecriture, ecriture.montant, ecriture.lot_id
+                )
+        else:
+            session.marquer_ecritures(ecritures)
+        journaliser(ecritures, Modification.CREATION)
+        nouvelle_version({e.exercice_id for e in ecritures}, lots=any(e.lot_id for e in ecritures))
+    return ecritures
+
+
+def recalculer_soldes(paires):
+    """Recalcule depuis les écritures les soldes des couples (compte_id, exercice_id)"""
+    comptes_par_exercice = defaultdict(set)
+    for compte_id, exercice_id in paires:
+        comptes_par_exercice[exercice_id].add(compte_id)
+
+    exercices = ExerciceComptable.objects.in_bulk(comptes_par_exercice)
+    for exercice_id, compte_ids in comptes_par_exercice.items():
+        verifier_soldes(exercices[exercice_id], reconstruire=True, compte_ids=compte_ids)
+
+
+def recalculer_soldes_lots(couples):
+    """Recalcule depuis les écritures les soldes des couples (lot_id, compte_id)"""
+    if couples:
+        verifier_soldes_lots(reconstruire=True, couples=couples)
+
+
+def montant_signe(type_ecriture, montant):
+    """Montant signé d'une écriture : positif au débit, négatif au crédit."""
+    montant = decimal.Decimal(montant)
+    return montant if type_ecriture == 'DB' else -montant
+
+
+def _ajouter(soldes, champ_solde, debit, credit, **cles):
+    """
+    UPDATE atomique des totaux débit et crédit et du solde ; crée la ligne au
+    premier mouvement. Retourne True si une ligne existante a été modifiée.
+    """
+    lignes = soldes.filter(**cles)
+    valeurs = {
+        'total_debit': F('total_debit') + debit,
+        'total_credit': F('total_credit') + credit,
+        champ_solde: F(champ_solde) + (debit - credit),
+    }
+    if lignes.update(**valeurs):
+        return True
+
+    with transaction.atomic():
+        _, cree = soldes.get_or_create(
+            **cles, defaults={'total_debit': debit, 'total_credit': credit, champ_solde: debit - credit}
+        )
+    if not cree:
+        lignes.update(**valeurs)
+    return not cree
+
+
+def verifier_mouvement_autorise(exercice):
+    """Refuse tout mouvement sur un exercice clôturé ou en cours de clôture"""
+    if not exercice.est_ouvert:
+        raise ValidationError("Impossible de modifier le solde pour un exercice clôturé.")
+    if exercice.en_cloture:
+        raise ValidationError(f"L'exercice {exercice} est en cours de clôture : aucune écriture ne peut y être passée.")
+
+
+def verifier_mouvements_autorises(exercice_ids):
+    """Refuse tout mouvement si l'un des exercices est clôturé ou en cours de clôture (une requête)"""
+    refuse = ExerciceComptable.objects.filter(
+        Q(est_ouvert=False) | Q(en_cloture=True), pk__in=exercice_ids
+    ).order_by('pk').first()
+    if refuse:
+        verifier_mouvement_autorise(refuse)
+
+
+def appliquer_mouvements(mouvements):
+    """
+    Ajoute les montants des mouvements (compte_id, exercice, type_ecriture,
+    montant, lot_id) — négatifs pour annuler une écriture — aux totaux et
+    soldes des comptes pour l'exercice et des lots : un UPDATE F() par solde
+    touché, les mouvements d'un même solde étant cumulés. Retourne les couples
+    (compte_id, exercice_id) des soldes existants modifiés, à journaliser par
+    l'appelant (les créations le sont par le signal post_save).
+    """
+    cumul = SessionSaisie()
+    for compte_id, exercice, type_ecriture, montant, lot_id in mouvements:
+        if montant:
+            verifier_mouvement_autorise(exercice)
+            cumul.ajouter(compte_id, exercice.pk, type_ecriture, montant, lot_id)
+
+    modifies = [
+        (compte_id, exercice_id)
+        for (compte_id, exercice_id), (debit, credit) in cumul.deltas.items()
+        if (debit or credit) and _ajouter(
+            SoldeExerciceCompte.objects, 'solde_actuel', debit, credit, compte_id=compte_id, exercice_id=exercice_id
+        )
+    ]
+    for (lot_id, compte_id), (debit, credit) in cumul.deltas_lots.items():
+        if debit or credit:
+            _ajouter(SoldeLot.objects, 'solde', debit, credit, lot_id=lot_id, compte_id=compte_id)
+    return modifies
+
+
+def appliquer_deltas(deltas, deltas_lots=None):
+    """
+    Ajoute les deltas {(compte_id, exercice_id): (débit, crédit)} aux soldes
+    des exercices et {(lot_id, compte_id): (débit, crédit)} aux soldes des
+    lots, en UPDATE F() groupés.
+    """
+    deltas = {cle: delta for cle, delta in deltas.items() if any(delta)}
+    deltas_lots = {cle: delta for cle, delta in (deltas_lots or {}).items() if any(delta)}
+    exercice_ids = {exercice_id for _, exercice_id in deltas}
+    verifier_mouvements_autorises(exercice_ids)
+
+    with transaction.atomic():
+        modifies = _ajouter_groupe(
+            SoldeExerciceCompte.objects, 'solde_actuel', deltas, ('compte_id', 'exercice_id')
+        )
+        # Les créations sont journalisées par le signal post_save, pas les UPDATE F()
+        journaliser_soldes(modifies)
+        _ajouter_groupe(SoldeLot.objects, 'solde', deltas_lots, ('lot_id', 'compte_id'))
+    nouvelle_version(exercice_ids, lots=bool(deltas_lots))
+
+
+def _ajouter_groupe(soldes, champ_solde, deltas, champs):
+    """
+    Deltas (débit, crédit) par clé `champs` appliqués aux lignes existantes
+    par UPDATE F() + CASE ; les lignes absentes sont créées une à une.
+    Retourne les clés des lignes existantes modifiées.
+    """
+    montant = DecimalField(max_digits=14, decimal_places=2)
+    modifies = []
+    cles = sorted(deltas)
+    for debut in range(0, len(cles), TAILLE_DELTAS):
+        tranche = cles[debut:debut + TAILLE_DELTAS]
+        conditions = {cle: Q(**dict(zip(champs, cle))) for cle in tranche}
+        selection = soldes.filter(functools.reduce(operator.or_, conditions.values()))
+        existants = set(selection.values_list(*champs))
+
+        if existants:
+            def cas(valeur):
+                return Case(
+                    *[When(conditions[cle], then=Value(valeur(*deltas[cle]))) for cle in existants],
+                    default=Value(ZERO), output_field=montant
+                )
+            selection.update(
+                total_debit=F('total_debit') + cas(lambda debit, credit: debit),
+                total_credit=F('total_credit') + cas(lambda debit, credit: credit),
+                **{champ_solde: F(champ_solde) + cas(lambda debit, credit: debit - credit)}
+            )
+            modifies += sorted(existants)
+
+        for cle in tranche:
+            if cle not in existants:
+                _ajouter(soldes, champ_solde, *deltas[cle], **dict(zip(champs, cle)))
+    return modifies
+
+
+def totaux_par_compte(ecritures):
+    """Totaux débit / crédit par compte, en une seule requête groupée."""
+    return totaux_groupes(ecritures, 'compte_id')
+
+
+def totaux_groupes(ecritures, *cles):
+    """Totaux débit / crédit par valeur des champs `cles`, en une seule requête groupée."""
+    montant_decimal = DecimalField(max_digits=14, decimal_places=2)
+    totaux = ecritures.values(*cles).annotate(
+        debit=Sum(
+            Case(When(type_ecriture='DB', then=F('montant')), default=Value(ZERO)),
+            output_field=montant_decimal
+        ),
+        credit=Sum(
+            Case(When(type_ecriture='CR', then=F('montant')), default=Value(ZERO)),
+            output_field=montant_decimal
+        ),
+    ).order_by()
+    # SQLite somme les décimaux en flottants : totaux ramenés au centime pour être comparables aux soldes stockés
+    return {
+        (t[cles[0]] if len(cles) == 1 else tuple(t[cle] for cle in cles)): (
+            decimal.Decimal(t['debit'] or ZERO).quantize(CENTIMES),
+            decimal.Decimal(t['credit'] or ZERO).quantize(CENTIMES)
+        )
+        for t in totaux
+    }
+
+
+def verifier_soldes(exercice, reconstruire=False, compte_ids=None):
+    """
+    Recalcule les soldes et totaux de l'exercice depuis les écritures et les
+    compare aux valeurs stockées. Retourne la liste des écarts (solde ou
+    totaux) sous forme de tuples (compte_id, solde stocké ou None, solde
+    calculé). Avec `reconstruire`, les lignes en écart sont corrigées.
+    `compte_ids` limite la vérification à certains comptes.
+    """
+    if reconstruire and not exercice.est_ouvert:
+        raise ValidationError("Impossible de modifier le solde pour un exercice clôturé.")
+
+    ecritures = EcritureComptable.objects.filter(exercice=exercice)
+    soldes = SoldeExerciceCompte.objects.filter(exercice=exercice)
+    if compte_ids is not None:
+        ecritures = ecritures.filter(compte_id__in=compte_ids)
+        soldes = soldes.filter(compte_id__in=compte_ids)
+
+    totaux = totaux_par_compte(ecritures)
+    soldes = {s.compte_id: s for s in soldes}
+
+    ecarts, a_corriger, a_creer = [], [], []
+    for compte_id in sorted(set(totaux) | set(soldes)):
+        debit, credit = totaux.get(compte_id, (ZERO, ZERO))
+        solde = soldes.get(compte_id)
+        solde_initial = decimal.Decimal(solde.solde_initial) if solde else ZERO
+        calcule = solde_initial + debit - credit
+        stocke = decimal.Decimal(solde.solde_actuel) if solde else None
+
+        if solde and (stocke, solde.total_debit, solde.total_credit) == (calcule, debit, credit):
+            continue
+        ecarts.append((compte_id, stocke, calcule))
+
+        if solde:
+            solde.solde_actuel = calcule
+            solde.total_debit = debit
+            solde.total_credit = credit
+            a_corriger.append(solde)
+        else:
+            a_creer.append(SoldeExerciceCompte(
+                compte_id=compte_id,
+                exercice=exercice,
+                solde_actuel=calcule,
+                total_debit=debit,
+                total_credit=credit
+            ))
+
+    if reconstruire and ecarts:
+        with transaction.atomic():
+            SoldeExerciceCompte.objects.bulk_update(a_corriger, ['solde_actuel', 'total_debit', 'total_credit'])
+            SoldeExerciceCompte.objects.bulk_create(a_creer)
+            journaliser(a_corriger, Modification.MODIFICATION)
+            journaliser(a_creer, Modification.CREATION)
+        nouvelle_version([exercice.pk])
+
+    return ecarts
+
+
+def verifier_soldes_lots(reconstruire=False, lot_ids=None, couples=None):
+    """
+    Recalcule les soldes cumulés des lots depuis les écritures et les compare
+    aux soldes stockés. Retourne la liste des écarts sous forme de tuples
+    (lot_id, compte_id, solde stocké ou None, solde calculé). Avec
+    `reconstruire`, les soldes en écart sont corrigés. `lot_ids` ou `couples`
+    (lot_id, compte_id) limitent la vérification.
+    """
+    ecritures = EcritureComptable.objects.filter(lot__isnull=False)
+    soldes = SoldeLot.objects.all()
+    if couples is not None:
+        couples = set(couples)
+        lot_ids = {lot_id for lot_id, _ in couples}
+        compte_ids = {compte_id for _, compte_id in couples}
+        ecritures = ecritures.filter(compte_id__in=compte_ids)
+        soldes = soldes.filter(compte_id__in=compte_ids)
+    if lot_ids is not None:
+        ecritures = ecritures.filter(lot_id__in=lot_ids)
+        soldes = soldes.filter(lot_id__in=lot_ids)
+
+    totaux = totaux_groupes(ecritures, 'lot_id', 'compte_id')
+    soldes = {(s.lot_id, s.compte_id): s for s in soldes}
+
+    ecarts, a_corriger, a_creer = [], [], []
+    for cle in sorted(set(totaux) | set(soldes)):
+        if couples is not None and cle not in couples:
+            continue
+        debit, credit = totaux.get(cle, (ZERO, ZERO))
+        solde = soldes.get(cle)
+        calcule = debit - credit
+        if solde and (solde.solde, solde.total_debit, solde.total_credit) == (calcule, debit, credit):
+            continue
+        ecarts.append((*cle, decimal.Decimal(solde.solde) if solde else None, calcule))
+
+        if solde:
+            solde.solde, solde.total_debit, solde.total_credit = calcule, debit, credit
+            a_corriger.append(solde)
+        else:
+            a_creer.append(SoldeLot(
+                lot_id=cle[0], compte_id=cle[1], solde=calcule, total_debit=debit, total_credit=credit
+            ))
+
+    if reconstruire and ecarts:
+        with transaction.atomic():
+            SoldeLot.objects.bulk_update(a_corriger, ['solde', 'total_debit', 'total_credit'])
+            SoldeLot.objects.bulk_create(a_creer)
+        nouvelle_version(lots=True)
+
+    return ecarts
@@ -0,0 +1,181 @@
+# comptabilite/synthetique.py
+"""
+Générateur de jeux de données synthétiques pour les mesures de performance.
+
+Le jeu est réaliste mais déterministe (graine fixe) : immeubles, lots,
+abonnements avec leur échéancier, plusieurs exercices consécutifs et des
+écritures équilibrées (appels de fonds, avances, règlements sur avance,
+charges fournisseurs). Les écritures sont insérées en masse, sans passer
+par les signaux ; les soldes sont reconstruits une fois par exercice.
+"""
+import random
+import string
+from datetime import date, timedelta
+from decimal import Decimal
+
+from patrimoine.models import Immeuble, Lot
+
+from .models import (
+    Abonnement, Compte, EcheanceAbonnement, EcritureComptable, ExerciceComptable, Transaction
+)
+from .referentiel import invalider
+from .soldes import verifier_soldes, verifier_soldes_lots
+
+# Taille des lots d'insertion (transactions par bulk_create)
+TAILLE_LOT = 5000
+
+COMPTES = [
+    ("7111", "Appels de fonds", 'recette'),
+    ("3421", "Copropriétaire individualisé", 'actif'),
+    ("4421", "Copropriétaire – avances", 'passif'),
+    ("5141", "Banque", 'actif'),
+    ("890", "Résultat de l'exercice", 'ajustement'),
+    ("119", "Résultat net", 'passif'),
+]
+
+# Répartition des fréquences d'abonnement (cumulée)
+FREQUENCES = [(0.7, 'mensuel'), (0.9, 'trimestriel'), (1.0, 'annuel')]
+
+
+def _code_immeuble(indice):
+    """Code sur deux caractères (base 36) : 00, 01, ..., ZZ"""
+    alphabet = string.digits + string.ascii_uppercase
+    return alphabet[indice // 36 % 36] + alphabet[indice % 36]
+
+
+def creer_comptes(charges=20):
+    comptes = {}
+    for numero, libelle, type_compte in COMPTES + [(f"61{i:02}", f"Charges {i}", 'depense') for i in range(charges)]:
+        comptes[numero], _ = Compte.objects.get_or_create(
+            compte=numero, defaults={'libelle': libelle, 'type_compte': type_compte}
+        )
+    return comptes
+
+
+def generer_jeu(immeubles=1, lots=100, abonnements=None, exercices=1, ecritures=10000,
+                annee=2100, actuel=False, graine=42, sortie=None):
+    """
+    Génère un jeu complet et retourne un dictionnaire décrivant ce qui a été créé
+    (exercices, comptes, immeubles, lots, nombre d'abonnements et d'écritures).
+
+    `exercices` exercices consécutifs sont créés à partir de `annee` ; seul le
+    dernier reste ouvert, et devient l'exercice actuel avec `actuel`. Les
+    abonnements (par défaut un par lot) démarrent au début du dernier exercice,
+    leur première échéance est donc due à cette date.
+    """
+    aleatoire = random.Random(graine)
+    abonnements = lots if abonnements is None else abonnements
+
+    def journal(message):
+        if sortie:
+            sortie.write(message)
+
+    comptes = creer_comptes()
+    charges = [compte for numero, compte in comptes.items() if numero.startswith('61')]
+
+    if actuel:
+        ExerciceComptable.objects.filter(est_actuel=True).update(est_actuel=False)
+        invalider()
+    liste_exercices = [
+        ExerciceComptable.objects.create(
+            date_debut=date(annee + i, 1, 1),
+            date_fin=date(annee + i, 12, 31),
+            est_actuel=actuel and i == exercices - 1
+        )
+        for i in range(exercices)
+    ]
+
+    liste_immeubles = Immeuble.objects.bulk_create([
+        Immeuble(code=_code_immeuble(i), libelle=f"Immeuble {i}") for i in range(max(1, immeubles))
+    ])
+    liste_lots = Lot.objects.bulk_create(
+        [
+            Lot(code=f"{i % 1000:03}", libelle=f"Lot {i}", immeuble=liste_immeubles[i % len(liste_immeubles)])
+            for i in range(lots)
+        ],
+        batch_size=1000
+    )
+    journal(f"🏢 {len(liste_immeubles)} immeuble(s), {len(liste_lots)} lot(s)")
+
+    debut_abonnements = liste_exercices[-1].date_debut
+    liste_abonnements = []
+    for i in range(abonnements if liste_lots else 0):
+        tirage = aleatoire.random()
+        frequence = next(nom for seuil, nom in FREQUENCES if tirage < seuil)
+        liste_abonnements.append(Abonnement(
+            lot=liste_lots[i % len(liste_lots)],
+            montant=Decimal(aleatoire.randrange(200, 2000)),
+            frequence=frequence,
+            date_debut=debut_abonnements
+        ))
+    liste_abonnements = Abonnement.objects.bulk_create(liste_abonnements, batch_size=1000)
+    EcheanceAbonnement.objects.bulk_create(
+        [EcheanceAbonnement(abonnement=abo, prochaine_echeance=abo.premiere_periode) for abo in liste_abonnements],
+        batch_size=1000
+    )
+    journal(f"🔁 {len(liste_abonnements)} abonnement(s)")
+
+    total = 0
+    for indice, exercice in enumerate(liste_exercices):
+        # Répartition uniforme des écritures entre les exercices (deux lignes par transaction)
+        restant = (ecritures * (indice + 1) // exercices - ecritures * indice // exercices) // 2
+        duree = (exercice.date_fin - exercice.date_debut).days + 1
+        while restant > 0:
+            taille = min(restant, TAILLE_LOT)
+            restant -= taille
+            transactions = Transaction.objects.bulk_create([
+                Transaction(
+                    date_operation=exercice.date_debut + timedelta(days=aleatoire.randrange(duree)),
+                    libelle=f"OPERATION {i}",
+                    exercice=exercice
+                )
+                for i in range(taille)
+            ])
+
+            lignes_ecritures = []
+            for transac in transactions:
+                montant = Decimal(aleatoire.randrange(100, 100000)) / 100
+                tirage = aleatoire.random()
+                lot = aleatoire.choice(liste_lots) if liste_lots else None
+                if tirage < 0.5:
+                    # Appel de fonds
+                    lignes = [(comptes["3421"], 'DB', lot), (comptes["7111"], 'CR', None)]
+                elif tirage < 0.7:
+                    # Versement d'avance
+                    lignes = [(comptes["5141"], 'DB', None), (comptes["4421"], 'CR', lot)]
+                elif tirage < 0.8:
+                    # Appel réglé sur avance
+                    lignes = [(comptes["4421"], 'DB', lot), (comptes["7111"], 'CR', None)]
+                else:
+                    # Charge fournisseur
+                    lignes = [(aleatoire.choice(charges), 'DB', None), (comptes["5141"], 'CR', None)]
+                lignes_ecritures += [
+                    EcritureComptable(
+                        compte=compte, montant=montant, type_ecriture=type_ecriture,
+                        transaction=transac, exercice=exercice, lot=lot_ecriture
+                    )
+                    for compte, type_ecriture, lot_ecriture in lignes
+                ]
+            # Insertion brute : les soldes sont reconstruits une seule fois par exercice
+            EcritureComptable.objects.bulk_create(lignes_ecritures)
+            total += len(lignes_ecritures)
+
+        verifier_soldes(exercice, reconstruire=True)
+    # Soldes cumulés des lots (tous exercices), reconstruits une fois pour tout le jeu
+    verifier_soldes_lots(reconstruire=True, lot_ids=[lot.pk for lot in liste_lots])
+    journal(f"🧾 {total} écriture(s) sur {len(liste_exercices)} exercice(s)")
+
+    # Les exercices antérieurs sont figés une fois leurs soldes reconstruits
+    ExerciceComptable.objects.filter(pk__in=[e.pk for e in liste_exercices[:-1]]).update(est_ouvert=False)
+    invalider()
+    for exercice in liste_exercices[:-1]:
+        exercice.est_ouvert = False
+
+    return {
+        'exercices': liste_exercices,
+        'comptes': comptes,
+        'immeubles': liste_immeubles,
+        'lots': liste_lots,
+        'abonnements': len(liste_abonnements),
+        'ecritures': total,
+    }
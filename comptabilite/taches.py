@@ -0,0 +1,155 @@
+# comptabilite/taches.py
+"""
+File de tâches de fond en base (modèle Tache), exécutées par la commande
+`travailleur` hors des requêtes web.
+
+Une tâche est une suite de phases. Chaque phase s'exécute dans sa propre
+transaction, qui enregistre aussi son point de reprise (`etat`, numéro de
+la phase suivante) : après un arrêt brutal du travailleur, la phase
+interrompue est annulée par la base et la tâche reprend à cette phase,
+sans écriture en double. Une phase longue peut être découpée en étapes :
+tant que sa fonction retourne False, elle est rappelée, chaque étape étant
+validée avec son point de reprise et un signe de vie du travailleur. Un travailleur ne prend une tâche qu'en la
+marquant en cours à son nom par un UPDATE conditionnel ; une tâche en
+cours sans activité depuis `delai_reprise` secondes est considérée comme
+abandonnée et reprise. Si deux travailleurs exécutent la même phase, seul
+celui qui détient encore la tâche peut valider : l'autre est annulé.
+
+Une phase en erreur met la tâche en échec ; `relancer` la remet en
+attente et elle reprend à la phase en erreur.
+"""
+import logging
+import traceback
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ExerciceComptable, Tache
+from .soldes import session_saisie
+
+logger = logging.getLogger(__name__)
+
+# Durée (secondes) sans activité au-delà de laquelle une tâche en cours est reprise
+DELAI_REPRISE = 1800
+
+
+class TacheReprise(Exception):
+    """La tâche a été reprise par un autre travailleur : la phase en cours est annulée"""
+
+
+def _phase_cloture(phase):
+    def executer(parametres, etat):
+        exercice = ExerciceComptable.objects.get(pk=parametres['exercice'])
+        with session_saisie():
+            return exercice.executer_phase_cloture(phase, etat)
+    return executer
+
+
+def _fermer_exercice(parametres, etat):
+    exercice = ExerciceComptable.objects.get(pk=parametres['exercice'])
+    exercice.est_ouvert = False
+    exercice.en_cloture = False
+    exercice.save()
+
+
+# Phases de chaque type de tâche : (libellé, fonction(paramètres, état))
+PHASES = {
+    Tache.CLOTURE_EXERCICE: [
+        ("Calcul des soldes", _phase_cloture('soldes')),
+        ("Clôture des comptes de produits et charges", _phase_cloture('cloture_produits_charges')),
+        ("Report du résultat net", _phase_cloture('report_resultat')),
+        ("Création ou reprise de l'exercice suivant", _phase_cloture('creation_exercice')),
+        ("Report des soldes", _phase_cloture('report_soldes')),
+        ("Fermeture de l'exercice", _fermer_exercice),
+    ],
+}
+
+
+def planifier(type_tache, libelle, **parametres):
+    """Ajoute une tâche à la file"""
+    return Tache.objects.create(
+        type=type_tache, libelle=libelle, parametres=parametres, etapes=len(PHASES[type_tache])
+    )
+
+
+def planifier_cloture(exercice):
+    """
+    Planifie la clôture de l'exercice ; refusée s'il est clôturé ou si sa
+    clôture est déjà planifiée. L'exercice suivant est créé, ou repris s'il
+    existe déjà (voir ExerciceComptable.executer_phase_cloture).
+    """
+    if not exercice.est_ouvert:
+        raise ValidationError(f"L'exercice {exercice} est déjà clôturé.")
+    if Tache.objects.filter(
+        type=Tache.CLOTURE_EXERCICE, parametres__exercice=exercice.pk,
+        statut__in=[Tache.EN_ATTENTE, Tache.EN_COURS, Tache.ECHEC]
+    ).exists():
+        raise ValidationError(f"La clôture de l'exercice {exercice} est déjà planifiée.")
+    return planifier(Tache.CLOTURE_EXERCICE, f"Clôture de l'exercice {exercice}", exercice=exercice.pk)
+
+
+def relancer(tache):
+    """Remet en attente une tâche en échec : elle reprendra à la phase en erreur"""
+    return Tache.objects.filter(pk=tache.pk, statut=Tache.ECHEC).update(statut=Tache.EN_ATTENTE, erreur='')
+
+
+def prendre(travailleur, delai_reprise=DELAI_REPRISE):
+    """Attribue au travailleur la plus ancienne tâche en attente ou abandonnée ; None s'il n'y en a pas"""
+    abandon = timezone.now() - timedelta(seconds=delai_reprise)
+    disponibles = Tache.objects.filter(
+        Q(statut=Tache.EN_ATTENTE) | Q(statut=Tache.EN_COURS, date_activite__lt=abandon)
+    ).order_by('id')
+    for tache in disponibles.only('pk', 'statut', 'travailleur')[:10]:
+        # UPDATE conditionnel : un seul travailleur obtient la tâche
+        maintenant = timezone.now()
+        if Tache.objects.filter(pk=tache.pk, statut=tache.statut, travailleur=tache.travailleur).update(
+            statut=Tache.EN_COURS, travailleur=travailleur, date_activite=maintenant
+        ):
+            tache = Tache.objects.get(pk=tache.pk)
+            if tache.date_debut is None:
+                Tache.objects.filter(pk=tache.pk).update(date_debut=maintenant)
+                tache.date_debut = maintenant
+            return tache
+    return None
+
+
+def executer(tache):
+    """
+    Exécute les phases restantes de la tâche (prise par `prendre`). Retourne
+    True si elle est terminée, False si elle a échoué ou a été reprise par
+    un autre travailleur.
+    """
+    phases = PHASES[tache.type]
+    Tache.objects.filter(pk=tache.pk).update(tentatives=tache.tentatives + 1)
+    proprietaire = Tache.objects.filter(pk=tache.pk, travailleur=tache.travailleur, statut=Tache.EN_COURS)
+
+    for numero in range(tache.etape, len(phases)):
+        libelle, fonction = phases[numero]
+        proprietaire.update(phase=libelle, date_activite=timezone.now())
+        termine = False
+        while not termine:
+            etat = dict(tache.etat)
+            try:
+                with transaction.atomic():
+                    termine = fonction(tache.parametres, etat) is not False
+                    # Point de reprise (et signe de vie) enregistré avec la phase ou l'étape de phase,
+                    # si la tâche est toujours à ce travailleur
+                    if not proprietaire.filter(etape=numero).update(
+                        etape=numero + 1 if termine else numero, etat=etat, date_activite=timezone.now()
+                    ):
+                        raise TacheReprise
+            except TacheReprise:
+                logger.warning("Tâche %s reprise par un autre travailleur", tache.pk)
+                return False
+            except Exception:
+                logger.exception("Tâche %s : échec de la phase « %s »", tache.pk, libelle)
+                proprietaire.update(statut=Tache.ECHEC, erreur=traceback.format_exc(), date_fin=timezone.now())
+                return False
+            tache.etat = etat
+        tache.etape = numero + 1
+
+    proprietaire.update(statut=Tache.TERMINEE, phase='', erreur='', date_fin=timezone.now())
+    return True
@@ -1,3 +1,1713 @@
-from django.test import TestCase
+import decimal
+import importlib
+import io
+import json
+import os
+import random
+import tempfile
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+import tablib
+from django.apps import apps
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.http import QueryDict
+from django.urls import reverse, reverse_lazy
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from patrimoine.models import Immeuble, Lot
+
+from . import referentiel
+from .balance import balance_generale, totaux_balance, verifier_balance
+from .cache_rapports import GENERAL, versions
+from .grand_livre import ENTETE, lignes_grand_livre
+from .import_ecritures import grouper, importer_ecritures
+from .models import (
+    Abonnement, Compte, EcheanceAbonnement, EcritureComptable, ExerciceComptable, Modification, SoldeExerciceCompte,
+    Tache, Transaction
+)
+from .modifications import modifications_depuis
+from .pagination import EstimatedCountPaginator
+from .profilage import collecte, forcer, profiler, resume
+from .releve import releve_lot, releves_immeuble, solde_lot
+from .resources import CompteResource
+from .saisie import enregistrer, saisir_transactions
+from .soldes import creer_ecritures, session_saisie, verifier_soldes, verifier_soldes_lots
+from .taches import PHASES, executer, planifier_cloture, prendre, relancer
+
+D = decimal.Decimal
+
+# Cache des rapports en mémoire locale : les tests n'écrivent pas dans le cache partagé
+CACHES_TESTS = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'rapports': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'rapports-tests'},
+}
+
+
+@override_settings(CACHES=CACHES_TESTS)
+class ComptabiliteTestCase(TestCase):
+    """Exercice 2025 ouvert, plan comptable minimal et un immeuble de trois lots"""
+
+    def setUp(self):
+        self.exercice = ExerciceComptable.objects.create(
+            date_debut=date(2025, 1, 1), date_fin=date(2025, 12, 31), est_actuel=True
+        )
+        self.comptes = {
+            numero: Compte.objects.create(compte=numero, libelle=libelle, type_compte=type_compte)
+            for numero, libelle, type_compte in [
+                ('7111', 'Appels de fonds', 'recette'),
+                ('3421', 'Copropriétaires', 'actif'),
+                ('4421', 'Avances', 'passif'),
+                ('6111', 'Charges', 'depense'),
+                ('5141', 'Banque', 'actif'),
+                ('890', 'Résultat', 'ajustement'),
+                ('119', 'Résultat net', 'passif'),
+            ]
+        }
+        immeuble = Immeuble.objects.create(code='A', libelle='Immeuble A')
+        self.lots = [Lot.objects.create(code=f'A{i}', libelle=f'Lot {i}', immeuble=immeuble) for i in range(3)]
+
+    def poser(self, debit, credit, montant, exercice=None, lot=None, date_operation=None):
+        """Transaction équilibrée de deux écritures ; le lot porte sur l'écriture au débit"""
+        exercice = exercice or self.exercice
+        transac = Transaction.objects.create(
+            exercice=exercice, date_operation=date_operation or exercice.date_debut, libelle='Test'
+        )
+        EcritureComptable.objects.create(
+            transaction=transac, compte=self.comptes[debit], type_ecriture='DB', montant=montant, lot=lot
+        )
+        EcritureComptable.objects.create(
+            transaction=transac, compte=self.comptes[credit], type_ecriture='CR', montant=montant
+        )
+        return transac
+
+    def solde(self, numero, exercice=None):
+        return SoldeExerciceCompte.objects.get(
+            compte=self.comptes[numero], exercice=exercice or self.exercice
+        ).solde_actuel
+
+    def assertSoldesJustes(self, *exercices):
+        for exercice in exercices or [self.exercice]:
+            self.assertEqual(verifier_soldes(exercice), [])
+        self.assertEqual(verifier_soldes_lots(), [])
+
+
+class VerifierSoldesTests(ComptabiliteTestCase):
+    def test_reconstruction_puis_verification_sans_ecart(self):
+        # Plusieurs milliers de montants au centime : la somme SQLite (flottante) ne tombe pas juste
+        aleatoire = random.Random(1)
+        montants = [D(str(round(aleatoire.uniform(10, 5000), 2))) for _ in range(2000)]
+        transac = Transaction.objects.create(exercice=self.exercice, date_operation=date(2025, 3, 1), libelle='Reprise')
+        EcritureComptable.objects.bulk_create([
+            EcritureComptable(
+                transaction=transac, exercice=self.exercice, compte=self.comptes['5141'],
+                type_ecriture='DB', montant=montant, lot=self.lots[0]
+            )
+            for montant in montants
+        ] + [
+            EcritureComptable(
+                transaction=transac, exercice=self.exercice, compte=self.comptes['7111'],
+                type_ecriture='CR', montant=sum(montants)
+            )
+        ])
+
+        self.assertTrue(verifier_soldes(self.exercice, reconstruire=True))
+        self.assertEqual(verifier_soldes(self.exercice), [])
+        self.assertEqual(verifier_soldes(self.exercice, reconstruire=True), [])
+        self.assertEqual(self.solde('5141'), sum(montants))
+        self.assertTrue(verifier_soldes_lots(reconstruire=True))
+        self.assertEqual(verifier_soldes_lots(), [])
+
+
+    def test_migration_des_totaux_corrige_les_soldes_des_exercices_ouverts(self):
+        renseigner_totaux = importlib.import_module(
+            'comptabilite.migrations.0006_soldeexercicecompte_totaux'
+        ).renseigner_totaux
+        cloture = ExerciceComptable.objects.create(date_debut=date(2024, 1, 1), date_fin=date(2024, 12, 31))
+        self.poser('3421', '7111', D('100.00'), exercice=cloture)
+        self.poser('3421', '7111', D('100.00'))
+        self.poser('5141', '3421', D('40.00'))
+        ExerciceComptable.objects.filter(pk=cloture.pk).update(est_ouvert=False)
+        # Dérives antérieures aux totaux : solde faux, solde manquant, solde arrêté d'un exercice clôturé
+        SoldeExerciceCompte.objects.filter(exercice=self.exercice, compte=self.comptes['3421']).update(
+            solde_actuel=D('75.00'), total_debit=0, total_credit=0
+        )
+        SoldeExerciceCompte.objects.filter(exercice=self.exercice, compte=self.comptes['5141']).delete()
+        SoldeExerciceCompte.objects.filter(exercice=cloture, compte=self.comptes['3421']).update(solde_actuel=D('90.00'))
+
+        renseigner_totaux(apps, None)
+        self.assertEqual(verifier_soldes(self.exercice), [])
+        self.assertEqual(self.solde('3421'), D('60.00'))
+        self.assertEqual(self.solde('5141'), D('40.00'))
+        solde_cloture = SoldeExerciceCompte.objects.get(exercice=cloture, compte=self.comptes['3421'])
+        self.assertEqual((solde_cloture.solde_actuel, solde_cloture.total_debit), (D('90.00'), D('100.00')))
+
+
+class SoldesDeltaTests(ComptabiliteTestCase):
+    """Soldes tenus par deltas (signaux) : toujours égaux au recalcul depuis les écritures"""
+
+    def setUp(self):
+        super().setUp()
+        self.exercice_suivant = ExerciceComptable.objects.create(date_debut=date(2026, 1, 1), date_fin=date(2026, 12, 31))
+
+    def ecriture(self, transac, sens):
+        return transac.ecritures.get(type_ecriture=sens)
+
+    def test_creation(self):
+        self.poser('3421', '7111', D('100.00'), lot=self.lots[0])
+        self.poser('3421', '7111', D('50.00'), lot=self.lots[0])
+        self.assertEqual(self.solde('3421'), D('150.00'))
+        self.assertEqual(self.solde('7111'), D('-150.00'))
+        self.assertEqual(solde_lot(self.lots[0], ('3421',)), D('150.00'))
+        self.assertSoldesJustes()
+
+    def test_modification_du_montant_et_du_sens(self):
+        transac = self.poser('3421', '7111', D('100.00'), lot=self.lots[0])
+        debit = self.ecriture(transac, 'DB')
+        debit.montant = D('80.00')
+        debit.save()
+        self.assertEqual(self.solde('3421'), D('80.00'))
+
+        debit.type_ecriture = 'CR'
+        debit.save()
+        self.assertEqual(self.solde('3421'), D('-80.00'))
+        self.assertEqual(solde_lot(self.lots[0], ('3421',)), D('-80.00'))
+        self.assertSoldesJustes()
+
+    def test_changement_de_compte_et_de_lot(self):
+        transac = self.poser('3421', '7111', D('100.00'), lot=self.lots[0])
+        debit = self.ecriture(transac, 'DB')
+        debit.compte = self.comptes['5141']
+        debit.lot = self.lots[1]
+        debit.save()
+        self.assertEqual(self.solde('3421'), D('0.00'))
+        self.assertEqual(self.solde('5141'), D('100.00'))
+        self.assertEqual(solde_lot(self.lots[0], ('3421', '5141')), D('0.00'))
+        self.assertEqual(solde_lot(self.lots[1], ('5141',)), D('100.00'))
+        self.assertSoldesJustes()
+
+    def test_changement_d_exercice_de_l_ecriture(self):
+        transac = self.poser('3421', '7111', D('100.00'))
+        autre = Transaction.objects.create(exercice=self.exercice_suivant, date_operation=date(2026, 1, 5), libelle='Autre')
+        debit = self.ecriture(transac, 'DB')
+        debit.transaction = autre
+        debit.save()
+        self.assertEqual(self.solde('3421'), D('0.00'))
+        self.assertEqual(self.solde('3421', self.exercice_suivant), D('100.00'))
+        self.assertSoldesJustes(self.exercice, self.exercice_suivant)
+
+    def test_changement_d_exercice_de_la_transaction(self):
+        transac = self.poser('3421', '7111', D('100.00'), lot=self.lots[0])
+        transac = Transaction.objects.get(pk=transac.pk)
+        transac.exercice = self.exercice_suivant
+        transac.save()
+        self.assertEqual(self.solde('3421'), D('0.00'))
+        self.assertEqual(self.solde('7111', self.exercice_suivant), D('-100.00'))
+        self.assertEqual(solde_lot(self.lots[0], ('3421',)), D('100.00'))
+        self.assertSoldesJustes(self.exercice, self.exercice_suivant)
+
+    def test_suppression(self):
+        transac = self.poser('3421', '7111', D('100.00'), lot=self.lots[0])
+        self.poser('3421', '7111', D('30.00'), lot=self.lots[0])
+        self.ecriture(transac, 'DB').delete()
+        self.assertEqual(self.solde('3421'), D('30.00'))
+        self.assertEqual(solde_lot(self.lots[0], ('3421',)), D('30.00'))
+
+        transac.delete()
+        self.assertEqual(self.solde('7111'), D('-30.00'))
+        self.assertSoldesJustes()
+
+    def test_exercice_cloture_refuse(self):
+        self.poser('3421', '7111', D('100.00'))
+        ExerciceComptable.objects.filter(pk=self.exercice.pk).update(est_ouvert=False)
+        self.exercice.refresh_from_db()
+        with self.assertRaises(ValidationError):
+            self.poser('3421', '7111', D('10.00'))
+        self.assertEqual(self.solde('3421'), D('100.00'))
+
+
+class ExerciceDenormaliseTests(ComptabiliteTestCase):
+    """Exercice dénormalisé des écritures : toujours celui de leur transaction, et indexé"""
+
+    def setUp(self):
+        super().setUp()
+        self.exercice_suivant = ExerciceComptable.objects.create(date_debut=date(2026, 1, 1), date_fin=date(2026, 12, 31))
+
+    def exercices(self, transac):
+        return set(EcritureComptable.objects.filter(transaction=transac).values_list('exercice_id', flat=True))
+
+    def test_ecriture_et_insertion_en_masse(self):
+        transac = Transaction.objects.create(exercice=self.exercice, date_operation=date(2025, 2, 1), libelle='Test')
+        EcritureComptable.objects.create(
+            transaction=transac, exercice=self.exercice_suivant, compte=self.comptes['3421'],
+            type_ecriture='DB', montant=D('10.00')
+        )
+        creer_ecritures([
+            EcritureComptable(transaction=transac, compte=self.comptes['7111'], type_ecriture='CR', montant=D('10.00'))
+        ])
+        self.assertEqual(self.exercices(transac), {self.exercice.pk})
+
+    def test_transaction_deplacee(self):
+        transac = self.poser('3421', '7111', D('100.00'), lot=self.lots[0])
+        nombre = Modification.objects.filter(modele='ecriture').count()
+        transac = Transaction.objects.get(pk=transac.pk)
+        transac.exercice = self.exercice_suivant
+        transac.save()
+
+        self.assertEqual(self.exercices(transac), {self.exercice_suivant.pk})
+        # Chaque écriture déplacée est journalisée avec son nouvel exercice
+        deplacees = Modification.objects.filter(modele='ecriture').order_by('pk')[nombre:]
+        self.assertEqual({m.donnees['exercice_id'] for m in deplacees}, {self.exercice_suivant.pk})
+        self.assertEqual(len(deplacees), 2)
+        self.assertEqual(self.exercice.calculer_resultat_net(), D('0.00'))
+        self.assertEqual(self.exercice_suivant.calculer_resultat_net(), D('100.00'))
+        self.assertSoldesJustes(self.exercice, self.exercice_suivant)
+
+    def test_transaction_deplacee_dans_une_session(self):
+        transac = self.poser('3421', '7111', D('100.00'))
+        with session_saisie():
+            transac = Transaction.objects.get(pk=transac.pk)
+            transac.exercice = self.exercice_suivant
+            transac.save()
+            self.poser('5141', '3421', D('40.00'), exercice=self.exercice_suivant)
+        self.assertEqual(self.exercices(transac), {self.exercice_suivant.pk})
+        self.assertEqual(self.solde('3421', self.exercice_suivant), D('60.00'))
+        self.assertSoldesJustes(self.exercice, self.exercice_suivant)
+
+    def test_index_des_chemins_d_acces(self):
+        with connection.cursor() as curseur:
+            contraintes = connection.introspection.get_constraints(curseur, EcritureComptable._meta.db_table)
+        index = {tuple(c['columns']) for c in contraintes.values() if c['index']}
+        self.assertIn(('compte_id', 'exercice_id', 'type_ecriture'), index)
+        self.assertIn(('lot_id', 'compte_id'), index)
+
+
+class CoutEcritureTests(ComptabiliteTestCase):
+    """Écriture hors session : soldes, journal et version des rapports en un minimum d'accès"""
+
+    def setUp(self):
+        super().setUp()
+        # Soldes déjà présents : une écriture ne fait que les mettre à jour
+        self.transac = self.poser('3421', '7111', D('100.00'), lot=self.lots[0])
+
+    def test_requetes_par_ecriture(self):
+        # Point de sauvegarde, écriture, exercice (ensuite en mémoire), solde, solde du lot, solde relu,
+        # journal, validation
+        with self.assertNumQueries(8):
+            ecriture = EcritureComptable.objects.create(
+                transaction=self.transac, compte=self.comptes['3421'], type_ecriture='DB', montant=D('5.00'),
+                lot=self.lots[0]
+            )
+        ecriture.montant = D('7.00')
+        with self.assertNumQueries(7):
+            ecriture.save()
+        # Suppression : sans point de sauvegarde, ni lecture de l'exercice
+        with self.assertNumQueries(5):
+            ecriture.delete()
+        self.assertSoldesJustes()
+
+    def test_un_seul_mouvement_par_solde_en_modification(self):
+        debit = self.transac.ecritures.get(type_ecriture='DB')
+        debit.montant = D('80.00')
+        with CaptureQueriesContext(connection) as requetes:
+            debit.save()
+        mises_a_jour = [r['sql'] for r in requetes.captured_queries if r['sql'].startswith('UPDATE "comptabilite_solde')]
+        self.assertEqual(len(mises_a_jour), 2)
+        self.assertEqual(self.solde('3421'), D('80.00'))
+        self.assertSoldesJustes()
+
+    def test_solde_journalise_avec_l_ecriture(self):
+        nombre = Modification.objects.count()
+        EcritureComptable.objects.create(
+            transaction=self.transac, compte=self.comptes['3421'], type_ecriture='DB', montant=D('5.00')
+        )
+        self.assertEqual(
+            [(m.modele, m.donnees.get('solde_actuel')) for m in Modification.objects.order_by('pk')[nombre:]],
+            [('ecriture', None), ('solde', '105.00')]
+        )
+
+
+@override_settings(CACHES=CACHES_TESTS)
+class CacheRapportsTests(TransactionTestCase):
+    """Rapports en cache autour d'une transaction réellement validée ou annulée"""
+
+    def setUp(self):
+        self.exercice = ExerciceComptable.objects.create(date_debut=date(2025, 1, 1), date_fin=date(2025, 12, 31))
+        self.banque = Compte.objects.create(compte='5141', libelle='Banque', type_compte='actif')
+        self.recette = Compte.objects.create(compte='7111', libelle='Appels de fonds', type_compte='recette')
+
+    def passer(self, montant):
+        transac = Transaction.objects.create(exercice=self.exercice, date_operation=date(2025, 2, 1), libelle='Test')
+        EcritureComptable.objects.create(transaction=transac, compte=self.banque, type_ecriture='DB', montant=montant)
+        EcritureComptable.objects.create(transaction=transac, compte=self.recette, type_ecriture='CR', montant=montant)
+
+    def solde_banque(self):
+        return ExerciceComptable.objects.get(pk=self.exercice.pk).calculer_soldes_comptes()[self.banque.pk]
+
+    def test_rapport_a_jour_dans_la_transaction_et_apres_validation(self):
+        self.passer(D('100.00'))
+        self.assertEqual(self.solde_banque(), D('100.00'))
+        with transaction.atomic():
+            self.passer(D('30.00'))
+            # Version pas encore incrémentée : le rapport en cache n'est pas lu
+            self.assertEqual(self.solde_banque(), D('130.00'))
+        self.assertEqual(self.solde_banque(), D('130.00'))
+
+    def test_version_incrementee_une_fois_a_la_validation(self):
+        with mock.patch('comptabilite.cache_rapports._incrementer') as incrementer:
+            with transaction.atomic():
+                self.passer(D('10.00'))
+                self.passer(D('20.00'))
+                incrementer.assert_not_called()
+        incrementer.assert_called_once_with({f'exercice:{self.exercice.pk}'})
+
+    def test_transaction_annulee_sans_nouvelle_version(self):
+        self.passer(D('100.00'))
+        self.assertEqual(self.solde_banque(), D('100.00'))
+        with mock.patch('comptabilite.cache_rapports._incrementer') as incrementer:
+            with self.assertRaises(ValidationError), transaction.atomic():
+                self.passer(D('30.00'))
+                raise ValidationError('Annulée')
+        incrementer.assert_not_called()
+        self.assertEqual(self.solde_banque(), D('100.00'))
+
+
+class ReferentielTests(TransactionTestCase):
+    """Cache du référentiel : lectures sans requête, vidé par les signaux et jamais pollué par une transaction annulée"""
+
+    def setUp(self):
+        self.exercice = ExerciceComptable.objects.create(
+            date_debut=date(2025, 1, 1), date_fin=date(2025, 12, 31), est_actuel=True
+        )
+        self.banque = Compte.objects.create(compte='5141', libelle='Banque', type_compte='actif')
+        referentiel.vider()
+
+    def test_lectures_en_cache(self):
+        self.assertEqual(referentiel.exercice_actuel(), self.exercice)
+        self.assertEqual(referentiel.compte('5141'), self.banque)
+        with self.assertNumQueries(0):
+            self.assertEqual(referentiel.exercice_actuel(), self.exercice)
+            banque = referentiel.compte('5141')
+        # Copie : la modifier n'altère pas le cache
+        banque.libelle = 'Autre'
+        with self.assertNumQueries(0):
+            self.assertEqual(referentiel.compte('5141').libelle, self.banque.libelle)
+
+    def test_invalide_par_les_signaux(self):
+        referentiel.exercice_actuel()
+        referentiel.compte('5141')
+
+        self.banque.libelle = 'Banque populaire'
+        self.banque.save()
+        self.assertEqual(referentiel.compte('5141').libelle, 'Banque populaire'.upper())
+        self.banque.delete()
+        with self.assertRaises(Compte.DoesNotExist):
+            referentiel.compte('5141')
+
+        self.exercice.est_actuel = False
+        self.exercice.save()
+        self.assertIsNone(referentiel.exercice_actuel())
+
+    def test_update_ensembliste_et_invalider(self):
+        referentiel.compte('5141')
+        Compte.objects.filter(pk=self.banque.pk).update(libelle='RENOMME')
+        self.assertEqual(referentiel.compte('5141').libelle, self.banque.libelle)
+        referentiel.invalider()
+        self.assertEqual(referentiel.compte('5141').libelle, 'RENOMME')
+
+    def test_transaction_annulee(self):
+        referentiel.compte('5141')
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.banque.libelle = 'Provisoire'
+                self.banque.save()
+                # Dans la transaction : valeur non validée lue en base, pas mise en cache
+                self.assertEqual(referentiel.compte('5141').libelle, 'PROVISOIRE')
+                raise RuntimeError
+        self.assertEqual(referentiel.compte('5141').libelle, 'BANQUE')
+
+    def test_modification_compte_perime_les_rapports(self):
+        avant = versions([GENERAL])
+        self.banque.libelle = 'Banque populaire'
+        self.banque.save()
+        self.assertNotEqual(versions([GENERAL]), avant)
+
+
+class SessionSaisieTests(ComptabiliteTestCase):
+    """Mouvements d'une session de saisie cumulés puis appliqués en fin de session"""
+
+    def setUp(self):
+        super().setUp()
+        self.exercice_suivant = ExerciceComptable.objects.create(date_debut=date(2026, 1, 1), date_fin=date(2026, 12, 31))
+
+    def test_deltas_appliques_en_fin_de_session(self):
+        ancienne = self.poser('3421', '7111', D('40.00'), lot=self.lots[2])
+        with session_saisie():
+            premiere = self.poser('3421', '7111', D('100.00'), lot=self.lots[0])
+            self.poser('3421', '7111', D('25.00'), lot=self.lots[1])
+            self.poser('5141', '4421', D('60.00'), exercice=self.exercice_suivant)
+            debit = premiere.ecritures.get(type_ecriture='DB')
+            debit.montant = D('90.00')
+            debit.lot = self.lots[1]
+            debit.save()
+            ancienne.delete()
+            # Rien n'est appliqué avant la fin de la session
+            self.assertEqual(self.solde('3421'), D('40.00'))
+
+        self.assertEqual(self.solde('3421'), D('115.00'))
+        self.assertEqual(self.solde('7111'), D('-125.00'))
+        self.assertEqual(self.solde('4421', self.exercice_suivant), D('-60.00'))
+        self.assertEqual(solde_lot(self.lots[1], ('3421',)), D('115.00'))
+        self.assertEqual(solde_lot(self.lots[2], ('3421',)), D('0.00'))
+        self.assertSoldesJustes(self.exercice, self.exercice_suivant)
+
+    def test_ecriture_chargee_partiellement_recalculee(self):
+        transac = self.poser('3421', '7111', D('100.00'))
+        with session_saisie() as session:
+            debit = EcritureComptable.objects.only('id', 'montant', 'transaction').get(transaction=transac, type_ecriture='DB')
+            debit.montant = D('70.00')
+            debit.save()
+        self.assertEqual(self.solde('3421'), D('70.00'))
+        self.assertEqual(session.paires, {(self.comptes['3421'].pk, self.exercice.pk)})
+        self.assertSoldesJustes()
+
+    def test_exercice_cloture_refuse(self):
+        ExerciceComptable.objects.filter(pk=self.exercice.pk).update(est_ouvert=False)
+        self.exercice.refresh_from_db()
+        with self.assertRaises(ValidationError):
+            with session_saisie():
+                self.poser('3421', '7111', D('10.00'))
+
+    def test_exercice_en_cloture_refuse_en_fin_de_session(self):
+        self.poser('3421', '7111', D('100.00'))
+        ExerciceComptable.objects.filter(pk=self.exercice.pk).update(en_cloture=True)
+        with self.assertRaises(ValidationError), transaction.atomic():
+            with session_saisie():
+                # Exercice chargé avant le début de la clôture : refusé à l'application des deltas
+                self.poser('3421', '7111', D('10.00'))
+        self.assertEqual(self.solde('3421'), D('100.00'))
+
+    def test_enregistrer_refuse_un_exercice_passe_en_cloture(self):
+        ExerciceComptable.objects.filter(pk=self.exercice.pk).update(en_cloture=True)
+        transac = Transaction(exercice=self.exercice, date_operation=date(2025, 2, 1), libelle='Saisie')
+        lignes = [
+            EcritureComptable(transaction=transac, compte=self.comptes['3421'], type_ecriture='DB', montant=D('10.00')),
+            EcritureComptable(transaction=transac, compte=self.comptes['7111'], type_ecriture='CR', montant=D('10.00')),
+        ]
+        with self.assertRaises(ValidationError):
+            enregistrer([(transac, lignes)])
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_creer_ecritures_annule_en_bloc(self):
+        transac = Transaction.objects.create(exercice=self.exercice, date_operation=date(2025, 2, 1), libelle='Import')
+        ExerciceComptable.objects.filter(pk=self.exercice.pk).update(est_ouvert=False)
+        with self.assertRaises(ValidationError):
+            creer_ecritures([
+                EcritureComptable(transaction=transac, compte=self.comptes['3421'], type_ecriture='DB', montant=D('5.00')),
+                EcritureComptable(transaction=transac, compte=self.comptes['7111'], type_ecriture='CR', montant=D('5.00')),
+            ])
+        self.assertFalse(transac.ecritures.exists())
+
+    def test_changement_d_exercice_de_la_transaction(self):
+        with session_saisie():
+            transac = self.poser('3421', '7111', D('100.00'))
+            transac.exercice = self.exercice_suivant
+            transac.save()
+        self.assertEqual(self.solde('3421', self.exercice_suivant), D('100.00'))
+        self.assertSoldesJustes(self.exercice, self.exercice_suivant)
+
+
+class Arret(BaseException):
+    """Arrêt brutal du travailleur : ni échec enregistré, ni point de reprise"""
+
+
+@mock.patch('comptabilite.models.exercice_comptable.TAILLE_REPORT', 2)
+class TacheClotureTests(ComptabiliteTestCase):
+    """Clôture en tâche de fond : reprise, relance et reprise par un autre travailleur sans double écriture"""
+
+    def setUp(self):
+        super().setUp()
+        self.poser('3421', '7111', D('100.00'), lot=self.lots[0])
+        self.poser('6111', '5141', D('30.00'))
+        self.poser('5141', '4421', D('50.00'))
+        self.phases = PHASES[Tache.CLOTURE_EXERCICE]
+
+    def remplacer_phase(self, numero, fonction):
+        """Phases de clôture dont la n-ième est remplacée (le temps du bloc with)"""
+        phases = list(self.phases)
+        phases[numero] = (phases[numero][0], fonction)
+        return mock.patch.dict(PHASES, {Tache.CLOTURE_EXERCICE: phases})
+
+    def assertClotureComplete(self, tache):
+        tache.refresh_from_db()
+        self.assertEqual((tache.statut, tache.etape), (Tache.TERMINEE, len(self.phases)))
+        exercice = ExerciceComptable.objects.get(pk=self.exercice.pk)
+        self.assertFalse(exercice.est_ouvert)
+        self.assertFalse(exercice.en_cloture)
+        # Ni écritures de clôture ni exercice suivant en double
+        self.assertEqual(exercice.transactions_exercice.exclude(libelle='TEST').count(), 2)
+        nouvel = exercice.exercices_suivants().get()
+        self.assertEqual((nouvel.est_ouvert, nouvel.en_cloture), (True, False))
+        initiaux = dict(SoldeExerciceCompte.objects.filter(exercice=nouvel).values_list('compte__compte', 'solde_initial'))
+        self.assertEqual(initiaux, {'3421': D('100.00'), '5141': D('20.00'), '4421': D('-50.00'), '119': D('-70.00')})
+        self.assertEqual(self.solde('7111'), D('0.00'))
+        self.assertEqual(self.solde('890'), D('0.00'))
+        self.assertSoldesJustes(exercice, nouvel)
+
+    def test_cloture_complete(self):
+        tache = planifier_cloture(self.exercice)
+        self.assertTrue(executer(prendre('A')))
+        self.assertClotureComplete(tache)
+
+    def test_reprise_apres_chaque_phase(self):
+        def arreter(parametres, etat):
+            raise Arret
+
+        for numero in range(1, len(self.phases)):
+            with self.subTest(phase=numero), transaction.atomic():
+                tache = planifier_cloture(self.exercice)
+                with self.remplacer_phase(numero, arreter), self.assertRaises(Arret):
+                    executer(prendre('A'))
+                tache.refresh_from_db()
+                self.assertEqual((tache.statut, tache.etape), (Tache.EN_COURS, numero))
+
+                # Travailleur A muet : B reprend la tâche à la phase interrompue
+                reprise = prendre('B', delai_reprise=0)
+                self.assertEqual((reprise.pk, reprise.etape), (tache.pk, numero))
+                self.assertTrue(executer(reprise))
+                self.assertClotureComplete(tache)
+                transaction.set_rollback(True)
+
+    def test_reprise_au_milieu_du_report_des_soldes(self):
+        numero, (_, report) = len(self.phases) - 2, self.phases[-2]
+        appels = []
+
+        def report_interrompu(parametres, etat):
+            appels.append(1)
+            if len(appels) == 2:
+                raise Arret
+            return report(parametres, etat)
+
+        tache = planifier_cloture(self.exercice)
+        with self.remplacer_phase(numero, report_interrompu), self.assertRaises(Arret):
+            executer(prendre('A'))
+        tache.refresh_from_db()
+        self.assertEqual(tache.etape, numero)
+        self.assertIn('report_depuis', tache.etat)
+
+        self.assertTrue(executer(prendre('B', delai_reprise=0)))
+        self.assertClotureComplete(tache)
+
+    def test_relance_apres_echec_sans_doublon(self):
+        for numero in range(1, len(self.phases)):
+            with self.subTest(phase=numero), transaction.atomic():
+                _, fonction = self.phases[numero]
+
+                def echouer_apres(parametres, etat):
+                    # La phase fait tout son travail puis échoue : rien ne doit en rester
+                    fonction(parametres, etat)
+                    raise RuntimeError("panne")
+
+                tache = planifier_cloture(self.exercice)
+                with self.remplacer_phase(numero, echouer_apres), self.assertLogs('comptabilite.taches', 'ERROR'):
+                    self.assertFalse(executer(prendre('A')))
+                tache.refresh_from_db()
+                self.assertEqual((tache.statut, tache.etape), (Tache.ECHEC, numero))
+
+                relancer(tache)
+                self.assertTrue(executer(prendre('A')))
+                self.assertClotureComplete(tache)
+                transaction.set_rollback(True)
+
+    def test_reprise_par_un_autre_travailleur(self):
+        tache = planifier_cloture(self.exercice)
+        lente = prendre('A')
+        # A ne donne plus signe de vie : B prend la tâche ; A ne peut plus rien valider
+        rapide = prendre('B', delai_reprise=0)
+        self.assertEqual(rapide.pk, lente.pk)
+        with self.assertLogs('comptabilite.taches', 'WARNING'):
+            self.assertFalse(executer(lente))
+        tache.refresh_from_db()
+        self.assertEqual((tache.travailleur, tache.etape), ('B', 0))
+
+        self.assertTrue(executer(rapide))
+        self.assertClotureComplete(tache)
+
+    def test_ecritures_refusees_pendant_la_cloture(self):
+        def arreter(parametres, etat):
+            raise Arret
+
+        tache = planifier_cloture(self.exercice)
+        with self.remplacer_phase(1, arreter), self.assertRaises(Arret):
+            executer(prendre('A'))
+        self.assertTrue(ExerciceComptable.objects.get(pk=self.exercice.pk).en_cloture)
+
+        self.exercice.refresh_from_db()
+        with self.assertRaises(ValidationError), transaction.atomic():
+            self.poser('3421', '7111', D('10.00'))
+        crees, erreurs = saisir_transactions([{
+            'date_operation': '2025-06-01', 'libelle': 'Appel',
+            'ecritures': [
+                {'compte': '3421', 'type_ecriture': 'DB', 'montant': '10.00'},
+                {'compte': '7111', 'type_ecriture': 'CR', 'montant': '10.00'},
+            ],
+        }])
+        self.assertEqual((crees, len(erreurs)), ([], 1))
+
+        self.assertTrue(executer(prendre('B', delai_reprise=0)))
+        self.assertClotureComplete(tache)
+
+    def test_exercice_cree_ferme_aux_ecritures_jusqu_au_report(self):
+        def arreter(parametres, etat):
+            raise Arret
+
+        tache = planifier_cloture(self.exercice)
+        with self.remplacer_phase(len(self.phases) - 2, arreter), self.assertRaises(Arret):
+            executer(prendre('A'))
+        nouvel = self.exercice.exercices_suivants().get()
+        self.assertTrue(nouvel.en_cloture)
+        # Une écriture passée ici serait écrasée par le report des soldes
+        with self.assertRaises(ValidationError), transaction.atomic():
+            self.poser('3421', '7111', D('10.00'), exercice=nouvel)
+
+        self.assertTrue(executer(prendre('B', delai_reprise=0)))
+        self.assertClotureComplete(tache)
+        nouvel.refresh_from_db()
+        self.poser('3421', '7111', D('10.00'), exercice=nouvel)
+        self.assertEqual(self.solde('3421', nouvel), D('110.00'))
+
+
+class CompteResourceTests(ComptabiliteTestCase):
+    """Import en masse du plan comptable : bulk_create / bulk_update sans signaux, caches périmés à la main"""
+
+    def importer(self, lignes, dry_run=False):
+        dataset = tablib.Dataset(*lignes, headers=['compte', 'libelle', 'type_compte'])
+        with mock.patch('comptabilite.resources.invalider') as invalider, \
+                mock.patch('comptabilite.resources.nouvelle_version') as nouvelle_version:
+            resultat = CompteResource().import_data(dataset, dry_run=dry_run, use_transactions=True)
+        self.assertFalse(resultat.has_errors())
+        return invalider.called, nouvelle_version.call_args_list
+
+    def test_caches_perimes_apres_creation_ou_modification(self):
+        self.assertEqual(self.importer([('7112', 'Travaux', 'recette')]), (True, [mock.call(tout=True)]))
+        self.assertEqual(self.importer([('7111', 'Appels de fonds votés', 'recette')]), (True, [mock.call(tout=True)]))
+        self.assertEqual(Compte.objects.get(compte='7111').libelle, 'APPELS DE FONDS VOTÉS')
+
+    def test_caches_conserves_sans_changement_ou_a_blanc(self):
+        self.assertEqual(self.importer([('7111', 'APPELS DE FONDS', 'recette')]), (False, []))
+        self.assertEqual(self.importer([('7113', 'Subventions', 'recette')], dry_run=True), (False, []))
+        self.assertFalse(Compte.objects.filter(compte='7113').exists())
+
+
+class FacturationCoproTests(ComptabiliteTestCase):
+    """Commande facturation_copro : aucune période due n'est sautée ni facturée sans rattrapage explicite"""
+
+    def setUp(self):
+        super().setUp()
+        # Abonnement mensuel en retard depuis janvier, et abonnement démarrant en mars
+        self.ancien = Abonnement.objects.create(lot=self.lots[0], montant=D('100.00'), date_debut=date(2025, 1, 1))
+        self.recent = Abonnement.objects.create(lot=self.lots[1], montant=D('50.00'), date_debut=date(2025, 3, 1))
+
+    def facturer(self, *arguments):
+        sortie = io.StringIO()
+        call_command('facturation_copro', *arguments, stdout=sortie, stderr=sortie)
+        return sortie.getvalue()
+
+    def facture(self, abonnement):
+        echeance = EcheanceAbonnement.objects.get(abonnement=abonnement)
+        factures = Transaction.objects.filter(libelle__startswith='CONTRIBUTION', ecritures__lot=abonnement.lot)
+        return echeance.prochaine_echeance, sorted(factures.values_list('date_operation', flat=True))
+
+    def test_from_laisse_dues_les_periodes_anterieures(self):
+        sortie = self.facturer('--from', '2025-03-01', '--to', '2025-04-10')
+        # Janvier et février précèdent --from : l'ancien abonnement n'est pas facturé, son échéancier ne bouge pas
+        self.assertEqual(self.facture(self.ancien), (date(2025, 1, 1), []))
+        self.assertIn("Périodes exclues      : 2 antérieure(s) au 2025-03-01 sur 1 abonnement(s)", sortie)
+        self.assertEqual(self.facture(self.recent), (date(2025, 5, 1), [date(2025, 3, 1), date(2025, 4, 10)]))
+
+        self.facturer('--from', '2025-01-01', '--to', '2025-04-10')
+        self.assertEqual(self.facture(self.ancien)[0], date(2025, 5, 1))
+        self.assertEqual(len(self.facture(self.ancien)[1]), 4)
+        self.assertSoldesJustes()
+
+    def test_periode_en_cours_seulement_par_defaut(self):
+        sortie = self.facturer('--date', '2025-03-10')
+        self.assertEqual(self.facture(self.ancien), (date(2025, 1, 1), []))
+        self.assertIn("Périodes exclues      : 2 antérieure(s) à la période en cours sur 1 abonnement(s)", sortie)
+        self.assertEqual(self.facture(self.recent), (date(2025, 4, 1), [date(2025, 3, 10)]))
+
+    def test_rattrapage_explicite(self):
+        self.facturer('--to', '2025-03-10')
+        self.assertEqual(
+            self.facture(self.ancien), (date(2025, 4, 1), [date(2025, 1, 1), date(2025, 2, 1), date(2025, 3, 10)])
+        )
+        self.assertEqual(self.facture(self.recent), (date(2025, 4, 1), [date(2025, 3, 10)]))
+        self.assertSoldesJustes()
+
+
+    def test_shard_en_echec_annule_seul_puis_repris(self):
+        panne = f'lots-{self.lots[1].pk}-{self.lots[1].pk}'
+
+        def creer_en_panne(ecritures, **kwargs):
+            # Écritures du shard insérées, puis panne avant la fin de sa transaction
+            ecritures = creer_ecritures(ecritures, **kwargs)
+            if any(ecriture.lot_id == self.lots[1].pk for ecriture in ecritures):
+                raise RuntimeError('Panne')
+            return ecritures
+
+        with mock.patch('comptabilite.management.commands.facturation_copro.creer_ecritures', creer_en_panne):
+            sortie = self.facturer('--to', '2025-03-10', '--shard-by', 'lot', '--shards', '2')
+        self.assertIn("Shards traités       : 1/2 (par lot)", sortie)
+        self.assertIn(f"Shard {panne} annulé : RuntimeError: Panne", sortie)
+        self.assertIn(f"--shard {panne}", sortie)
+        self.assertEqual(self.facture(self.ancien)[0], date(2025, 4, 1))
+        self.assertEqual(self.facture(self.recent), (date(2025, 3, 1), []))
+
+        self.facturer('--to', '2025-03-10', '--shard-by', 'lot', '--shards', '2', '--shard', panne)
+        self.assertEqual(self.facture(self.recent), (date(2025, 4, 1), [date(2025, 3, 10)]))
+        self.assertEqual(len(self.facture(self.ancien)[1]), 3)
+        self.assertSoldesJustes()
+
+    def test_echeancier_repris_demarre_a_la_periode_en_cours(self):
+        creer_echeances = importlib.import_module('comptabilite.migrations.0004_echeanceabonnement').creer_echeances
+        trimestriel = Abonnement.objects.create(
+            lot=self.lots[2], montant=D('300.00'), date_debut=date(2024, 2, 1), frequence='trimestriel'
+        )
+        futur = Abonnement.objects.create(
+            lot=self.lots[2], montant=D('10.00'), date_debut=date(2025, 6, 1), frequence='annuel'
+        )
+        # Mois de janvier 2025 déjà facturé par l'ancienne commande
+        Transaction.objects.create(
+            exercice=self.exercice, date_operation=date(2025, 1, 5), libelle='CONTRIBUTION MENSUELLE LOT#A0 - 2025-01'
+        )
+        EcheanceAbonnement.objects.all().delete()
+        with mock.patch('django.utils.timezone.localdate', return_value=date(2025, 3, 10)):
+            creer_echeances(apps, None)
+
+        echeances = dict(EcheanceAbonnement.objects.values_list('abonnement_id', 'prochaine_echeance'))
+        self.assertEqual(echeances[self.ancien.pk], date(2025, 2, 1))
+        self.assertEqual(echeances[self.recent.pk], date(2025, 3, 1))
+        self.assertEqual(echeances[trimestriel.pk], date(2025, 2, 1))
+        self.assertEqual(echeances[futur.pk], date(2025, 6, 1))
+
+        # Seul le mensuel, dont février n'a pas été facturé, reste signalé
+        sortie = self.facturer('--date', '2025-03-10')
+        self.assertIn("Périodes exclues      : 1 antérieure(s) à la période en cours sur 1 abonnement(s)", sortie)
+        self.assertEqual(self.facture(self.recent)[0], date(2025, 4, 1))
+        self.assertEqual(EcheanceAbonnement.objects.get(abonnement=trimestriel).prochaine_echeance, date(2025, 5, 1))
+
+
+class FacturationParLotsTests(ComptabiliteTestCase):
+    """Facturation par lots d'insertions : avances préchargées et coût indépendant du nombre d'abonnements"""
+
+    def setUp(self):
+        super().setUp()
+        self.abonnements = [
+            Abonnement.objects.create(lot=lot, montant=D('100.00'), date_debut=date(2025, 3, 1)) for lot in self.lots
+        ]
+        # Avance de 150 versée pour le premier lot
+        transac = Transaction.objects.create(exercice=self.exercice, date_operation=date(2025, 2, 1), libelle='Avance')
+        EcritureComptable.objects.create(
+            transaction=transac, compte=self.comptes['5141'], type_ecriture='DB', montant=D('150.00')
+        )
+        EcritureComptable.objects.create(
+            transaction=transac, compte=self.comptes['4421'], type_ecriture='CR', montant=D('150.00'), lot=self.lots[0]
+        )
+
+    def facturer(self, *arguments):
+        call_command('facturation_copro', *arguments, stdout=io.StringIO(), stderr=io.StringIO())
+
+    def comptes_debites(self, lot):
+        return list(
+            EcritureComptable.objects.filter(lot=lot, type_ecriture='DB', transaction__libelle__startswith='CONTRIBUTION')
+            .order_by('transaction__date_operation').values_list('compte__compte', flat=True)
+        )
+
+    def test_avance_consommee_d_un_lot_d_insertions_a_l_autre(self):
+        self.facturer('--to', '2025-04-10', '--chunk-size', '1')
+        # Mars payé par l'avance (reste 50), avril facturé au copropriétaire
+        self.assertEqual(self.comptes_debites(self.lots[0]), ['4421', '3421'])
+        self.assertEqual(self.comptes_debites(self.lots[1]), ['3421', '3421'])
+        self.assertEqual(solde_lot(self.lots[0], ('4421',)), D('-50.00'))
+        self.assertEqual(solde_lot(self.lots[0], ('3421',)), D('100.00'))
+        self.assertEqual(Transaction.objects.filter(libelle__startswith='CONTRIBUTION').count(), 6)
+        self.assertSoldesJustes()
+
+    def test_requetes_independantes_du_nombre_d_abonnements(self):
+        def requetes(jour):
+            with CaptureQueriesContext(connection) as capture:
+                self.facturer('--date', jour)
+            return len(capture)
+
+        # Soldes de lots déjà créés (mars payé par l'avance, avril facturé au copropriétaire)
+        self.facturer('--date', '2025-03-10')
+        self.facturer('--date', '2025-04-10')
+        reference = requetes('2025-05-10')
+        immeuble = self.lots[0].immeuble
+        for numero in range(3, 30):
+            lot = Lot.objects.create(code=f'A{numero}', libelle=f'Lot {numero}', immeuble=immeuble)
+            Abonnement.objects.create(lot=lot, montant=D('100.00'), date_debut=date(2025, 6, 1))
+        # Premier passage des nouveaux abonnements : création de leurs soldes de lots
+        self.facturer('--date', '2025-06-10')
+        self.assertEqual(requetes('2025-07-10'), reference)
+        self.assertEqual(Transaction.objects.filter(libelle__endswith='2025-07').count(), 30)
+        self.assertSoldesJustes()
+
+
+class JeuSynthetiqueTests(ComptabiliteTestCase):
+    """Jeu synthétique et suite de mesures, à petite échelle"""
+
+    def test_jeu_genere_coherent(self):
+        call_command(
+            'generer_donnees', '--immeubles', '2', '--lots', '6', '--exercices', '2', '--ecritures', '40',
+            '--actuel', stdout=io.StringIO()
+        )
+        exercices = list(ExerciceComptable.objects.filter(date_debut__year__gte=2100).order_by('date_debut'))
+        self.assertEqual([(e.est_ouvert, e.est_actuel) for e in exercices], [(False, False), (True, True)])
+        self.assertEqual(ExerciceComptable.get_exercice_actuel(), exercices[-1])
+        self.assertEqual(EcritureComptable.objects.filter(exercice__in=exercices).count(), 40)
+        # Un abonnement par lot, échéancier au début du dernier exercice
+        self.assertEqual(
+            set(EcheanceAbonnement.objects.filter(abonnement__lot__immeuble__code__in=['00', '01'])
+                .values_list('prochaine_echeance', flat=True)),
+            {date(2101, 1, 1)}
+        )
+        self.assertSoldesJustes(*exercices)
+
+    def test_mesures_et_detection_des_regressions(self):
+        with tempfile.TemporaryDirectory() as dossier:
+            sortie = os.path.join(dossier, 'mesures.json')
+            arguments = [
+                '--immeubles', '1', '--lots', '4', '--exercices', '1', '--ecritures', '20', '--repetitions', '1',
+                '--scenario', 'verifier_soldes', '--scenario', 'admin_comptes'
+            ]
+            call_command('benchmark', *arguments, '--sortie', sortie, stdout=io.StringIO())
+            with open(sortie, encoding='utf-8') as fichier:
+                rapport = json.load(fichier)
+            self.assertEqual(set(rapport['resultats']), {'verifier_soldes', 'admin_comptes'})
+            # Le jeu de mesure est annulé
+            self.assertFalse(ExerciceComptable.objects.filter(date_debut__year__gte=2100).exists())
+
+            # Une requête de plus que la référence est une régression
+            rapport['resultats']['admin_comptes']['requetes'] -= 1
+            with open(sortie, 'w', encoding='utf-8') as fichier:
+                json.dump(rapport, fichier)
+            with self.assertRaisesMessage(CommandError, '1 régression(s) : admin_comptes'):
+                call_command('benchmark', *arguments, '--reference', sortie, stdout=io.StringIO())
+            with self.assertRaisesMessage(CommandError, 'Scénario(s) inconnu(s) : inconnu'):
+                call_command('benchmark', '--scenario', 'inconnu', '--ecritures', '2', '--lots', '1', stdout=io.StringIO())
+
+
+class ProfilageTests(TestCase):
+    def test_requete_lente_listee_une_fois_pour_des_mesures_imbriquees(self):
+        with forcer(), collecte() as mesures:
+            with profiler('externe'):
+                with profiler('interne'):
+                    list(Compte.objects.all())
+                list(ExerciceComptable.objects.all())
+
+        externe, interne = sorted(mesures, key=lambda mesure: mesure.nom)
+        self.assertEqual((externe.requetes, interne.requetes), (2, 1))
+        lignes = resume(mesures)
+        self.assertEqual(sum('SELECT "comptabilite_compte".' in ligne for ligne in lignes), 1)
+        self.assertEqual(sum('SELECT "comptabilite_exercicecomptable".' in ligne for ligne in lignes), 1)
+
+
+class ReclotureTests(ComptabiliteTestCase):
+    """Réouverture et reclôture : seul l'écart des ajustements est reporté sur les exercices suivants"""
+
+    def initiaux(self, exercice):
+        return dict(SoldeExerciceCompte.objects.filter(exercice=exercice).values_list('compte__compte', 'solde_initial'))
+
+    def actuels(self, exercice):
+        return dict(SoldeExerciceCompte.objects.filter(exercice=exercice).values_list('compte__compte', 'solde_actuel'))
+
+    def test_seul_l_ecart_est_propage(self):
+        self.poser('3421', '7111', D('100.00'), lot=self.lots[0])
+        self.poser('6111', '5141', D('30.00'))
+        exercice_2026 = self.exercice.close_exercice()
+        self.poser('5141', '3421', D('60.00'), exercice=exercice_2026)
+        exercice_2027 = exercice_2026.close_exercice()
+        initiaux = {exercice.pk: self.initiaux(exercice) for exercice in (exercice_2026, exercice_2027)}
+        actuels = {exercice.pk: self.actuels(exercice) for exercice in (exercice_2026, exercice_2027)}
+        transactions_suivantes = Transaction.objects.filter(exercice__in=[exercice_2026, exercice_2027]).count()
+
+        exercice = ExerciceComptable.objects.get(pk=self.exercice.pk)
+        exercice.rouvrir()
+        self.poser('3421', '7111', D('40.00'), exercice=exercice, date_operation=exercice.date_fin)
+        self.poser('5141', '4421', D('10.00'), exercice=exercice, date_operation=exercice.date_fin)
+        ecarts = ExerciceComptable.objects.get(pk=exercice.pk).recloturer()
+
+        ecarts = {Compte.objects.get(pk=compte_id).compte: ecart for compte_id, ecart in ecarts.items()}
+        self.assertEqual(ecarts, {'3421': D('40.00'), '5141': D('10.00'), '4421': D('-10.00'), '119': D('-40.00')})
+        for suivant in (exercice_2026, exercice_2027):
+            for numero in set(initiaux[suivant.pk]) | set(ecarts):
+                with self.subTest(exercice=suivant.date_debut.year, compte=numero):
+                    ecart = ecarts.get(numero, D('0.00'))
+                    self.assertEqual(self.initiaux(suivant)[numero], initiaux[suivant.pk].get(numero, D('0.00')) + ecart)
+                    self.assertEqual(self.actuels(suivant)[numero], actuels[suivant.pk].get(numero, D('0.00')) + ecart)
+        # Ni exercice ni écriture supplémentaires dans les exercices suivants
+        self.assertEqual(ExerciceComptable.objects.count(), 3)
+        self.assertEqual(
+            Transaction.objects.filter(exercice__in=[exercice_2026, exercice_2027]).count(), transactions_suivantes
+        )
+        self.assertSoldesJustes(self.exercice, exercice_2026, exercice_2027)
+
+    def test_cloture_avec_exercice_suivant_existant(self):
+        exercice_2026 = ExerciceComptable.objects.create(date_debut=date(2026, 1, 1), date_fin=date(2026, 12, 31))
+        self.poser('3421', '7111', D('100.00'))
+        self.poser('5141', '3421', D('25.00'), exercice=exercice_2026)
+
+        tache = planifier_cloture(self.exercice)
+        self.assertTrue(executer(prendre('A')))
+        tache.refresh_from_db()
+        self.assertEqual(tache.etat['nouvel_exercice'], exercice_2026.pk)
+        self.assertEqual(ExerciceComptable.objects.count(), 2)
+        # Report sur l'exercice existant, ses mouvements conservés
+        self.assertEqual(self.solde('3421', exercice_2026), D('75.00'))
+        self.assertEqual(self.initiaux(exercice_2026)['3421'], D('100.00'))
+        self.assertEqual(self.initiaux(exercice_2026)['119'], D('-100.00'))
+        self.assertSoldesJustes(self.exercice, exercice_2026)
+
+    def test_cloture_synchrone_avec_exercice_suivant_existant(self):
+        exercice_2026 = ExerciceComptable.objects.create(date_debut=date(2026, 1, 1), date_fin=date(2026, 12, 31))
+        self.poser('3421', '7111', D('100.00'))
+        self.poser('6111', '5141', D('30.00'))
+        self.poser('5141', '4421', D('50.00'))
+        self.poser('5141', '3421', D('25.00'), exercice=exercice_2026)
+
+        self.assertEqual(self.exercice.close_exercice(), exercice_2026)
+        # Résultat net (-70) et soldes de bilan reportés, mouvements de l'exercice existant conservés
+        self.assertEqual(
+            self.initiaux(exercice_2026),
+            {'3421': D('100.00'), '5141': D('20.00'), '4421': D('-50.00'), '119': D('-70.00')}
+        )
+        self.assertEqual(self.solde('3421', exercice_2026), D('75.00'))
+        self.assertEqual(self.solde('119', exercice_2026), D('-70.00'))
+        self.assertSoldesJustes(self.exercice, exercice_2026)
+
+
+class ClotureEnsemblisteTests(ComptabiliteTestCase):
+    """Clôture par lots : écritures de clôture, report des soldes et coût indépendant du plan comptable"""
+
+    def ecritures(self, exercice, libelle):
+        # Libellés enregistrés en majuscules (Transaction.save)
+        return sorted(
+            EcritureComptable.objects.filter(exercice=exercice, transaction__libelle=libelle.upper())
+            .values_list('compte__compte', 'type_ecriture', 'montant')
+        )
+
+    def test_ecritures_de_cloture_et_soldes_reportes(self):
+        self.poser('3421', '7111', D('100.00'))
+        self.poser('6111', '5141', D('30.00'))
+        suivant = self.exercice.close_exercice()
+
+        self.assertEqual(tuple(self.exercice.rapport_cloture), ExerciceComptable.PHASES_CLOTURE)
+        self.assertEqual(self.ecritures(self.exercice, "Clôture des comptes de produits et charges"), [
+            ('6111', 'CR', D('30.00')), ('7111', 'DB', D('100.00')), ('890', 'CR', D('100.00')), ('890', 'DB', D('30.00'))
+        ])
+        self.assertEqual(
+            self.ecritures(self.exercice, "Report du résultat net"), [('119', 'CR', D('70.00')), ('890', 'DB', D('70.00'))]
+        )
+        for numero in ('7111', '6111', '890'):
+            self.assertEqual(self.solde(numero), D('0.00'))
+        self.assertEqual(self.solde('119'), D('-70.00'))
+
+        # Seuls les comptes de bilan sont reportés, solde initial = solde actuel
+        reportes = SoldeExerciceCompte.objects.filter(exercice=suivant, solde_initial=F('solde_actuel'))
+        self.assertEqual(
+            dict(reportes.exclude(solde_initial=0).values_list('compte__compte', 'solde_initial')),
+            {'3421': D('100.00'), '5141': D('-30.00'), '119': D('-70.00')}
+        )
+        self.assertFalse(SoldeExerciceCompte.objects.filter(exercice=suivant, compte__type_compte='recette').exists())
+        self.exercice.refresh_from_db()
+        self.assertEqual((self.exercice.est_ouvert, suivant.est_ouvert, suivant.en_cloture), (False, True, False))
+        self.assertSoldesJustes(self.exercice, suivant)
+
+    def test_requetes_independantes_du_nombre_de_comptes(self):
+        def cloturer(exercice, comptes):
+            for compte in comptes:
+                self.poser('3421', compte.compte, D('10.00'), exercice=exercice)
+            with CaptureQueriesContext(connection) as requetes:
+                suivant = exercice.close_exercice()
+            return suivant, len(requetes)
+
+        exercice_2026, reference = cloturer(self.exercice, [self.comptes['7111']])
+        for numero in range(40):
+            self.comptes[f'70{numero:02}'] = Compte.objects.create(
+                compte=f'70{numero:02}', libelle=f'Produit {numero}', type_compte='recette'
+            )
+            self.comptes[f'51{numero:02}'] = Compte.objects.create(
+                compte=f'51{numero:02}', libelle=f'Banque {numero}', type_compte='actif'
+            )
+        nouveaux = [compte for numero, compte in self.comptes.items() if numero[:2] in ('70', '51') and len(numero) == 4]
+        exercice_2027, requetes = cloturer(exercice_2026, nouveaux)
+        # 80 comptes de plus à clore ou reporter : pas une requête de plus (890 et 119 ont déjà leur solde)
+        self.assertLessEqual(requetes, reference)
+        self.assertSoldesJustes(exercice_2026, exercice_2027)
+
+
+class BalanceGeneraleTests(ComptabiliteTestCase):
+    """Balance générale lue dans la table de synthèse, contre des totaux calculés à la main"""
+
+    def setUp(self):
+        super().setUp()
+        self.poser('3421', '7111', D('100.00'))
+        self.poser('5141', '3421', D('30.00'))
+        self.poser('6111', '5141', D('12.50'))
+        ajustee = self.poser('3421', '7111', D('40.00'))
+        self.poser('6111', '5141', D('999.00')).delete()
+        for ecriture in ajustee.ecritures.all():
+            ecriture.montant = D('45.00')
+            ecriture.save()
+        # Solde initial reporté de l'exercice précédent
+        SoldeExerciceCompte.objects.filter(exercice=self.exercice, compte=self.comptes['3421']).update(
+            solde_initial=D('20.00'), solde_actuel=F('solde_actuel') + D('20.00')
+        )
+
+    def test_lignes_et_totaux(self):
+        with self.assertNumQueries(1):
+            lignes = balance_generale(self.exercice)
+        self.assertEqual(
+            [
+                (l['compte'].compte, l['solde_initial'], l['total_debit'], l['total_credit'], l['solde_final'])
+                for l in lignes if l['total_debit'] or l['total_credit']
+            ],
+            [
+                ('3421', D('20.00'), D('145.00'), D('30.00'), D('135.00')),
+                ('5141', D('0.00'), D('30.00'), D('12.50'), D('17.50')),
+                ('6111', D('0.00'), D('12.50'), D('0.00'), D('12.50')),
+                ('7111', D('0.00'), D('0.00'), D('145.00'), D('-145.00')),
+            ]
+        )
+        self.assertEqual(
+            totaux_balance(lignes),
+            {'solde_initial': D('20.00'), 'total_debit': D('187.50'), 'total_credit': D('187.50'), 'solde_final': D('20.00')}
+        )
+        self.assertEqual(verifier_balance(self.exercice), [])
+
+    def test_verification_contre_les_ecritures(self):
+        SoldeExerciceCompte.objects.filter(exercice=self.exercice, compte=self.comptes['5141']).update(
+            total_debit=D('31.00')
+        )
+        self.assertEqual(verifier_balance(self.exercice), [
+            f"Compte #{self.comptes['5141'].pk} : totaux débit / crédit en écart",
+            "Balance déséquilibrée : débit 188.50 / crédit 187.50",
+        ])
+
+        sortie = io.StringIO()
+        call_command('balance_generale', '--exercice', str(self.exercice.pk), '--verifier', stdout=sortie)
+        self.assertIn("❌ 2 anomalie(s)", sortie.getvalue())
+        verifier_soldes(self.exercice, reconstruire=True)
+        sortie = io.StringIO()
+        call_command('balance_generale', '--verifier', stdout=sortie)
+        self.assertIn("✅ Balance conforme aux écritures", sortie.getvalue())
+
+
+class ReleveLotTests(ComptabiliteTestCase):
+    """Relevés des copropriétaires : solde progressif et clôture contre des montants calculés à la main"""
+
+    def setUp(self):
+        super().setUp()
+        lot, autre = self.lots[0], self.lots[1]
+        self.poser('3421', '7111', D('100.00'), lot=lot, date_operation=date(2025, 1, 10))
+        # Avance versée : le lot porte sur l'écriture au crédit du compte d'avances
+        avance = Transaction.objects.create(exercice=self.exercice, date_operation=date(2025, 2, 5), libelle='Avance')
+        EcritureComptable.objects.create(
+            transaction=avance, compte=self.comptes['5141'], type_ecriture='DB', montant=D('150.00')
+        )
+        EcritureComptable.objects.create(
+            transaction=avance, compte=self.comptes['4421'], type_ecriture='CR', montant=D('150.00'), lot=lot
+        )
+        self.poser('4421', '7111', D('100.00'), lot=lot, date_operation=date(2025, 3, 1))
+        self.avril = self.poser('3421', '7111', D('50.00'), lot=lot, date_operation=date(2025, 4, 1))
+        # Hors comptes copropriétaire : absent du relevé
+        self.poser('6111', '5141', D('20.00'), lot=lot, date_operation=date(2025, 2, 20))
+        self.poser('3421', '7111', D('80.00'), lot=autre, date_operation=date(2025, 2, 1))
+
+    def test_releve_sur_une_periode(self):
+        releve = releve_lot(self.lots[0], date(2025, 2, 1), date(2025, 3, 31))
+        self.assertEqual(
+            [(m['date'], m['compte'], m['debit'], m['credit'], m['solde']) for m in releve['mouvements']],
+            [
+                (date(2025, 2, 5), '4421', D('0.00'), D('150.00'), D('-50.00')),
+                (date(2025, 3, 1), '4421', D('100.00'), D('0.00'), D('50.00')),
+            ]
+        )
+        self.assertEqual(
+            (releve['solde_ouverture'], releve['total_debit'], releve['total_credit'], releve['solde_cloture']),
+            (D('100.00'), D('100.00'), D('150.00'), D('50.00'))
+        )
+        self.assertEqual(releve_lot(self.lots[0])['solde_cloture'], D('100.00'))
+        self.assertEqual(releve_lot(self.lots[0])['solde_ouverture'], D('0.00'))
+
+    def test_solde_lot_suit_les_ecritures(self):
+        self.assertEqual(solde_lot(self.lots[0]), D('100.00'))
+        self.assertEqual(solde_lot(self.lots[0], ('4421',)), D('-50.00'))
+        self.avril.delete()
+        self.assertEqual(solde_lot(self.lots[0]), D('50.00'))
+
+    def test_immeuble_en_une_passe(self):
+        with self.assertNumQueries(3):
+            releve_lot(self.lots[0], date(2025, 2, 1), date(2025, 3, 31))
+        immeuble = self.lots[0].immeuble
+        with self.assertNumQueries(4):
+            # Lots de l'immeuble, puis les trois mêmes requêtes
+            releves = releves_immeuble(immeuble, date(2025, 2, 1), date(2025, 3, 31))
+        self.assertEqual(
+            [(r['lot'].code, r['solde_ouverture'], r['solde_cloture']) for r in releves.values()],
+            [('A0', D('100.00'), D('50.00')), ('A1', D('0.00'), D('80.00')), ('A2', D('0.00'), D('0.00'))]
+        )
+
+        sortie = io.StringIO()
+        call_command('releve_lot', '--immeuble', 'A', '--resume', stdout=sortie)
+        self.assertIn("3 lot(s), solde total : 180.00 MAD", sortie.getvalue())
+
+
+class GrouperTests(TestCase):
+    """Regroupement des lignes de journal en transactions"""
+
+    def numeros(self, lignes):
+        return [[numero for numero, _ in groupe] for groupe in grouper(enumerate(lignes, start=2))]
+
+    def test_par_piece(self):
+        lignes = [
+            {'piece': 'P1', 'debit': '100', 'credit': None},
+            {'piece': 'P1', 'debit': None, 'credit': '60'},
+            {'piece': 'P1', 'debit': None, 'credit': '40'},
+            {'piece': 'P2', 'debit': '10', 'credit': None},
+            {'piece': 'P3', 'debit': '5', 'credit': None},
+            {'piece': 'P3', 'debit': None, 'credit': '5'},
+            # Pièce déjà vue mais non consécutive : nouvelle transaction
+            {'piece': 'P1', 'debit': None, 'credit': '1'},
+        ]
+        # L'équilibre n'est pas contrôlé ici : P2 seule est rejetée à la validation
+        self.assertEqual(self.numeros(lignes), [[2, 3, 4], [5], [6, 7], [8]])
+
+    def test_par_equilibre(self):
+        lignes = [
+            {'debit': '100', 'credit': None},
+            {'debit': None, 'credit': '1 00,00'},
+            {'debit': '0', 'credit': None},
+            {'debit': None, 'credit': '0'},
+            {'debit': '50', 'credit': None},
+            {'debit': 'illisible', 'credit': None},
+            {'debit': None, 'credit': '50'},
+            {'debit': '20', 'credit': None},
+        ]
+        # Montant illisible : ignoré pour l'équilibre (rejeté à la validation) ; groupe final non équilibré produit
+        self.assertEqual(self.numeros(lignes), [[2, 3], [4, 5], [6, 7, 8], [9]])
+
+
+class ImportEcrituresTests(ComptabiliteTestCase):
+    EN_TETE = ['piece', 'date', 'libelle', 'compte', 'debit', 'credit', 'lot']
+
+    def lignes(self, nombre, montant='10.00'):
+        lignes = [self.EN_TETE]
+        for piece in range(nombre):
+            lignes += [
+                [f'P{piece}', '2025-02-01', f'Appel {piece}', '3421', montant, None, self.lots[0].code],
+                [f'P{piece}', '2025-02-01', f'Appel {piece}', '7111', None, montant, None],
+            ]
+        return lignes
+
+    def test_paquets_valides_separement(self):
+        appels = []
+
+        def enregistrer_puis_panne(paquet, taille):
+            appels.append(len(paquet))
+            if len(appels) == 3:
+                raise RuntimeError("panne")
+            return enregistrer(paquet, taille)
+
+        with mock.patch('comptabilite.import_ecritures.enregistrer', enregistrer_puis_panne), \
+                self.assertRaises(RuntimeError):
+            importer_ecritures(self.lignes(5), taille=2)
+        # Les deux premiers paquets restent enregistrés, soldes compris
+        self.assertEqual(Transaction.objects.count(), 4)
+        self.assertEqual(self.solde('3421'), D('40.00'))
+        self.assertEqual(solde_lot(self.lots[0], ('3421',)), D('40.00'))
+        self.assertSoldesJustes()
+
+    def test_lignes_invalides_rejetees(self):
+        lignes = self.lignes(3)
+        lignes[3][4] = '-5'
+        total, erreurs = importer_ecritures(lignes, taille=2)
+        self.assertEqual((total, [numero for numero, _ in erreurs]), (2, [4]))
+        self.assertEqual(self.solde('7111'), D('-20.00'))
+        self.assertSoldesJustes()
+
+    def test_tout_ou_rien(self):
+        lignes = self.lignes(3)
+        lignes[-1][3] = '999'
+        total, erreurs = importer_ecritures(lignes, taille=1, tout_ou_rien=True)
+        self.assertEqual((total, len(erreurs)), (2, 1))
+        self.assertFalse(Transaction.objects.exists())
+        self.assertFalse(SoldeExerciceCompte.objects.exists())
+
+
+class ApiTestCase(ComptabiliteTestCase):
+    """Client de l'API authentifié en administrateur"""
+
+    def setUp(self):
+        super().setUp()
+        self.client_api = APIClient()
+        self.client_api.force_authenticate(get_user_model().objects.create_superuser('admin@example.com', 'secret'))
+
+
+class LectureApiTests(ApiTestCase):
+    """Points d'accès en lecture : filtres, champs demandés, pagination par curseur"""
+
+    def setUp(self):
+        super().setUp()
+        for jour in range(1, 6):
+            self.poser('3421', '7111', D('10.00'), lot=self.lots[0], date_operation=date(2025, 3, jour))
+
+    def pages(self, url):
+        """IDs de toutes les pages, en suivant les liens `next`"""
+        ids = []
+        while url:
+            reponse = self.client_api.get(url)
+            self.assertEqual(reponse.status_code, 200)
+            ids += [ligne['id'] for ligne in reponse.data['results']]
+            url = reponse.data['next']
+        return ids
+
+    def test_acces_reserve_aux_administrateurs(self):
+        self.assertIn(APIClient().get('/api/comptes/').status_code, (401, 403))
+
+    def test_filtres(self):
+        reponse = self.client_api.get('/api/comptes/', {'type_compte': 'recette'})
+        self.assertEqual([ligne['compte'] for ligne in reponse.data['results']], ['7111'])
+
+        reponse = self.client_api.get('/api/transactions/', {'du': '2025-03-02', 'au': '2025-03-04'})
+        self.assertEqual(
+            [ligne['date_operation'] for ligne in reponse.data['results']], ['2025-03-02', '2025-03-03', '2025-03-04']
+        )
+        reponse = self.client_api.get('/api/ecritures/', {'compte': '3421', 'exercice': self.exercice.pk})
+        self.assertEqual(len(reponse.data['results']), 5)
+        reponse = self.client_api.get('/api/lots/', {'code_immeuble': 'A', 'code': 'A1'})
+        self.assertEqual([ligne['id'] for ligne in reponse.data['results']], [self.lots[1].pk])
+
+    def test_filtres_invalides(self):
+        for url, parametre, valeur in [
+            ('/api/transactions/', 'exercice', 'abc'),
+            ('/api/transactions/', 'du', '2025-13-01'),
+            ('/api/abonnements/', 'actif', 'peut-etre'),
+        ]:
+            with self.subTest(parametre=parametre):
+                reponse = self.client_api.get(url, {parametre: valeur})
+                self.assertEqual(reponse.status_code, 400)
+                self.assertEqual(list(reponse.data), [parametre])
+
+    def test_champs_demandes(self):
+        reponse = self.client_api.get('/api/comptes/', {'fields': 'compte, libelle'})
+        self.assertEqual(set(reponse.data['results'][0]), {'compte', 'libelle'})
+
+        with CaptureQueriesContext(connection) as completes:
+            self.client_api.get('/api/transactions/')
+        with CaptureQueriesContext(connection) as partielles:
+            reponse = self.client_api.get('/api/transactions/', {'fields': 'id,libelle'})
+        self.assertEqual(set(reponse.data['results'][0]), {'id', 'libelle'})
+        # Sans le détail des écritures, pas de prefetch
+        self.assertEqual(len(partielles), len(completes) - 1)
+
+    def test_pagination_par_curseur(self):
+        tous = list(Transaction.objects.order_by('id').values_list('id', flat=True))
+        ids = self.pages('/api/transactions/?taille=2')
+        self.assertEqual(ids, tous)
+
+        # Reprise incrémentale après le dernier ID reçu, insertions comprises
+        nouvelle = self.poser('3421', '7111', D('10.00'), date_operation=date(2025, 3, 6))
+        self.assertEqual(self.pages(f'/api/transactions/?taille=2&apres={tous[2]}'), tous[3:] + [nouvelle.pk])
+        self.assertEqual(self.pages(f'/api/transactions/?apres={nouvelle.pk}'), [])
+
+
+class SaisieApiTests(ApiTestCase):
+    def saisie(self, montant_credit='10.00', date_operation='2025-06-01'):
+        return {
+            'date_operation': date_operation, 'libelle': 'Virement',
+            'ecritures': [
+                {'compte': '5141', 'type_ecriture': 'DB', 'montant': '10.00', 'lot': self.lots[0].pk},
+                {'compte': '3421', 'type_ecriture': 'CR', 'montant': montant_credit},
+            ],
+        }
+
+    def poster(self, donnees):
+        return self.client_api.post('/api/saisies/', donnees, format='json')
+
+    def test_corps_invalide(self):
+        for donnees in ('abc', 42, [], {'transactions': 'abc'}):
+            with self.subTest(donnees=donnees):
+                reponse = self.poster(donnees)
+                self.assertEqual(reponse.status_code, 400)
+                self.assertEqual(reponse.data, {'detail': "Liste de transactions attendue."})
+
+    def test_rejets_par_index(self):
+        reponse = self.poster({'transactions': [
+            self.saisie(), self.saisie(montant_credit='9.00'), self.saisie(date_operation='2024-06-01'),
+        ]})
+        self.assertEqual(reponse.status_code, 201)
+        self.assertEqual([erreur['index'] for erreur in reponse.data['erreurs']], [1, 2])
+        self.assertEqual(len(reponse.data['crees']), 1)
+
+        reponse = self.poster({'transactions': [self.saisie(), self.saisie(montant_credit='9.00')], 'tout_ou_rien': True})
+        self.assertEqual((reponse.status_code, reponse.data['crees']), (400, []))
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_soldes_mis_a_jour_par_deltas(self):
+        self.poser('5141', '7111', D('100.00'))
+        # Aucun ré-agrégat des écritures de l'exercice
+        with mock.patch('comptabilite.soldes.verifier_soldes') as verifier, \
+                mock.patch('comptabilite.soldes.verifier_soldes_lots') as verifier_lots:
+            reponse = self.poster([self.saisie(), self.saisie()])
+        self.assertEqual(reponse.status_code, 201)
+        self.assertFalse(verifier.called or verifier_lots.called)
+        self.assertEqual(self.solde('5141'), D('120.00'))
+        self.assertEqual(self.solde('3421'), D('-20.00'))
+        self.assertEqual(solde_lot(self.lots[0], ('5141',)), D('20.00'))
+        self.assertSoldesJustes()
+
+
+class ConditionnelApiTests(ApiTestCase):
+    def test_etag_compare_par_etiquette(self):
+        reponse = self.client_api.get('/api/comptes/')
+        etag = reponse['ETag']
+        for entete, statut in [
+            (etag, 304),
+            (f'"autre", {etag}', 304),
+            (etag.removeprefix('W/'), 304),
+            ('*', 304),
+            # L'ETag n'est qu'une sous-chaîne de l'en-tête : ce n'est pas la même étiquette
+            (f'W/{etag}', 200),
+            (f'{etag[:-1]}0"', 200),
+        ]:
+            with self.subTest(entete=entete):
+                reponse = self.client_api.get('/api/comptes/', HTTP_IF_NONE_MATCH=entete)
+                self.assertEqual(reponse.status_code, statut)
+                self.assertEqual(reponse['ETag'], etag)
+
+        Compte.objects.create(compte='7112', libelle='Travaux', type_compte='recette')
+        self.assertEqual(self.client_api.get('/api/comptes/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class EquilibreTransactionTests(ComptabiliteTestCase):
+    """Équilibre contrôlé sur les lignes saisies dans l'admin, et par Transaction.clean hors admin"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(get_user_model().objects.create_superuser('admin@example.com', 'secret'))
+
+    def formulaire(self, lignes, transac=None):
+        donnees = {
+            'date_operation': '2025-03-01', 'libelle': 'Saisie admin', 'exercice': self.exercice.pk,
+            'ecritures-TOTAL_FORMS': len(lignes), 'ecritures-INITIAL_FORMS': 0,
+            'ecritures-MIN_NUM_FORMS': 0, 'ecritures-MAX_NUM_FORMS': 1000,
+        }
+        for numero, (compte, sens, montant) in enumerate(lignes):
+            donnees.update({
+                f'ecritures-{numero}-compte': self.comptes[compte].pk,
+                f'ecritures-{numero}-type_ecriture': sens,
+                f'ecritures-{numero}-montant': montant,
+            })
+        return donnees
+
+    def test_saisie_desequilibree_refusee_sans_ecriture(self):
+        reponse = self.client.post(
+            reverse('admin:comptabilite_transaction_add'),
+            self.formulaire([('3421', 'DB', '100.00'), ('7111', 'CR', '90.00')])
+        )
+        self.assertEqual(reponse.status_code, 200)
+        self.assertContains(reponse, "doivent être équilibrées")
+        self.assertFalse(Transaction.objects.exists())
+        self.assertFalse(SoldeExerciceCompte.objects.exists())
+
+    def test_saisie_equilibree_enregistree(self):
+        reponse = self.client.post(
+            reverse('admin:comptabilite_transaction_add'),
+            self.formulaire([('3421', 'DB', '100.00'), ('7111', 'CR', '60.00'), ('7111', 'CR', '40.00')])
+        )
+        self.assertEqual(reponse.status_code, 302)
+        self.assertEqual(Transaction.objects.get().ecritures.count(), 3)
+        self.assertEqual(self.solde('7111'), D('-100.00'))
+        self.assertSoldesJustes()
+
+    def test_full_clean_controle_les_ecritures_enregistrees(self):
+        transac = self.poser('3421', '7111', D('100.00'))
+        transac.full_clean()
+        EcritureComptable.objects.create(
+            transaction=transac, compte=self.comptes['5141'], type_ecriture='DB', montant=D('5.00')
+        )
+        with self.assertRaisesMessage(ValidationError, "doivent être équilibrées"):
+            transac.full_clean()
+        # Transaction pas encore enregistrée : rien à contrôler en base
+        with self.assertNumQueries(0):
+            Transaction(exercice=self.exercice, date_operation=date(2025, 3, 1), libelle='Nouvelle').clean()
+
+
+class AdminTestCase(ComptabiliteTestCase):
+    """Client connecté en administrateur"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(get_user_model().objects.create_superuser('admin@example.com', 'secret'))
+
+    def liste(self, url, **parametres):
+        reponse = self.client.get(url, parametres)
+        self.assertEqual(reponse.status_code, 200)
+        return reponse
+
+
+class CompteAdminTests(AdminTestCase):
+    """Liste des comptes : soldes de l'exercice actuel joints, en un nombre constant de requêtes"""
+
+    url = reverse_lazy('admin:comptabilite_compte_changelist')
+
+    def soldes(self, **parametres):
+        resultats = self.liste(self.url, **parametres).context_data['cl'].result_list
+        return [(c.compte, c.solde_initial_exercice, c.solde_actuel_exercice) for c in resultats]
+
+    def test_soldes_de_l_exercice_actuel_sans_creation(self):
+        self.poser('3421', '7111', D('100.00'))
+        SoldeExerciceCompte.objects.filter(compte=self.comptes['3421']).update(solde_initial=D('20.00'))
+        nombre = SoldeExerciceCompte.objects.count()
+
+        soldes = {compte: (initial, actuel) for compte, initial, actuel in self.soldes()}
+        self.assertEqual(soldes['3421'], (D('20.00'), D('100.00')))
+        self.assertEqual(soldes['7111'], (D('0.00'), D('-100.00')))
+        # Compte sans solde dans l'exercice : affiché à zéro, aucune ligne créée par un GET
+        self.assertEqual(soldes['6111'], (D('0.00'), D('0.00')))
+        self.assertEqual(SoldeExerciceCompte.objects.count(), nombre)
+
+    def test_tri_et_filtre_sur_le_solde(self):
+        self.poser('3421', '7111', D('100.00'))
+        self.poser('5141', '3421', D('30.00'))
+        # Colonne 4 : solde actuel, décroissant
+        self.assertEqual([compte for compte, _, _ in self.soldes(o='-4')][:3], ['3421', '5141', '119'])
+        self.assertEqual([compte for compte, _, _ in self.soldes(solde='debiteur')], ['3421', '5141'])
+        self.assertEqual([compte for compte, _, _ in self.soldes(solde='crediteur')], ['7111'])
+
+    def test_requetes_independantes_du_nombre_de_comptes(self):
+        self.poser('3421', '7111', D('100.00'))
+        self.liste(self.url)
+        with CaptureQueriesContext(connection) as reference:
+            self.liste(self.url)
+        for numero in range(40):
+            compte = Compte.objects.create(compte=f'51{numero:02}', libelle=f'Banque {numero}', type_compte='actif')
+            self.comptes[compte.compte] = compte
+            self.poser(compte.compte, '7111', D('1.00'))
+        with CaptureQueriesContext(connection) as requetes:
+            self.liste(self.url)
+        self.assertEqual(len(requetes), len(reference))
+
+
+class JournalAdminTests(AdminTestCase):
+    """Journal des écritures : débit / crédit calculés en SQL, pagination par curseur et comptage borné"""
+
+    url = reverse_lazy('admin:comptabilite_ecriturecomptable_changelist')
+
+    def setUp(self):
+        super().setUp()
+        for numero in range(4):
+            self.poser('3421', '7111', D(10 + numero))
+        self.ids = list(EcritureComptable.objects.order_by('-pk').values_list('pk', flat=True))
+
+    def test_pages_par_curseur(self):
+        recues, parametres, pages = [], {}, []
+        with mock.patch.object(admin.site._registry[EcritureComptable], 'list_per_page', 3):
+            while parametres is not None:
+                with CaptureQueriesContext(connection) as requetes:
+                    reponse = self.liste(self.url, **parametres)
+                pages.append(len(requetes))
+                recues += [ecriture.pk for ecriture in reponse.context_data['cl'].result_list]
+                suivante = reponse.context_data.get('page_suivante')
+                parametres = QueryDict(suivante).dict() if suivante else None
+        self.assertEqual(recues, self.ids)
+        self.assertEqual(reponse.context_data['premiere_page'], '')
+        # Même coût pour chaque page, la dernière comprise
+        self.assertEqual(len(set(pages)), 1)
+
+    def test_debit_credit_et_lignes_sans_requete_supplementaire(self):
+        with CaptureQueriesContext(connection) as reference:
+            self.liste(self.url)
+        self.poser('5141', '3421', D('99.00'))
+        with CaptureQueriesContext(connection) as requetes:
+            resultats = self.liste(self.url).context_data['cl'].result_list
+        self.assertEqual(len(requetes), len(reference))
+        modele = admin.site._registry[EcritureComptable]
+        self.assertEqual(
+            [(e.compte.compte, modele.debit(e), modele.credit(e)) for e in resultats[:2]],
+            [('3421', D('0.00'), D('99.00')), ('5141', D('99.00'), D('0.00'))]
+        )
+
+    def test_nombre_estime_au_dela_de_la_limite(self):
+        paginateur = EstimatedCountPaginator(EcritureComptable.objects.all(), 3)
+        self.assertEqual((paginateur.count, paginateur.estime), (8, False))
+        with mock.patch.object(EstimatedCountPaginator, 'limite', 5):
+            paginateur = EstimatedCountPaginator(EcritureComptable.objects.all(), 3)
+            self.assertEqual((paginateur.count, paginateur.estime), (6, True))
+
+
+class GrandLivreTests(AdminTestCase):
+    """Grand livre en flux : soldes progressifs, période et formats d'export"""
+
+    def setUp(self):
+        super().setUp()
+        self.poser('3421', '7111', D('100.00'), lot=self.lots[0], date_operation=date(2025, 1, 10))
+        self.poser('5141', '3421', D('30.00'), date_operation=date(2025, 2, 15))
+        self.poser('3421', '7111', D('45.00'), date_operation=date(2025, 3, 20))
+        SoldeExerciceCompte.objects.filter(exercice=self.exercice, compte=self.comptes['3421']).update(
+            solde_initial=D('20.00'), solde_actuel=F('solde_actuel') + D('20.00')
+        )
+        self.compte_3421 = [self.comptes['3421']]
+
+    def resume(self, lignes):
+        return [(ligne[2], ligne[3], ligne[4], ligne[5], ligne[6], ligne[7]) for ligne in lignes]
+
+    def test_soldes_progressifs(self):
+        lignes = list(lignes_grand_livre(self.exercice, self.compte_3421, chunk_size=1))
+        self.assertEqual(self.resume(lignes), [
+            (date(2025, 1, 1), "Solde d'ouverture", '', None, None, D('20.00')),
+            (date(2025, 1, 10), 'TEST', 'A0', D('100.00'), None, D('120.00')),
+            (date(2025, 2, 15), 'TEST', '', None, D('30.00'), D('90.00')),
+            (date(2025, 3, 20), 'TEST', '', D('45.00'), None, D('135.00')),
+            (date(2025, 12, 31), 'Total 3421', '', D('145.00'), D('30.00'), D('135.00')),
+        ])
+        # Un compte par bloc, dans l'ordre des numéros ; le solde final de chaque bloc est son solde actuel
+        totaux = {ligne[0]: ligne[7] for ligne in lignes_grand_livre(self.exercice) if ligne[3].startswith('Total')}
+        self.assertEqual(list(totaux), ['3421', '5141', '7111'])
+        self.assertEqual(totaux, {numero: self.solde(numero) for numero in totaux})
+
+    def test_periode(self):
+        lignes = lignes_grand_livre(self.exercice, self.compte_3421, date(2025, 2, 1), date(2025, 2, 28))
+        self.assertEqual(self.resume(lignes), [
+            (date(2025, 2, 1), "Solde d'ouverture", '', None, None, D('120.00')),
+            (date(2025, 2, 15), 'TEST', '', None, D('30.00'), D('90.00')),
+            (date(2025, 2, 28), 'Total 3421', '', D('0.00'), D('30.00'), D('90.00')),
+        ])
+
+    def test_exports_csv_et_xlsx(self):
+        reponse = self.client.get(
+            reverse('admin:comptabilite_ecriturecomptable_grand_livre'), {'compte': '3421', 'du': '2025-02-01'}
+        )
+        self.assertTrue(reponse.streaming)
+        lignes = b''.join(reponse.streaming_content).decode().splitlines()
+        self.assertEqual(lignes[0], ';'.join(ENTETE))
+        self.assertEqual(lignes[-1], '3421;COPROPRIÉTAIRES;2025-12-31;Total 3421;;45.00;30.00;135.00')
+
+        with tempfile.TemporaryDirectory() as dossier:
+            sortie = os.path.join(dossier, 'grand_livre.xlsx')
+            call_command(
+                'grand_livre', '--compte', '3421', '--format', 'xlsx', '--sortie', sortie, '--chunk-size', '1',
+                stdout=io.StringIO()
+            )
+            from openpyxl import load_workbook
+            feuille = load_workbook(sortie, read_only=True).active
+            lignes = [ligne for ligne in feuille.iter_rows(values_only=True)]
+        self.assertEqual(len(lignes), 6)
+        self.assertEqual(lignes[-1][3:], ('Total 3421', None, 145, 30, 135))
+
+        sortie = io.StringIO()
+        call_command('grand_livre', '--compte', '999', stderr=sortie)
+        self.assertIn("Compte(s) introuvable(s) : 999", sortie.getvalue())
+
+
+class ModificationsTests(ApiTestCase):
+    """Journal des modifications : ordre, filtres, retenue des plus récentes et atomicité"""
+
+    def test_ordre_et_filtres(self):
+        transac = self.poser('3421', '7111', D('100.00'))
+        modifications = list(modifications_depuis())
+        self.assertEqual([m.pk for m in modifications], sorted(m.pk for m in modifications))
+        self.assertEqual(
+            [(m.modele, m.operation) for m in modifications if m.modele != 'solde'],
+            [('transaction', 'creation'), ('ecriture', 'creation'), ('ecriture', 'creation')]
+        )
+        curseur = modifications[-1].pk
+
+        debit = transac.ecritures.get(type_ecriture='DB')
+        debit.montant = D('80.00')
+        debit.save()
+        suivantes = list(modifications_depuis(curseur, ['ecriture']))
+        self.assertEqual([(m.objet_id, m.operation) for m in suivantes], [(debit.pk, 'modification')])
+        self.assertEqual(suivantes[0].donnees['montant'], '80.00')
+        # Seul le solde du compte débité change ; son dernier état journalisé est le solde final
+        soldes = list(modifications_depuis(curseur, ['solde']))
+        self.assertEqual({m.donnees['compte_id'] for m in soldes}, {self.comptes['3421'].pk})
+        self.assertEqual(soldes[-1].donnees['solde_actuel'], '80.00')
+
+    def test_api_par_pages(self):
+        self.poser('3421', '7111', D('100.00'))
+        self.poser('5141', '3421', D('40.00'))
+        attendues = list(modifications_depuis(0, ['ecriture']).values_list('pk', flat=True))
+
+        recues, curseur, suite = [], 0, True
+        while suite:
+            reponse = self.client_api.get('/api/modifications/', {'since': curseur, 'modele': 'ecriture', 'taille': 3})
+            self.assertEqual(reponse.status_code, 200)
+            recues += [m['id'] for m in reponse.data['modifications']]
+            curseur, suite = reponse.data['curseur'], reponse.data['suite']
+        self.assertEqual(recues, attendues)
+        self.assertEqual(self.client_api.get('/api/modifications/', {'since': 'x'}).status_code, 400)
+        self.assertEqual(self.client_api.get('/api/modifications/', {'modele': 'lot'}).status_code, 400)
+
+    @override_settings(COMPTABILITE_DELAI_MODIFICATIONS=60)
+    def test_modifications_recentes_retenues(self):
+        self.poser('3421', '7111', D('100.00'))
+        self.assertFalse(modifications_depuis().exists())
+        # Passé le délai, une transaction validée en retard ne peut plus avoir d'ID inférieur
+        Modification.objects.update(date=timezone.now() - timedelta(seconds=61))
+        self.assertEqual(modifications_depuis().count(), Modification.objects.count())
+
+    def test_ecriture_refusee_sans_trace(self):
+        transac = self.poser('3421', '7111', D('100.00'))
+        ExerciceComptable.objects.filter(pk=self.exercice.pk).update(est_ouvert=False)
+        transac = Transaction.objects.get(pk=transac.pk)
+        nombre = Modification.objects.count()
+        with self.assertRaises(ValidationError):
+            EcritureComptable.objects.create(
+                transaction=transac, compte=self.comptes['5141'], type_ecriture='DB', montant=D('5.00')
+            )
+        # Écriture et journal annulés ensemble
+        self.assertEqual(transac.ecritures.count(), 2)
+        self.assertEqual(Modification.objects.count(), nombre)
+
+
+class ImporterTests(ComptabiliteTestCase):
+    """Import par tranches (commande importer) : une tranche en erreur est annulée seule"""
+
+    def importer(self, lignes, *arguments):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8') as fichier:
+            fichier.write('\n'.join(','.join(map(str, ligne)) for ligne in lignes))
+        self.addCleanup(os.remove, fichier.name)
+        sortie, erreurs = io.StringIO(), io.StringIO()
+        call_command('importer', 'lots', fichier.name, *arguments, stdout=sortie, stderr=erreurs)
+        return sortie.getvalue(), erreurs.getvalue()
+
+    def test_tranche_en_erreur_annulee_seule(self):
+        immeuble = self.lots[0].immeuble_id
+        sortie, erreurs = self.importer(
+            [('code', 'immeuble'), ('B1', immeuble), ('B2', immeuble), ('B3', 999), ('B4', immeuble), ('A0', immeuble)],
+            '--taille', '2'
+        )
+        # B3 est en erreur, B4 annulée avec sa tranche ; A0 existait déjà
+        self.assertEqual(
+            set(Lot.objects.filter(code__startswith='B').values_list('code', flat=True)), {'B1', 'B2'}
+        )
+        self.assertIn("Ligne 4 : immeuble '999' introuvable", erreurs)
+        bilan = "2 créées, 0 modifiées, 1 inchangées, 1 en erreur, 1 annulées avec leur tranche"
+        self.assertTrue(sortie.splitlines()[-2].endswith(bilan))
+        self.assertTrue(sortie.splitlines()[-1].endswith(bilan))
+
+    def test_simulation(self):
+        sortie, _ = self.importer([('code', 'immeuble'), ('B1', self.lots[0].immeuble_id)], '--dry-run')
+        self.assertIn("(simulation)", sortie)
+        self.assertFalse(Lot.objects.filter(code='B1').exists())
@@ -57,6 +57,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'comptabilite.profilage.ProfilageMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -91,6 +92,24 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Le cache des rapports doit être partagé par tous les processus (fichiers
+# sur un seul serveur ; Redis ou Memcached au-delà)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'rapports': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'rapports',
+        'TIMEOUT': 24 * 3600,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -133,6 +152,22 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Profilage des opérations comptables (requêtes SQL, durées) : voir comptabilite/profilage.py
+COMPTABILITE_PROFILAGE = False
+
+# Journal des modifications pour les consommateurs aval : voir comptabilite/modifications.py
+COMPTABILITE_JOURNAL_MODIFICATIONS = True
+
+# Âge minimal (secondes) d'une modification avant sa diffusion : au-delà de la plus longue
+# transaction d'écriture, pour ne pas en sauter une validée en retard (0 avec SQLite)
+COMPTABILITE_DELAI_MODIFICATIONS = 0
+
+# Durée de vie (secondes) du cache du référentiel, pour les autres processus : voir comptabilite/referentiel.py
+COMPTABILITE_REFERENTIEL_DUREE = 300
+
+# Alias (dans CACHES) du cache des rapports calculés, None pour le désactiver : voir comptabilite/cache_rapports.py
+COMPTABILITE_CACHE_RAPPORTS = 'rapports'
+
 REST_FRAMEWORK = {
 	'DEFAULT_AUTHENTICATION_CLASSES': (
 		'rest_framework.authentication.TokenAuthentication',
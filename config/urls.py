@@ -15,8 +15,24 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path
+from django.urls import include, path
+from rest_framework.routers import DefaultRouter
+
+from comptabilite import api as comptabilite_api
+from patrimoine import api as patrimoine_api
+
+# API REST en lecture seule
+router = DefaultRouter()
+router.register('comptes', comptabilite_api.CompteViewSet)
+router.register('transactions', comptabilite_api.TransactionViewSet)
+router.register('ecritures', comptabilite_api.EcritureComptableViewSet)
+router.register('soldes', comptabilite_api.SoldeExerciceCompteViewSet)
+router.register('abonnements', comptabilite_api.AbonnementViewSet)
+router.register('lots', patrimoine_api.LotViewSet)
 
 urlpatterns = [
+    path('api/modifications/', comptabilite_api.ModificationsView.as_view(), name='modifications'),
+    path('api/saisies/', comptabilite_api.SaisieTransactionsView.as_view(), name='saisie-transactions'),
+    path('api/', include(router.urls)),
     path('', admin.site.urls),
 ]
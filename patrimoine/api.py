@@ -0,0 +1,10 @@
+# patrimoine/api.py
+from comptabilite.api import LectureSeuleViewSet
+from .models import Lot
+from .serializers import LotSerializer
+
+
+class LotViewSet(LectureSeuleViewSet):
+    queryset = Lot.objects.select_related('immeuble')
+    serializer_class = LotSerializer
+    filtres = {'immeuble': 'immeuble_id', 'code_immeuble': 'immeuble__code', 'code': 'code'}
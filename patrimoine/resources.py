@@ -1,13 +1,15 @@
 # accounts/resources.py
-from import_export import resources, fields
+from import_export import fields
+from comptabilite.import_massif import ImportParTranchesResource
 from .models import Lot
 
-class LotResource(resources.ModelResource):
+class LotResource(ImportParTranchesResource):
     lot_individuel = fields.Field(attribute='code', column_name='code')
 
     class Meta:
         model = Lot
         fields = ('code', 'immeuble')
-        import_id_fields = ['code']
+        # Le code d'un lot n'est unique qu'au sein de son immeuble
+        import_id_fields = ['immeuble', 'code']
         skip_unchanged = True
         report_skipped = True
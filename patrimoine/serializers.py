@@ -0,0 +1,12 @@
+# patrimoine/serializers.py
+from rest_framework import serializers
+from comptabilite.serializers import ChampsDynamiquesMixin
+from .models import Lot
+
+
+class LotSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
+    code_immeuble = serializers.CharField(source='immeuble.code', read_only=True)
+
+    class Meta:
+        model = Lot
+        fields = ('id', 'code', 'libelle', 'immeuble', 'code_immeuble', 'proprietaire', 'num_TF')